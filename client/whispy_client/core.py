@@ -18,6 +18,7 @@ Usage:
 from __future__ import annotations
 
 import atexit
+import hashlib
 import importlib
 import io
 import json
@@ -30,6 +31,7 @@ import urllib.error
 import urllib.request
 import zipfile
 import warnings
+from concurrent.futures import ThreadPoolExecutor
 from typing import Optional
 
 __version__ = "1.1.0"
@@ -45,11 +47,22 @@ _config = {
     "host": _DEFAULT_HOST,
     "deps": False,
     "verbose": False,
+    "layered": False,
+    "cache_dir": _os.environ.get("WHISPY_CLIENT_CACHE") or _os.path.join(_os.path.expanduser("~"), ".cache", "whispy"),
 }
 
+# Wheels downloaded at the same time in layered mode.
+_LAYERED_WORKERS = 8
+
 # Tracks live TemporaryDirectory objects so they stay alive until explicit cleanup.
 _live_tmpdirs: list[tempfile.TemporaryDirectory] = []
 
+# sha256 of every wheel already extracted into a live tempdir -> that tempdir's path.
+# Sent as ?have= so the server can leave those wheels out of later bundles.
+_held_digests: dict[str, str] = {}
+# Most digests sent in one ?have= (the server's default WHISPY_DELTA_MAX_HAVE); the newest win.
+_MAX_HAVE = 256
+
 
 class WhispyError(RuntimeError):
     pass
@@ -61,6 +74,7 @@ def whispy_cleanup() -> None:
         tmpdir = _live_tmpdirs.pop()
         _remove_sys_path_entries_under(tmpdir.name)
         tmpdir.cleanup()
+    _held_digests.clear()
 
 
 atexit.register(whispy_cleanup)
@@ -75,14 +89,20 @@ def configure(
     host: Optional[str] = None,
     deps: Optional[bool] = None,
     verbose: Optional[bool] = None,
+    layered: Optional[bool] = None,
+    cache_dir: Optional[str] = None,
 ) -> None:
     """
     Configure Whispy globally.
 
     Args:
-        host:    CDN base URL, e.g. "http://localhost:5000" for local dev.
-        deps:    If True, automatically fetch dependencies alongside packages.
-        verbose: If True, print progress messages.
+        host:      CDN base URL, e.g. "http://localhost:5000" for local dev.
+        deps:      If True, automatically fetch dependencies alongside packages.
+        verbose:   If True, print progress messages.
+        layered:   If True, fetch a resolved plan and download each wheel separately
+                   (in parallel, cached on disk by sha256) instead of one bundle.
+        cache_dir: Where layered mode caches wheels. Defaults to WHISPY_CLIENT_CACHE
+                   or ~/.cache/whispy.
     """
     if host is not None:
         _config["host"] = host.rstrip("/")
@@ -90,6 +110,10 @@ def configure(
         _config["deps"] = deps
     if verbose is not None:
         _config["verbose"] = verbose
+    if layered is not None:
+        _config["layered"] = layered
+    if cache_dir is not None:
+        _config["cache_dir"] = cache_dir
 
 
 def remote(
@@ -99,6 +123,7 @@ def remote(
     version: Optional[str] = None,
     deps: Optional[bool] = None,
     host: Optional[str] = None,
+    layered: Optional[bool] = None,
 ) -> object:
     """
     Import a package from the Whispy CDN at runtime.
@@ -110,6 +135,8 @@ def remote(
         version: Version string, e.g. "2.31.0" or "1.26.4"
         deps:    Fetch dependencies too. Overrides global configure() setting.
         host:    CDN host override for this call only.
+        layered: Download wheels individually from a resolved plan. Overrides
+                 the global configure() setting.
 
     Returns:
         The imported module object.
@@ -123,6 +150,7 @@ def remote(
     resolved_module = module or pkg_name
     resolved_host = (host or _config["host"]).rstrip("/")
     resolved_deps = _config["deps"] if deps is None else deps
+    resolved_layered = _config["layered"] if layered is None else layered
     verbose = _config["verbose"]
 
     if resolved_version is None:
@@ -154,11 +182,19 @@ def remote(
     }
     if resolved_version:
         params["version"] = resolved_version
-
-    url = f"{resolved_host}/get_package?" + urllib.parse.urlencode(params)
+    if resolved_deps and _held_digests and not resolved_layered:
+        # Dependencies already extracted (and still on sys.path) are left out by the server.
+        params["have"] = ",".join(sorted(digest[:16] for digest in list(_held_digests)[-_MAX_HAVE:]))
 
     try:
-        data = _fetch_bytes(url, verbose=verbose)
+        if resolved_layered:
+            archives, digests = _fetch_layered(resolved_host, params, verbose)
+        else:
+            url = f"{resolved_host}/get_package?" + urllib.parse.urlencode(params)
+            data, headers = _fetch_bytes(url, verbose=verbose)
+            archives, digests = [io.BytesIO(data)], _bundle_digests(headers)
+    except WhispyError:
+        raise
     except urllib.error.HTTPError as e:
         body = e.read().decode(errors="replace")
         try:
@@ -201,14 +237,18 @@ def remote(
     _live_tmpdirs.append(tmpdir)
 
     try:
-        with zipfile.ZipFile(io.BytesIO(data)) as zf:
-            zf.extractall(tmpdir.name)
+        for archive in archives:
+            with zipfile.ZipFile(archive) as zf:
+                zf.extractall(tmpdir.name)
     except zipfile.BadZipFile as e:
         _cleanup_tmpdir(tmpdir)
         raise WhispyError(
             f"Whispy server returned a malformed archive for '{pkg_name}' from {resolved_host}."
         ) from e
 
+    for digest in digests:
+        _held_digests[digest] = tmpdir.name
+
     if tmpdir.name not in sys.path:
         _insert_sys_path_safely(tmpdir.name)
 
@@ -336,6 +376,9 @@ def _cleanup_tmpdir(tmpdir: tempfile.TemporaryDirectory) -> None:
     _remove_sys_path_entries_under(tmpdir.name)
     if tmpdir in _live_tmpdirs:
         _live_tmpdirs.remove(tmpdir)
+    for digest, path in list(_held_digests.items()):
+        if path == tmpdir.name:
+            del _held_digests[digest]
     tmpdir.cleanup()
 
 
@@ -374,7 +417,8 @@ def _insert_sys_path_safely(path: str) -> None:
     sys.path.insert(insert_at, path)
 
 
-def _fetch_bytes(url: str, verbose: bool = False) -> bytes:
+def _fetch_bytes(url: str, verbose: bool = False):
+    """GET url and return (body, response headers)."""
     if verbose:
         print(f"  → GET {url}")
     req = urllib.request.Request(
@@ -382,7 +426,71 @@ def _fetch_bytes(url: str, verbose: bool = False) -> bytes:
         headers={"User-Agent": f"whispy-client/{__version__} Python/{sys.version.split()[0]}"},
     )
     with urllib.request.urlopen(req, timeout=120) as resp:
-        return resp.read()
+        return resp.read(), resp.headers
+
+
+def _bundle_digests(headers) -> list[str]:
+    """Digests of the distributions a bundle response actually contains (the manifest minus X-Whispy-Delta)."""
+    try:
+        manifest = json.loads(headers.get("X-Whispy-Manifest") or "[]")
+        omitted = set(json.loads(headers.get("X-Whispy-Delta") or "[]"))
+    except ValueError:
+        return []
+    return [entry["sha256"] for entry in manifest if entry.get("sha256") and entry.get("name") not in omitted]
+
+
+def _fetch_layered(host: str, params: dict, verbose: bool = False):
+    """
+    Fetch the resolved plan for params from /plan, then download every item not
+    already extracted in this process, several at a time. Returns (archives, digests):
+    zip paths or file objects to extract, and the digests they cover.
+    """
+    body, _ = _fetch_bytes(f"{host}/plan?" + urllib.parse.urlencode(params), verbose=verbose)
+    items = [item for item in json.loads(body)["items"] if item.get("sha256") not in _held_digests]
+    if not items:
+        return [], []
+    with ThreadPoolExecutor(max_workers=min(_LAYERED_WORKERS, len(items))) as pool:
+        archives = list(pool.map(lambda item: _fetch_plan_item(host, item, verbose), items))
+    return archives, [item["sha256"] for item in items if item.get("sha256")]
+
+
+def _fetch_plan_item(host: str, item: dict, verbose: bool = False):
+    """Return one plan item as a zip path or file object, using the on-disk wheel cache when possible."""
+    url = host + item["url"]
+    sha = item.get("sha256")
+    if item.get("format") != "wheel" or not sha:
+        return io.BytesIO(_fetch_bytes(url, verbose=verbose)[0])
+
+    cached = _os.path.join(_config["cache_dir"], "blobs", sha[:2], f"{sha}.whl")
+    if _os.path.exists(cached) and _sha256_file(cached) == sha:
+        if verbose:
+            print(f"  ✓ cached {item['filename']}")
+        return cached
+
+    data, _ = _fetch_bytes(url, verbose=verbose)
+    if hashlib.sha256(data).hexdigest() != sha:
+        raise WhispyError(f"Checksum mismatch for {item['filename']} from {host}.")
+    part = None
+    try:
+        _os.makedirs(_os.path.dirname(cached), exist_ok=True)
+        fd, part = tempfile.mkstemp(dir=_os.path.dirname(cached), suffix=".part")
+        with _os.fdopen(fd, "wb") as out:
+            out.write(data)
+        _os.replace(part, cached)
+    except OSError:
+        # A read-only or full cache directory only costs the reuse, not the import.
+        if part and _os.path.exists(part):
+            _os.unlink(part)
+        return io.BytesIO(data)
+    return cached
+
+
+def _sha256_file(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
 
 
 def _compute_tags() -> list[str]:
@@ -9,26 +9,48 @@ The Python equivalent of unpkg.com / jsDelivr.
 # - No dependency conflict resolution or lockfile-style reproducibility.
 # - No end-to-end package signature verification beyond PyPI SHA256 digests.
 
+import base64
+import bisect
+import email.parser
 import hashlib
+import http.client
 import json
 import logging
 import os
+import queue
 import re
 import shutil
+import sqlite3
 import stat
+import struct
 import tempfile
 import time
+import uuid
 import urllib.parse
 import urllib.request
 import zipfile
 import threading
-from io import BytesIO
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from functools import lru_cache
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed
 from pathlib import Path
-from typing import Optional
+from typing import BinaryIO, Optional, Union
 
-from flask import Flask, jsonify, request, send_file, g
+try:
+    import fcntl
+except ImportError:  # Windows: builds are only coordinated within one process.
+    fcntl = None
+
+from flask import Flask, Response, jsonify, request, send_file, g
 from flask_limiter import Limiter
-from flask_limiter.util import get_remote_address
+from flask_limiter.util import get_qualified_name, get_remote_address
+from werkzeug.exceptions import RequestedRangeNotSatisfiable
+
+try:
+    from packaging.version import InvalidVersion, Version
+except ImportError:  # pip vendors the same module
+    from pip._vendor.packaging.version import InvalidVersion, Version
 
 # ---------------------------------------------------------------------------
 # Logging
@@ -42,12 +64,112 @@ log = logging.getLogger("whispy")
 # ---------------------------------------------------------------------------
 # Config
 # ---------------------------------------------------------------------------
-CACHE_DIR = Path(os.environ.get("WHISPY_CACHE_DIR", "./cache"))
-CACHE_DIR.mkdir(parents=True, exist_ok=True)
+# Absolute, so send_file does not resolve it against the app's root_path instead of the CWD.
+CACHE_DIR = Path(os.environ.get("WHISPY_CACHE_DIR", "./cache")).resolve()
 
 MAX_CACHE_BYTES = int(os.environ.get("WHISPY_MAX_CACHE_MB", "2048")) * 1024 * 1024
-PYPI_BASE = "https://pypi.org/pypi"
-PYPI_SIMPLE = "https://pypi.org/simple"
+# Upstream index. Point these at an internal mirror (or a local stand-in) to keep builds off pypi.org.
+PYPI_BASE = os.environ.get("WHISPY_PYPI_BASE", "https://pypi.org/pypi").rstrip("/")
+PYPI_SIMPLE = os.environ.get("WHISPY_PYPI_SIMPLE", "https://pypi.org/simple").rstrip("/")
+# How unpinned metadata is looked up. "simple" reads the version list from the PEP 691 JSON
+# simple index and then fetches only the latest release's JSON; "json" downloads the full
+# project JSON (every release). Either way only the fields Whispy uses are cached.
+METADATA_BACKENDS = ("simple", "json")
+METADATA_BACKEND = os.environ.get("WHISPY_METADATA_BACKEND", "simple").lower()
+# When set, file URLs on files.pythonhosted.org are fetched from this base instead (same paths).
+PYPI_FILES_ORIGIN = "https://files.pythonhosted.org"
+FILES_BASE = os.environ.get("WHISPY_FILES_BASE", "").rstrip("/")
+
+# Pooled keep-alive connections to the upstream hosts, with retries and exponential backoff
+# on connection errors, timeouts and 429 / 5xx responses.
+UPSTREAM_CONNECTIONS_PER_HOST = int(os.environ.get("WHISPY_UPSTREAM_CONNECTIONS_PER_HOST", "16"))
+UPSTREAM_CONNECT_TIMEOUT = float(os.environ.get("WHISPY_UPSTREAM_CONNECT_TIMEOUT", "10"))
+UPSTREAM_READ_TIMEOUT = float(os.environ.get("WHISPY_UPSTREAM_READ_TIMEOUT", "60"))
+UPSTREAM_RETRIES = int(os.environ.get("WHISPY_UPSTREAM_RETRIES", "3"))
+UPSTREAM_BACKOFF = float(os.environ.get("WHISPY_UPSTREAM_BACKOFF", "0.5"))
+
+# Tiered mode: ask this parent Whispy node for wheels and sdists before going to PyPI. Each
+# file is checked against the sha256 PyPI publishes; bundles are always built locally.
+PARENT_URL = os.environ.get("WHISPY_PARENT_URL", "").rstrip("/")
+PARENT_SECRET = os.environ.get("WHISPY_PARENT_SECRET", "")
+# On a parent: the secret child nodes present (their WHISPY_PARENT_SECRET). A cold child asks
+# for one blob per dependency, so its /blob requests are exempt from the per-client limits.
+NODE_SECRET = os.environ.get("WHISPY_NODE_SECRET", "")
+
+# PyPI JSON metadata cache: fresh for *_TTL seconds, then served stale for up to
+# WHISPY_METADATA_STALE_TTL more seconds while it is revalidated in the background.
+METADATA_DIR = CACHE_DIR / "metadata"
+METADATA_TTL = int(os.environ.get("WHISPY_METADATA_TTL", "300"))
+METADATA_PINNED_TTL = int(os.environ.get("WHISPY_METADATA_PINNED_TTL", "86400"))
+METADATA_STALE_TTL = int(os.environ.get("WHISPY_METADATA_STALE_TTL", "3600"))
+METADATA_MEMORY_ENTRIES = int(os.environ.get("WHISPY_METADATA_MEMORY_ENTRIES", "256"))
+
+# Upper bound on concurrent metadata fetches while resolving one BFS level of the dependency graph.
+RESOLVE_WORKERS = int(os.environ.get("WHISPY_RESOLVE_WORKERS", "16"))
+
+# Resolved dependency graphs, keyed by their pinned roots and reused by every tag set / compression
+# variant of a deps bundle for WHISPY_GRAPH_TTL seconds (0 disables the cache).
+GRAPH_DIR = CACHE_DIR / "graphs"
+GRAPH_TTL = int(os.environ.get("WHISPY_GRAPH_TTL", "900"))
+
+# Upper bound on concurrent dependency downloads within a single bundle build.
+DOWNLOAD_WORKERS = int(os.environ.get("WHISPY_DOWNLOAD_WORKERS", "8"))
+
+# Cross-process build coordination (gunicorn workers): one lock file per cache key / blob, present
+# only while the lock is held or awaited.
+LOCK_DIR = CACHE_DIR / "locks"
+BUILD_LOCK_TIMEOUT = float(os.environ.get("WHISPY_BUILD_LOCK_TIMEOUT", "600"))
+
+# Stream cold builds to the client as each dependency lands (also per request via ?stream=1).
+STREAM_BUILDS = os.environ.get("WHISPY_STREAM_BUILDS", "0") in ("1", "true", "yes")
+
+# Bundle compression: "auto" copies wheel members as the wheel compressed them (usually deflated)
+# and, for files of sdist-built packages, stores binaries and archives and deflates the rest at a
+# per-type level; "stored" writes every member uncompressed (fast extraction on a LAN).
+# Clients pick per request with ?compression=; each variant is cached under its own key.
+BUNDLE_COMPRESSIONS = ("auto", "stored")
+BUNDLE_COMPRESSION = os.environ.get("WHISPY_BUNDLE_COMPRESSION", "auto").lower()
+if BUNDLE_COMPRESSION not in BUNDLE_COMPRESSIONS:
+    log.warning("Unknown WHISPY_BUNDLE_COMPRESSION %r, using 'auto'", BUNDLE_COMPRESSION)
+    BUNDLE_COMPRESSION = "auto"
+if METADATA_BACKEND not in METADATA_BACKENDS:
+    log.warning("Unknown WHISPY_METADATA_BACKEND %r, using 'simple'", METADATA_BACKEND)
+    METADATA_BACKEND = "simple"
+
+# Verified wheels and sdists, stored once by their PyPI sha256 and reused by every bundle build.
+# Bundles still hold their own copy of each member, so a cached wheel takes space in both places.
+BLOB_DIR = CACHE_DIR / "blobs"
+
+# Cached bundles are re-hashed on serve only when their (inode, size, mtime) changes,
+# or when the last successful check is older than this many seconds (0 = every serve).
+SCRUB_INTERVAL = int(os.environ.get("WHISPY_SCRUB_INTERVAL", "3600"))
+
+# SQLite catalog of cached bundles and blobs (size, last access, hits) plus the pinned-version
+# index. It is reconciled with the files on disk at startup; eviction is "lru" or "lfu".
+CATALOG_PATH = CACHE_DIR / "catalog.sqlite3"
+EVICTION_POLICY = os.environ.get("WHISPY_EVICTION_POLICY", "lru").lower()
+
+# Shortest sha256 prefix accepted in ?have= (delta bundles); 16 hex chars = 64 bits.
+DELTA_MIN_DIGEST = 16
+# Most digests one ?have= may list, and most delta variants cached per full bundle. Once a
+# bundle has that many, other deltas of it are served as the full bundle until some are evicted.
+DELTA_MAX_HAVE = int(os.environ.get("WHISPY_DELTA_MAX_HAVE", "256"))
+DELTA_MAX_VARIANTS = int(os.environ.get("WHISPY_DELTA_MAX_VARIANTS", "8"))
+
+# Local wheelhouse (`python app.py ingest <dir>`): ingested wheels are indexed in the catalog and
+# stored as blobs. Their metadata is used when PyPI is unreachable or does not know the package,
+# and exclusively with WHISPY_OFFLINE=1 (air-gapped / CI: no upstream requests at all).
+OFFLINE = os.environ.get("WHISPY_OFFLINE", "0") in ("1", "true", "yes")
+INGEST_WORKERS = int(os.environ.get("WHISPY_INGEST_WORKERS", str(min(32, (os.cpu_count() or 1) + 4))))
+
+# Most packages a single GET /get_batch may ask for.
+BATCH_MAX_PACKAGES = 50
+
+# Background prefetch (POST /prefetch): build threads per worker process and the bound on queued
+# items. Job status lives in the catalog so any worker can report it; jobs expire after a week.
+PREFETCH_WORKERS = int(os.environ.get("WHISPY_PREFETCH_WORKERS", "2"))
+PREFETCH_QUEUE_SIZE = int(os.environ.get("WHISPY_PREFETCH_QUEUE_SIZE", "1000"))
+PREFETCH_JOB_RETENTION = 7 * 86400
 
 # Packages known to be typosquatted / malicious (extend this list)
 BLOCKLIST: set[str] = {
@@ -59,9 +181,35 @@ BLOCKLIST: set[str] = {
 PACKAGE_NAME_RE = re.compile(r"^[A-Za-z0-9]+(?:[A-Za-z0-9._-]*[A-Za-z0-9])?$")
 VERSION_RE = re.compile(r"^[A-Za-z0-9][A-Za-z0-9._!+:-]*$")
 
-# Coarse per-package locks prevent duplicate concurrent downloads and cache-path races.
-_download_locks: dict[str, threading.Lock] = {}
-_download_locks_guard = threading.Lock()
+# In-memory LRU in front of the on-disk metadata cache, plus the set of entries being refreshed.
+_metadata_memory: OrderedDict[str, dict] = OrderedDict()
+_metadata_refreshing: set[str] = set()
+_metadata_guard = threading.Lock()
+
+# In-flight upstream work shared between concurrent callers (see _single_flight).
+_inflight: dict[str, Future] = {}
+_inflight_guard = threading.Lock()
+
+# Running totals for dependency resolution, reported by /stats.
+_resolver_stats = {"resolutions": 0, "last_ms": 0.0, "total_ms": 0.0, "graph_cache_hits": 0}
+_resolver_stats_guard = threading.Lock()
+
+# Catalog connections are per thread; sqlite3 connections must not be shared across threads.
+_catalog_local = threading.local()
+# Set once init_cache() has created the cache directories and catalog in this process.
+_cache_ready = False
+_init_guard = threading.Lock()
+
+# Prefetch items waiting for a build thread: (job id, item index, item).
+_prefetch_queue: "queue.Queue[tuple[str, int, dict]]" = queue.Queue(maxsize=PREFETCH_QUEUE_SIZE)
+_prefetch_threads: list[threading.Thread] = []
+_prefetch_guard = threading.Lock()
+# (pid, id) of this process's prefetch queue; see _prefetch_worker_id.
+_prefetch_owner: Optional[tuple[int, str]] = None
+
+# cache key or "blob:<sha256>" -> (file signature, sha256, verified_at) for files checked recently.
+_verified_files: dict[str, tuple[tuple[int, int, int], str, float]] = {}
+_verified_guard = threading.Lock()
 
 # ---------------------------------------------------------------------------
 # Flask app + rate limiter
@@ -76,6 +224,100 @@ limiter = Limiter(
     storage_uri=os.environ.get("REDIS_URL", "memory://"),
 )
 
+
+def _over_rate_limit() -> bool:
+    """
+    Whether the request in context is already over one of its route's rate limits.
+    The limits are only tested, not hit: the ASGI front end asks before doing upstream
+    work on a request's behalf, and Flask still counts the request when it handles it.
+    """
+    endpoint = request.endpoint
+    view = app.view_functions.get(endpoint or "")
+    if view is None:
+        return False
+    try:
+        defaults, decorated = limiter.limit_manager.resolve_limits(
+            app, endpoint, request.blueprint, get_qualified_name(view)
+        )
+        for lim in [*defaults, *decorated]:
+            if lim.is_exempt or lim.method_exempt:
+                continue
+            if not limiter.limiter.test(lim.limit, lim.key_func(), lim.scope_for(endpoint, request.method)):
+                return True
+    except Exception as e:
+        # Same stance as the limiter itself when its storage is down: let the request through.
+        log.warning("Rate limit check failed: %s", e)
+    return False
+
+# ---------------------------------------------------------------------------
+# Metrics (Prometheus text format, per worker process)
+# ---------------------------------------------------------------------------
+STAGE_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+BUNDLE_STAGES = ("metadata", "resolve", "download", "verify", "extract", "zip", "cache_write")
+
+
+class _Histogram:
+    def __init__(self, buckets: tuple[float, ...] = STAGE_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+        self.count += 1
+        self.sum += value
+
+
+_metrics_guard = threading.Lock()
+_counters = {
+    "cache_hits": 0,
+    "cache_misses": 0,
+    "bytes_served": 0,
+    "upstream_requests": 0,
+    "upstream_retries": 0,
+    "parent_hits": 0,
+    "parent_misses": 0,
+}
+_stage_histograms = {stage: _Histogram() for stage in BUNDLE_STAGES}
+_request_histograms: dict[str, _Histogram] = {}
+
+
+def _count(name: str, amount: int = 1) -> None:
+    with _metrics_guard:
+        _counters[name] += amount
+
+
+@contextmanager
+def _timed(stage: str):
+    """Record the duration of one fetch_package_zip stage in its histogram."""
+    started = time.monotonic()
+    try:
+        yield
+    finally:
+        elapsed = time.monotonic() - started
+        with _metrics_guard:
+            _stage_histograms[stage].observe(elapsed)
+
+
+def _render_histogram(lines: list[str], name: str, label: str, value: str, hist: _Histogram) -> None:
+    for bound, count in zip(hist.buckets, hist.counts):
+        lines.append(f'{name}_bucket{{{label}="{value}",le="{bound}"}} {count}')
+    lines.append(f'{name}_bucket{{{label}="{value}",le="+Inf"}} {hist.count}')
+    lines.append(f'{name}_sum{{{label}="{value}"}} {hist.sum:.6f}')
+    lines.append(f'{name}_count{{{label}="{value}"}} {hist.count}')
+
+
+def _cache_totals() -> dict[str, tuple[int, int]]:
+    """kind -> (entries, bytes), maintained incrementally by the catalog."""
+    rows = _catalog().execute("SELECT kind, entries, bytes FROM totals").fetchall()
+    totals = {"bundle": (0, 0), "blob": (0, 0)}
+    totals.update({kind: (entries, size) for kind, entries, size in rows})
+    return totals
+
+
 # ---------------------------------------------------------------------------
 # Platform tag parsing (no external deps — pure stdlib)
 # ---------------------------------------------------------------------------
@@ -94,28 +336,19 @@ def _validate_package_request(package: str, version: Optional[str]) -> None:
         raise ValueError("Invalid version string; provide a simple PEP 440-style version like '2.31.0'")
 
 
-def _get_package_lock(package: str) -> threading.Lock:
-    key = _normalize_name(package)
-    with _download_locks_guard:
-        lock = _download_locks.get(key)
-        if lock is None:
-            lock = threading.Lock()
-            _download_locks[key] = lock
-        return lock
-
-
-def parse_wheel_tags(filename: str) -> set[str]:
+@lru_cache(maxsize=8192)
+def parse_wheel_tags(filename: str) -> frozenset[str]:
     """
     Extract the set of compatibility tags from a wheel filename.
     e.g. requests-2.31.0-py3-none-any.whl → {"py3-none-any"}
     Handles compressed tag sets like cp311.cp312-cp311.cp312-manylinux_2_17_x86_64
     """
     if not filename.endswith(".whl"):
-        return set()
+        return frozenset()
     stem = filename[:-4]
     parts = stem.split("-")
     if len(parts) < 5:
-        return set()
+        return frozenset()
 
     interps = parts[2].split(".")
     abis = parts[3].split(".")
@@ -126,48 +359,99 @@ def parse_wheel_tags(filename: str) -> set[str]:
         for abi in abis:
             for plat in plats:
                 tags.add(f"{interp}-{abi}-{plat}")
-    return tags
+    return frozenset(tags)
+
 
+def _interp_version(interp: str) -> Optional[int]:
+    """"cp39" -> 39, "cp314" -> 314; other interpreters count as 0. None if unparseable."""
+    try:
+        return int(interp[2:]) if interp.startswith("cp") else 0
+    except ValueError:
+        return None
+
+
+@lru_cache(maxsize=4096)
+def _abi3_tag(tag: str) -> Optional[tuple[int, str]]:
+    """(interpreter version, platform) for an abi3 tag like cp39-abi3-win_amd64, else None."""
+    parts = tag.split("-")
+    if len(parts) != 3 or parts[1] != "abi3":
+        return None
+    version = _interp_version(parts[0])
+    return None if version is None else (version, parts[2])
+
+
+NO_MATCH = 999999
+
+
+class TagMatcher:
+    """
+    A client tag list compiled for wheel selection: a tag -> priority dict for
+    direct matches, and per platform the client interpreter versions (ascending)
+    with the best priority available at or above each one, for abi3 wheels.
+    Ranking a wheel then costs O(wheel tags) instead of O(wheel tags x client tags).
+    """
+
+    def __init__(self, client_tags: tuple[str, ...]):
+        self.priority: dict[str, int] = {}
+        by_platform: dict[str, list[tuple[int, int]]] = {}
+        for i, tag in enumerate(client_tags):
+            self.priority.setdefault(tag, i)
+            parts = tag.split("-")
+            if len(parts) == 3:
+                version = _interp_version(parts[0])
+                if version is not None:
+                    by_platform.setdefault(parts[2], []).append((version, i))
+
+        # platform -> (ascending client versions, lowest priority index among versions[k:])
+        self.abi3: dict[str, tuple[list[int], list[int]]] = {}
+        for plat, entries in by_platform.items():
+            entries.sort()
+            best = [0] * len(entries)
+            lowest = NO_MATCH
+            for k in range(len(entries) - 1, -1, -1):
+                lowest = min(lowest, entries[k][1])
+                best[k] = lowest
+            self.abi3[plat] = ([version for version, _ in entries], best)
+
+    def rank_tags(self, wheel_tags: frozenset[str]) -> int:
+        """
+        Lower score = better match; NO_MATCH if incompatible. A direct match scores
+        its position in the client's ordered tag list; abi3 wheels that fit a newer
+        client interpreter on the same platform score after every direct match.
+        """
+        direct = [self.priority[tag] for tag in wheel_tags if tag in self.priority]
+        if direct:
+            return min(direct)
+
+        score = NO_MATCH
+        for tag in wheel_tags:
+            abi3 = _abi3_tag(tag)
+            if abi3 is None or abi3[1] not in self.abi3:
+                continue
+            wheel_version, plat = abi3
+            versions, best = self.abi3[plat]
+            k = bisect.bisect_left(versions, wheel_version)
+            if k < len(versions):
+                score = min(score, 10000 + wheel_version * 100 + best[k])
+        return score
+
+    def rank(self, filename: str) -> int:
+        return self.rank_tags(parse_wheel_tags(filename))
+
+
+@lru_cache(maxsize=256)
+def _compiled_tag_matcher(client_tags: tuple[str, ...]) -> TagMatcher:
+    return TagMatcher(client_tags)
 
-def tags_compatible(wheel_tags: set[str], client_tags: list[str]) -> bool:
+
+def tag_matcher(client_tags: list[str]) -> TagMatcher:
+    """The compiled matcher for a client tag list, built once per distinct list."""
+    return _compiled_tag_matcher(tuple(client_tags))
+
+
+def tags_compatible(wheel_tags: frozenset[str], client_tags: list[str]) -> bool:
     """Check if wheel is compatible with client. Handles abi3 wheels specially."""
-    client_set = set(client_tags)
-    
-    # Direct match
-    if wheel_tags & client_set:
-        return True
-    
-    # Check for abi3 (stable ABI) compatibility
-    # A cp39-abi3-win_amd64 wheel works with cp310, cp311, cp312, ... cp314, etc
-    for wheel_tag in wheel_tags:
-        parts = wheel_tag.split("-")
-        if len(parts) == 3 and parts[1] == "abi3":
-            wheel_interp = parts[0]  # e.g., "cp39"
-            wheel_plat = parts[2]     # e.g., "win_amd64"
-            
-            # Extract interpreter and platform from client tags
-            for client_tag in client_tags:
-                client_parts = client_tag.split("-")
-                if len(client_parts) == 3:
-                    client_interp = client_parts[0]
-                    client_plat = client_parts[2]
-                    
-                    # Platform must match
-                    if client_plat != wheel_plat:
-                        continue
-                    
-                    # Extract version numbers from interpreters (e.g., "cp39" -> 39, "cp314" -> 314)
-                    try:
-                        wheel_version = int(wheel_interp[2:]) if wheel_interp.startswith("cp") else 0
-                        client_version = int(client_interp[2:]) if client_interp.startswith("cp") else 0
-                        
-                        # Client version must be >= wheel version for abi3 to work
-                        if client_version >= wheel_version:
-                            return True
-                    except (ValueError, IndexError):
-                        pass
-    
-    return False
+    return tag_matcher(client_tags).rank_tags(frozenset(wheel_tags)) < NO_MATCH
 
 
 def rank_wheel(filename: str, client_tags: list[str]) -> int:
@@ -175,111 +459,744 @@ def rank_wheel(filename: str, client_tags: list[str]) -> int:
     Lower score = better match. Prefers wheels that match earlier
     in the client's ordered tag list (most-specific first).
     """
-    wheel_tags = parse_wheel_tags(filename)
-    
-    # First check direct matches
-    for i, tag in enumerate(client_tags):
-        if tag in wheel_tags:
-            return i
-    
-    # Then check abi3 compatibility
-    for wheel_tag in wheel_tags:
-        parts = wheel_tag.split("-")
-        if len(parts) == 3 and parts[1] == "abi3":
-            wheel_interp = parts[0]
-            wheel_plat = parts[2]
-            
-            for j, client_tag in enumerate(client_tags):
-                client_parts = client_tag.split("-")
-                if len(client_parts) == 3:
-                    client_interp = client_parts[0]
-                    client_plat = client_parts[2]
-                    
-                    if client_plat != wheel_plat:
-                        continue
-                    
-                    try:
-                        wheel_version = int(wheel_interp[2:]) if wheel_interp.startswith("cp") else 0
-                        client_version = int(client_interp[2:]) if client_interp.startswith("cp") else 0
-                        
-                        if client_version >= wheel_version:
-                            # Return a score based on how old the wheel is
-                            # Prefer newer compatible wheels (lower score = better)
-                            return 10000 + (wheel_version * 100) + j
-                    except (ValueError, IndexError):
-                        pass
-    
-    return 999999
+    return tag_matcher(client_tags).rank(filename)
+
+
+# ---------------------------------------------------------------------------
+# Upstream HTTP
+# ---------------------------------------------------------------------------
+_RETRY_STATUSES = {429, 500, 502, 503, 504}
+_REDIRECT_STATUSES = {301, 302, 303, 307, 308}
+
+
+class _UpstreamPool:
+    """
+    Keep-alive HTTP/1.1 connections to upstream hosts, at most `per_host` in use
+    per origin at a time. Idle connections are reused by the next request to the
+    same origin; a reused connection the server already closed is replaced once
+    without counting as a retry.
+    """
+
+    def __init__(self, per_host: int):
+        self.per_host = per_host
+        self._guard = threading.Lock()
+        self._pid = os.getpid()
+        self._idle: dict[tuple[str, str, int], list[http.client.HTTPConnection]] = {}
+        self._slots: dict[tuple[str, str, int], threading.BoundedSemaphore] = {}
+
+    def _origin_state(self, origin: tuple[str, str, int]):
+        with self._guard:
+            if self._pid != os.getpid():
+                # Forked worker: connections opened by the parent belong to the parent.
+                self._pid = os.getpid()
+                self._idle = {}
+                self._slots = {}
+            slot = self._slots.setdefault(origin, threading.BoundedSemaphore(self.per_host))
+            idle = self._idle.setdefault(origin, [])
+        return slot, idle
+
+    def _connect(self, origin: tuple[str, str, int]) -> http.client.HTTPConnection:
+        scheme, host, port = origin
+        cls = http.client.HTTPSConnection if scheme == "https" else http.client.HTTPConnection
+        proxy = _proxy_for(scheme, host)
+        if proxy is None:
+            conn = cls(host, port, timeout=UPSTREAM_CONNECT_TIMEOUT)
+        else:
+            conn = cls(proxy.hostname, proxy.port or 80, timeout=UPSTREAM_CONNECT_TIMEOUT)
+            if scheme == "https":
+                conn.set_tunnel(host, port, headers=_proxy_auth_headers(proxy))
+        conn.connect()
+        conn.sock.settimeout(UPSTREAM_READ_TIMEOUT)
+        return conn
+
+    def _exchange(self, origin, idle, target: str, headers: dict, out):
+        """One request/response on a pooled connection. Returns (status, headers, body, location)."""
+        while True:
+            with self._guard:
+                conn = idle.pop() if idle else None
+            reused = conn is not None
+            if conn is None:
+                conn = self._connect(origin)
+            try:
+                conn.request("GET", target, headers=headers)
+                resp = conn.getresponse()
+            except (ConnectionError, http.client.BadStatusLine):
+                conn.close()
+                if reused:
+                    continue
+                raise
+            except BaseException:
+                conn.close()
+                raise
+            break
+
+        try:
+            if out is not None and resp.status == 200:
+                out.seek(0)
+                out.truncate()
+                shutil.copyfileobj(resp, out, 1024 * 1024)
+                body = b""
+            else:
+                body = resp.read()
+        except BaseException:
+            conn.close()
+            raise
+        if resp.will_close:
+            conn.close()
+        else:
+            with self._guard:
+                idle.append(conn)
+        return resp.status, resp.headers, body, resp.getheader("Location")
+
+    def get(self, url: str, headers: dict, out=None):
+        """
+        GET url, following redirects. With `out`, a 200 body is streamed into that
+        binary file object instead of being returned.
+        """
+        for _ in range(5):
+            parts = urllib.parse.urlsplit(url)
+            port = parts.port or (443 if parts.scheme == "https" else 80)
+            origin = (parts.scheme, parts.hostname, port)
+            target = parts.path or "/"
+            if parts.query:
+                target += f"?{parts.query}"
+            request_headers = headers
+            proxy = _proxy_for("http", parts.hostname) if parts.scheme == "http" else None
+            if proxy is not None:
+                target = url  # plain-HTTP proxies take the absolute URL
+                request_headers = {**headers, **_proxy_auth_headers(proxy)}
+
+            slot, idle = self._origin_state(origin)
+            with slot:
+                status, resp_headers, body, location = self._exchange(origin, idle, target, request_headers, out)
+            if status in _REDIRECT_STATUSES and location:
+                url = urllib.parse.urljoin(url, location)
+                continue
+            return status, resp_headers, body
+        raise RuntimeError(f"Too many redirects fetching {url}")
+
+
+_upstream_pool = _UpstreamPool(UPSTREAM_CONNECTIONS_PER_HOST)
+_upstream_proxies = urllib.request.getproxies()
+
+
+def _proxy_for(scheme: str, host: str) -> Optional[urllib.parse.SplitResult]:
+    """The HTTP(S)_PROXY to use for host, honouring NO_PROXY, like urllib did."""
+    proxy = _upstream_proxies.get(scheme)
+    if not proxy or urllib.request.proxy_bypass(host):
+        return None
+    return urllib.parse.urlsplit(proxy if "://" in proxy else f"http://{proxy}")
+
+
+def _proxy_auth_headers(proxy: urllib.parse.SplitResult) -> dict:
+    """Proxy-Authorization for a proxy URL with user:password@, as urllib's ProxyHandler sent it."""
+    if proxy.username is None:
+        return {}
+    credentials = f"{urllib.parse.unquote(proxy.username)}:{urllib.parse.unquote(proxy.password or '')}"
+    return {"Proxy-Authorization": "Basic " + base64.b64encode(credentials.encode()).decode("ascii")}
+
+
+def _upstream_get(url: str, headers: dict, out=None):
+    """
+    GET an upstream URL through the connection pool, retrying connection errors,
+    timeouts and 429 / 5xx responses with exponential backoff. Returns
+    (status, headers, body); other error statuses are left to the caller.
+    """
+    for attempt in range(UPSTREAM_RETRIES + 1):
+        try:
+            status, resp_headers, body = _upstream_pool.get(url, headers, out)
+        except (OSError, http.client.HTTPException) as e:
+            if attempt == UPSTREAM_RETRIES:
+                raise
+            log.warning("Upstream error for %s (attempt %d): %s", url, attempt + 1, e)
+            delay = UPSTREAM_BACKOFF * 2 ** attempt
+        else:
+            if status not in _RETRY_STATUSES or attempt == UPSTREAM_RETRIES:
+                return status, resp_headers, body
+            log.warning("Upstream %d for %s (attempt %d)", status, url, attempt + 1)
+            delay = UPSTREAM_BACKOFF * 2 ** attempt
+            retry_after = resp_headers.get("Retry-After", "")
+            if retry_after.isdigit():
+                delay = max(delay, min(int(retry_after), 30))
+        _count("upstream_retries")
+        time.sleep(delay)
+
+
+def _parent_get(path: str, out) -> Optional[http.client.HTTPMessage]:
+    """
+    GET path from the parent node, streaming a 200 body into out. Returns the response
+    headers, or None when the parent is unreachable or has nothing to offer.
+    """
+    headers = {"User-Agent": "Whispy/1.0"}
+    if PARENT_SECRET:
+        headers["X-Whispy-Secret"] = PARENT_SECRET
+    try:
+        status, resp_headers, _ = _upstream_get(PARENT_URL + path, headers, out=out)
+    except (OSError, http.client.HTTPException) as e:
+        log.warning("Parent node unreachable for %s: %s", path, e)
+        _count("parent_misses")
+        return None
+    if status != 200:
+        log.info("Parent node answered %d for %s", status, path)
+        _count("parent_misses")
+        return None
+    return resp_headers
+
+
+def _file_url(url: str) -> str:
+    """Rewrite a PyPI file URL onto WHISPY_FILES_BASE when a files mirror is configured."""
+    if FILES_BASE and url.startswith(PYPI_FILES_ORIGIN + "/"):
+        return FILES_BASE + url[len(PYPI_FILES_ORIGIN):]
+    return url
 
 
 # ---------------------------------------------------------------------------
 # PyPI metadata
 # ---------------------------------------------------------------------------
 
-def fetch_pypi_metadata(package: str, version: Optional[str] = None) -> dict:
-    name = _normalize_name(package)
+def _metadata_url(name: str, version: Optional[str]) -> str:
+    if version:
+        return f"{PYPI_BASE}/{urllib.parse.quote(name)}/{urllib.parse.quote(version)}/json"
+    return f"{PYPI_BASE}/{urllib.parse.quote(name)}/json"
+
+
+def _metadata_cache_path(name: str, version: Optional[str]) -> Path:
     if version:
-        url = f"{PYPI_BASE}/{urllib.parse.quote(name)}/{urllib.parse.quote(version)}/json"
+        return METADATA_DIR / f"{name}=={urllib.parse.quote(version, safe='')}.json"
+    return METADATA_DIR / f"{name}.json"
+
+
+def _atomic_write_text(path: Path, text: str) -> None:
+    """Write via a temp file in the same directory so readers never see a partial file."""
+    fd, tmp_name = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w") as f:
+            f.write(text)
+        os.replace(tmp_name, path)
+    except BaseException:
+        Path(tmp_name).unlink(missing_ok=True)
+        raise
+
+
+def _metadata_memory_get(cache_id: str) -> Optional[dict]:
+    with _metadata_guard:
+        entry = _metadata_memory.get(cache_id)
+        if entry is not None:
+            _metadata_memory.move_to_end(cache_id)
+        return entry
+
+
+def _metadata_memory_put(cache_id: str, entry: dict) -> None:
+    with _metadata_guard:
+        _metadata_memory[cache_id] = entry
+        _metadata_memory.move_to_end(cache_id)
+        while len(_metadata_memory) > METADATA_MEMORY_ENTRIES:
+            _metadata_memory.popitem(last=False)
+
+
+def _metadata_cache_load(name: str, version: Optional[str]) -> Optional[dict]:
+    cache_id = f"{name}=={version or ''}"
+    entry = _metadata_memory_get(cache_id)
+    if entry is not None:
+        return entry
+    path = _metadata_cache_path(name, version)
+    try:
+        entry = json.loads(path.read_text())
+    except (OSError, ValueError):
+        return None
+    _metadata_memory_put(cache_id, entry)
+    return entry
+
+
+def _metadata_cache_store(name: str, version: Optional[str], entry: dict) -> None:
+    _metadata_memory_put(f"{name}=={version or ''}", entry)
+    try:
+        _atomic_write_text(_metadata_cache_path(name, version), json.dumps(entry))
+    except OSError as e:
+        log.warning("Could not persist metadata cache for %s: %s", name, e)
+
+
+def _metadata_cache_drop(name: str, version: Optional[str]) -> None:
+    with _metadata_guard:
+        _metadata_memory.pop(f"{name}=={version or ''}", None)
+    _metadata_cache_path(name, version).unlink(missing_ok=True)
+
+
+def _metadata_request_headers(entry: Optional[dict]) -> dict:
+    """Request headers for a metadata fetch, conditional on the cached entry's validators."""
+    headers = {"User-Agent": "Whispy/1.0 (+https://github.com/Dark-Avenger-Reborn/Whispy)"}
+    if entry and entry.get("etag"):
+        headers["If-None-Match"] = entry["etag"]
+    if entry and entry.get("last_modified"):
+        headers["If-Modified-Since"] = entry["last_modified"]
+    return headers
+
+
+def _metadata_entry(headers, data: dict) -> dict:
+    return {
+        "etag": headers.get("ETag"),
+        "last_modified": headers.get("Last-Modified"),
+        "fetched": time.time(),
+        "data": _trim_metadata(data),
+    }
+
+
+# The parts of a PyPI JSON document that resolution, bundling and /metadata read.
+_INFO_FIELDS = (
+    "name", "version", "summary", "requires_python", "requires_dist", "license", "home_page", "project_urls", "yanked",
+)
+_FILE_FIELDS = ("filename", "url", "size", "requires_python", "yanked", "packagetype")
+
+
+def _trim_metadata(data: dict) -> dict:
+    """
+    Reduce a PyPI JSON document to its info block and the file list of info.version,
+    dropping every other release, so cached entries stay small and cheap to parse.
+    """
+    info = {field: data["info"].get(field) for field in _INFO_FIELDS}
+    files = data.get("releases", {}).get(info["version"], []) or data.get("urls", [])
+    return {
+        "info": info,
+        "urls": [
+            {
+                **{field: f[field] for field in _FILE_FIELDS if field in f},
+                "digests": {"sha256": f["digests"]["sha256"]} if f.get("digests", {}).get("sha256") else {},
+            }
+            for f in files
+        ],
+    }
+
+
+def _parse_version(version) -> Optional[Version]:
+    """A PEP 440 version, or None for anything that does not parse (never picked as latest)."""
+    try:
+        return Version(version)
+    except (InvalidVersion, TypeError):
+        return None
+
+
+def _latest_version(versions) -> Optional[str]:
+    """The highest final release among versions, or the highest pre-release when there is no final."""
+    parsed = {v: _parse_version(v) for v in versions}
+    parsed = {v: p for v, p in parsed.items() if p is not None}
+    finals = [v for v, p in parsed.items() if not p.is_prerelease]
+    return max(finals or parsed, key=parsed.__getitem__, default=None)
+
+
+SIMPLE_JSON_ACCEPT = "application/vnd.pypi.simple.v1+json"
+
+
+def _simple_index_url(name: str) -> str:
+    return f"{PYPI_SIMPLE}/{urllib.parse.quote(name)}/"
+
+
+def _simple_index_latest(content_type: str, body: bytes) -> Optional[str]:
+    """
+    The version PyPI would report as latest, from a PEP 691 JSON project page: the
+    highest final release with at least one non-yanked file (pre-releases only when
+    nothing else exists), ordered by PEP 440. Versions that do not parse are skipped.
+    None when the page is not PEP 691 JSON with a version list, or nothing qualifies.
+    """
+    if "json" not in content_type:
+        return None
+    try:
+        page = json.loads(body)
+        versions, files = page.get("versions"), page.get("files", [])
+    except (ValueError, AttributeError):
+        return None
+    if not versions:
+        return None
+
+    # A version counts when at least one of its files is not yanked. Filenames and the
+    # version list may spell a version differently ("1.0" / "1.0.0"), so compare parsed.
+    available: dict[Version, bool] = {}
+    for f in files:
+        try:
+            parsed = _parse_version(_dist_name_version(f["filename"])["version"])
+        except (KeyError, ValueError):
+            continue
+        if parsed is not None:
+            available[parsed] = available.get(parsed, False) or not f.get("yanked")
+    return _latest_version(v for v in versions if available.get(_parse_version(v)))
+
+
+def _request_pypi_metadata(package: str, url: str, entry: Optional[dict]) -> dict:
+    """
+    GET a PyPI JSON document, revalidating with ETag / Last-Modified when a cached
+    entry exists. Returns the new cache entry (the old one, refreshed, on 304).
+    """
+    _count("upstream_requests")
+    with _timed("metadata"):
+        status, headers, body = _upstream_get(url, _metadata_request_headers(entry))
+    if status == 200:
+        return _metadata_entry(headers, json.loads(body))
+    if status == 304 and entry:
+        return {**entry, "fetched": time.time()}
+    if status == 404:
+        raise ValueError(f"Package '{package}' not found on PyPI")
+    raise RuntimeError(f"PyPI error {status}: {http.client.responses.get(status, 'Unknown')}")
+
+
+def _request_latest_metadata(package: str, name: str, entry: Optional[dict]) -> dict:
+    """
+    Unpinned lookup through the PEP 691 JSON simple index: read the version list, then
+    fetch just the latest release's JSON (cached like any pinned lookup). The index is
+    revalidated with the cached entry's validators. Indexes without PEP 691 JSON fall
+    back to the full project JSON.
+    """
+    validators = entry if entry and entry.get("simple") else None
+    headers = {**_metadata_request_headers(validators), "Accept": SIMPLE_JSON_ACCEPT}
+    _count("upstream_requests")
+    with _timed("metadata"):
+        status, resp_headers, body = _upstream_get(_simple_index_url(name), headers)
+    if status == 304 and validators:
+        return {**entry, "fetched": time.time()}
+    if status == 404:
+        raise ValueError(f"Package '{package}' not found on PyPI")
+    if status != 200:
+        raise RuntimeError(f"PyPI error {status}: {http.client.responses.get(status, 'Unknown')}")
+
+    latest = _simple_index_latest(resp_headers.get("Content-Type", ""), body)
+    if latest is None:
+        log.info("Simple index for %s is not PEP 691 JSON, using the project JSON", name)
+        return _request_pypi_metadata(package, _metadata_url(name, None), None)
+    return {**_metadata_entry(resp_headers, fetch_pypi_metadata(package, latest)), "simple": True}
+
+
+def _single_flight(key: str, fn):
+    """Run fn() once per key at a time; concurrent callers with the same key wait for and share its outcome."""
+    with _inflight_guard:
+        future = _inflight.get(key)
+        leader = future is None
+        if leader:
+            future = Future()
+            _inflight[key] = future
+    if not leader:
+        return future.result()
+
+    try:
+        result = fn()
+    except BaseException as e:
+        future.set_exception(e)
+        raise
     else:
-        url = f"{PYPI_BASE}/{urllib.parse.quote(name)}/json"
+        future.set_result(result)
+        return result
+    finally:
+        with _inflight_guard:
+            _inflight.pop(key, None)
+
 
-    req = urllib.request.Request(url, headers={"User-Agent": "Whispy/1.0 (+https://github.com/Dark-Avenger-Reborn/Whispy)"})
+@contextmanager
+def _file_lock(name: str, timeout: float = BUILD_LOCK_TIMEOUT, shared: bool = False, wait: bool = True):
+    """
+    Lock on LOCK_DIR/<name>.lock shared by every process using this cache: exclusive,
+    or with shared=True held alongside other shared holders. Waiters poll until the
+    holder releases it (or exits); with wait=False the body runs at once and receives
+    False when the lock is busy. The last holder deletes the file on release, so lock
+    files only exist while a lock is held or awaited. A no-op where fcntl is unavailable.
+    """
+    if fcntl is None:
+        yield True
+        return
+
+    path = LOCK_DIR / f"{name}.lock"
+    mode = fcntl.LOCK_SH if shared else fcntl.LOCK_EX
+    deadline = time.monotonic() + timeout
+    while True:
+        fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        acquired = False
+        try:
+            while not acquired:
+                try:
+                    fcntl.flock(fd, mode | fcntl.LOCK_NB)
+                    acquired = True
+                except BlockingIOError:
+                    if not wait:
+                        break
+                    if time.monotonic() >= deadline:
+                        raise TimeoutError(f"Timed out waiting for lock {name}")
+                    time.sleep(0.1)
+        except BaseException:
+            os.close(fd)
+            raise
+        if not acquired:
+            os.close(fd)
+            yield False
+            return
+        # A lock taken on a file the previous holder already deleted excludes nobody:
+        # start over on whatever file is at the path now.
+        if _lock_file_current(path, fd):
+            break
+        os.close(fd)
     try:
-        with urllib.request.urlopen(req, timeout=15) as resp:
-            return json.load(resp)
-    except urllib.error.HTTPError as e:
-        if e.code == 404:
-            raise ValueError(f"Package '{package}' not found on PyPI")
-        raise RuntimeError(f"PyPI error {e.code}: {e.reason}")
+        yield True
+    finally:
+        try:
+            # Only a sole holder may delete the file; other shared holders keep it.
+            if shared:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            path.unlink(missing_ok=True)
+        except OSError:
+            pass
+        os.close(fd)
+
+
+def _lock_file_current(path: Path, fd: int) -> bool:
+    """Whether fd is still the file at path (not one a previous lock holder deleted)."""
+    try:
+        on_disk, held = os.stat(path), os.fstat(fd)
+    except FileNotFoundError:
+        return False
+    return (on_disk.st_dev, on_disk.st_ino) == (held.st_dev, held.st_ino)
+
+
+def _prune_lock_files() -> None:
+    """Delete lock files nobody holds (startup), e.g. ones left behind by older releases."""
+    if fcntl is None:
+        return
+    for path in LOCK_DIR.glob("*.lock"):
+        try:
+            fd = os.open(path, os.O_RDWR)
+        except OSError:
+            continue
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            # Same rule as _file_lock: only the holder of the current file may delete it.
+            if _lock_file_current(path, fd):
+                path.unlink()
+        except OSError:
+            pass
+        finally:
+            os.close(fd)
+
+
+def _revalidate_metadata(package: str, name: str, version: Optional[str], entry: Optional[dict]) -> dict:
+    def _revalidate():
+        try:
+            if version is None and METADATA_BACKEND == "simple":
+                fresh = _request_latest_metadata(package, name, entry)
+            else:
+                fresh = _request_pypi_metadata(package, _metadata_url(name, version), entry)
+        except ValueError:
+            _metadata_cache_drop(name, version)
+            raise
+        _metadata_cache_store(name, version, fresh)
+        return fresh
+
+    return _single_flight(f"metadata:{name}=={version or ''}", _revalidate)
+
+
+def _revalidate_metadata_in_background(package: str, name: str, version: Optional[str], entry: dict) -> None:
+    cache_id = f"{name}=={version or ''}"
+    with _metadata_guard:
+        if cache_id in _metadata_refreshing:
+            return
+        _metadata_refreshing.add(cache_id)
+
+    def _refresh():
+        try:
+            _revalidate_metadata(package, name, version, entry)
+        except Exception as e:
+            log.warning("Background metadata refresh failed for %s: %s", cache_id, e)
+        finally:
+            with _metadata_guard:
+                _metadata_refreshing.discard(cache_id)
+
+    threading.Thread(target=_refresh, name=f"whispy-meta-{name}", daemon=True).start()
+
+
+def fetch_pypi_metadata(package: str, version: Optional[str] = None) -> dict:
+    """
+    Return the PyPI JSON document for a package (or one pinned version).
+
+    Served from the memory/disk metadata cache while fresh; within the stale window
+    the cached copy is returned immediately and revalidated in the background.
+    Past that, the entry is revalidated synchronously, falling back to the stale
+    copy if PyPI is unreachable.
+    """
+    name = _normalize_name(package)
+    if OFFLINE:
+        local = _local_metadata(name, version)
+        if local is None:
+            raise ValueError(f"Package '{package}' not found on PyPI or in the local wheelhouse")
+        return local
+
+    entry = _metadata_cache_load(name, version)
+    ttl = METADATA_PINNED_TTL if version else METADATA_TTL
+
+    if entry is not None:
+        age = time.time() - entry.get("fetched", 0)
+        if age < ttl:
+            return entry["data"]
+        if age < ttl + METADATA_STALE_TTL:
+            _revalidate_metadata_in_background(package, name, version, entry)
+            return entry["data"]
+
+    try:
+        return _revalidate_metadata(package, name, version, entry)["data"]
+    except Exception as e:
+        if entry is not None and not isinstance(e, ValueError):
+            log.warning("PyPI revalidation failed for %s, serving stale metadata: %s", name, e)
+            return entry["data"]
+        local = _local_metadata(name, version)
+        if local is None:
+            raise
+        log.warning("PyPI lookup failed for %s, serving the local wheelhouse: %s", name, e)
+        return local
+
+
+def _dependency_names(info: dict) -> list[str]:
+    """Names of the unconditional install-time requirements listed in a PyPI info block."""
+    names = []
+    for req in info.get("requires_dist") or []:
+        # Skip extras and conditional deps for now
+        if "extra ==" in req or "; extra" in req:
+            continue
+        # Strip environment markers
+        req_clean = req.split(";")[0].strip()
+        # Parse name + version spec
+        dep_match = re.match(r'^([A-Za-z0-9_.\-]+)\s*(.*)', req_clean)
+        if dep_match:
+            names.append(dep_match.group(1).strip())
+    return names
 
 
 def resolve_dependencies(package: str, version: str) -> list[dict]:
     """
     Returns a flat ordered list of {name, version, files} dicts
     covering the package and all its install-time dependencies.
-    Simple breadth-first, no conflict resolution (good enough for v1).
     """
-    resolved = {}
-    queue = [(package, version)]
+    return resolve_graph([(package, version)])
 
-    while queue:
-        name, ver = queue.pop(0)
-        norm = _normalize_name(name)
-        if norm in resolved:
-            continue
 
+# Bump when the resolver's output changes so graphs cached by an older version are not reused.
+_GRAPH_FORMAT = 1
+
+
+def _graph_id(roots: list[tuple[str, Optional[str]]]) -> str:
+    """
+    Identity of a resolved graph. Environment markers are stripped rather than evaluated,
+    so the graph depends only on its roots (in order) and the resolver format, not on tags.
+    """
+    ident = "\0".join(f"{_normalize_name(name)}=={version}" for name, version in roots)
+    return hashlib.sha256(f"v{_GRAPH_FORMAT}\0{ident}".encode()).hexdigest()[:32]
+
+
+def _graph_cache_load(graph_id: str) -> Optional[list[dict]]:
+    path = GRAPH_DIR / f"{graph_id}.json"
+    try:
+        entry = json.loads(path.read_text())
+    except (OSError, ValueError):
+        return None
+    if time.time() - entry.get("resolved_at", 0) >= GRAPH_TTL:
+        path.unlink(missing_ok=True)
+        return None
+    return entry["packages"]
+
+
+def _graph_cache_store(graph_id: str, packages: list[dict]) -> None:
+    try:
+        _atomic_write_text(
+            GRAPH_DIR / f"{graph_id}.json",
+            json.dumps({"resolved_at": time.time(), "packages": packages}),
+        )
+    except OSError as e:
+        log.warning("Could not persist resolved graph %s: %s", graph_id, e)
+
+
+def _prune_graph_cache() -> None:
+    """Drop expired graphs (startup); live ones are replaced in place when they expire."""
+    cutoff = time.time() - GRAPH_TTL
+    for path in GRAPH_DIR.glob("*.json"):
         try:
-            meta = fetch_pypi_metadata(name, ver or None)
-        except Exception as e:
-            log.warning("Skipping dep %s==%s: %s", name, ver, e)
-            continue
+            if path.stat().st_mtime < cutoff:
+                path.unlink()
+        except OSError:
+            pass
 
-        info = meta["info"]
-        actual_ver = info["version"]
-        requires = info.get("requires_dist") or []
-
-        resolved[norm] = {
-            "name": norm,
-            "version": actual_ver,
-            "files": meta.get("releases", {}).get(actual_ver, []) or meta.get("urls", []),
-            "requires_python": info.get("requires_python"),
-        }
 
-        for req in requires:
-            # Skip extras and conditional deps for now
-            if "extra ==" in req or "; extra" in req:
-                continue
-            # Strip environment markers
-            req_clean = req.split(";")[0].strip()
-            # Parse name + version spec
-            dep_match = re.match(r'^([A-Za-z0-9_.\-]+)\s*(.*)', req_clean)
-            if dep_match:
-                dep_name = dep_match.group(1).strip()
-                dep_norm = _normalize_name(dep_name)
-                if dep_norm not in resolved:
-                    queue.append((dep_name, None))
+def resolve_graph(roots: list[tuple[str, Optional[str]]]) -> list[dict]:
+    """
+    Resolve several root packages as one graph: dependencies shared between roots
+    appear once. Graphs with pinned roots are cached for GRAPH_TTL seconds, so a new
+    tag set for a popular package goes straight to wheel selection and download.
+    """
+    if GRAPH_TTL <= 0 or not all(version for _, version in roots):
+        return _walk_graph(roots)[0]
+
+    graph_id = _graph_id(roots)
+    cached = _graph_cache_load(graph_id)
+    if cached is not None:
+        with _resolver_stats_guard:
+            _resolver_stats["graph_cache_hits"] += 1
+        log.info("Resolved graph cache hit: %s (%d packages)", graph_id, len(cached))
+        return cached
 
-    return list(resolved.values())
+    def _resolve():
+        packages, complete = _walk_graph(roots)
+        # A graph with skipped dependencies is still used for this build, just not reused.
+        if complete:
+            _graph_cache_store(graph_id, packages)
+        return packages
+
+    return _single_flight(f"graph:{graph_id}", _resolve)
+
+
+def _walk_graph(roots: list[tuple[str, Optional[str]]]) -> tuple[list[dict], bool]:
+    """
+    Breadth-first, no conflict resolution (good enough for v1); every node in a BFS
+    level is fetched concurrently and each name is requested at most once.
+    Returns the packages and whether every node's metadata could be fetched.
+    """
+    started = time.monotonic()
+    complete = True
+    resolved: dict[str, dict] = {}
+    seen = {_normalize_name(name) for name, _ in roots}
+    frontier = deque(roots)
+
+    with ThreadPoolExecutor(max_workers=RESOLVE_WORKERS, thread_name_prefix="whispy-resolve") as pool:
+        while frontier:
+            level = list(frontier)
+            frontier.clear()
+            futures = [pool.submit(fetch_pypi_metadata, name, ver or None) for name, ver in level]
+
+            # Consume results in frontier order so the output matches a serial BFS.
+            for (name, ver), future in zip(level, futures):
+                try:
+                    meta = future.result()
+                except Exception as e:
+                    log.warning("Skipping dep %s==%s: %s", name, ver, e)
+                    complete = False
+                    continue
+
+                info = meta["info"]
+                actual_ver = info["version"]
+                norm = _normalize_name(name)
+
+                resolved[norm] = {
+                    "name": norm,
+                    "version": actual_ver,
+                    "files": meta.get("releases", {}).get(actual_ver, []) or meta.get("urls", []),
+                    "requires_python": info.get("requires_python"),
+                }
+
+                for dep_name in _dependency_names(info):
+                    dep_norm = _normalize_name(dep_name)
+                    if dep_norm not in seen:
+                        seen.add(dep_norm)
+                        frontier.append((dep_name, None))
+
+    elapsed_ms = (time.monotonic() - started) * 1000
+    with _metrics_guard:
+        _stage_histograms["resolve"].observe(elapsed_ms / 1000)
+    with _resolver_stats_guard:
+        _resolver_stats["resolutions"] += 1
+        _resolver_stats["last_ms"] = round(elapsed_ms, 1)
+        _resolver_stats["total_ms"] = round(_resolver_stats["total_ms"] + elapsed_ms, 1)
+    label = ", ".join(f"{name}=={version}" for name, version in roots)
+    log.info("Resolved %d packages for %s in %.1fms", len(resolved), label, elapsed_ms)
+    return list(resolved.values()), complete
 
 
 # ---------------------------------------------------------------------------
@@ -295,9 +1212,11 @@ def _sha256_file(path: Path) -> str:
 
 
 def _download(url: str, dest: Path) -> None:
-    req = urllib.request.Request(url, headers={"User-Agent": "Whispy/1.0"})
-    with urllib.request.urlopen(req, timeout=60) as resp, open(dest, "wb") as out:
-        shutil.copyfileobj(resp, out)
+    _count("upstream_requests")
+    with _timed("download"), open(dest, "wb") as out:
+        status, _, _ = _upstream_get(_file_url(url), {"User-Agent": "Whispy/1.0"}, out=out)
+    if status != 200:
+        raise RuntimeError(f"Download of {url} failed: HTTP {status}")
 
 
 def _safe_target(base_dir: Path, target: Path) -> Path:
@@ -312,20 +1231,27 @@ def _is_zip_symlink(info: zipfile.ZipInfo) -> bool:
     return stat.S_IFMT(info.external_attr >> 16) == stat.S_IFLNK
 
 
+def _check_zip_member(info: zipfile.ZipInfo) -> bool:
+    """Reject unsafe archive members. Returns False for directory entries, which are skipped."""
+    name = info.filename
+    if not name or name.endswith("/"):
+        return False
+
+    member_path = Path(name)
+    if member_path.is_absolute() or ".." in member_path.parts:
+        raise ValueError(f"Unsafe zip member path: {name}")
+    if _is_zip_symlink(info):
+        raise ValueError(f"Refusing to extract symlink entry: {name}")
+    return True
+
+
 def _safe_extract_zip(archive: zipfile.ZipFile, dest_dir: Path) -> int:
     extracted = 0
     for info in archive.infolist():
-        name = info.filename
-        if not name or name.endswith("/"):
+        if not _check_zip_member(info):
             continue
 
-        member_path = Path(name)
-        if member_path.is_absolute() or ".." in member_path.parts:
-            raise ValueError(f"Unsafe zip member path: {name}")
-        if _is_zip_symlink(info):
-            raise ValueError(f"Refusing to extract symlink entry: {name}")
-
-        target = _safe_target(dest_dir, member_path)
+        target = _safe_target(dest_dir, Path(info.filename))
         target.parent.mkdir(parents=True, exist_ok=True)
         with archive.open(info, "r") as src, open(target, "wb") as dst:
             shutil.copyfileobj(src, dst)
@@ -359,29 +1285,26 @@ def _safe_extract_tar(archive, dest_dir: Path) -> int:
 
 
 def _best_wheel(files: list[dict], client_tags: list[str]) -> Optional[dict]:
+    matcher = tag_matcher(client_tags)
     wheels = [f for f in files if f["filename"].endswith(".whl")]
-    compatible = [
-        w for w in wheels
-        if tags_compatible(parse_wheel_tags(w["filename"]), client_tags)
-    ]
-    
+    ranked = [(matcher.rank(w["filename"]), w) for w in wheels]
+    compatible = [(rank, w) for rank, w in ranked if rank < NO_MATCH]
+
     # Log details for debugging
-    if wheels:
+    if wheels and log.isEnabledFor(logging.DEBUG):
         log.debug("Found %d wheels, %d compatible. Available wheels:", len(wheels), len(compatible))
-        for w in wheels[:10]:  # Log first 10 wheels
-            tags = parse_wheel_tags(w["filename"])
-            is_compat = w in compatible
-            log.debug("  %s - tags=%s - compatible=%s", w["filename"], tags, is_compat)
+        for rank, w in ranked[:10]:  # Log first 10 wheels
+            tags = sorted(parse_wheel_tags(w["filename"]))
+            log.debug("  %s - tags=%s - compatible=%s", w["filename"], tags, rank < NO_MATCH)
         if len(wheels) > 10:
             log.debug("  ... and %d more wheels", len(wheels) - 10)
-    
+
     if not compatible:
         log.warning("No compatible wheels found. Client tags: %s", client_tags[:10])
         return None
-    
-    # Sort by rank (most specific match first)
-    compatible.sort(key=lambda w: rank_wheel(w["filename"], client_tags))
-    best = compatible[0]
+
+    # Most specific match first; ties keep PyPI's file order.
+    best = min(compatible, key=lambda ranked_wheel: ranked_wheel[0])[1]
     log.info("Selected wheel: %s", best["filename"])
     return best
 
@@ -393,232 +1316,1586 @@ def _sdist(files: list[dict]) -> Optional[dict]:
     return None
 
 
-def download_package_to_dir(pkg_files: list[dict], client_tags: list[str], dest_dir: Path) -> str:
-    """Download best-match wheel (or sdist) into dest_dir. Returns chosen filename."""
+def _blob_path(sha256: str) -> Path:
+    return BLOB_DIR / sha256[:2] / sha256
+
+
+def _blob_is_valid(blob: Path, sha256: str) -> bool:
+    """Re-hash a stored blob only if it changed on disk or its last check is older than SCRUB_INTERVAL."""
+    ident = f"blob:{sha256}"
+    try:
+        signature = _file_signature(blob)
+    except OSError:
+        return False
+    now = time.time()
+    with _verified_guard:
+        verified = _verified_files.get(ident)
+    if verified and verified[0] == signature and now - verified[2] < SCRUB_INTERVAL:
+        return True
+    with _timed("verify"):
+        actual = _sha256_file(blob)
+    if actual != sha256:
+        log.warning("Blob integrity fail for %s — evicting", sha256)
+        _evict_blob(sha256)
+        return False
+    with _verified_guard:
+        _verified_files[ident] = (signature, sha256, now)
+    return True
+
+
+def fetch_distribution(chosen: dict, dest_dir: Path) -> Path:
+    """
+    Return a verified local copy of a PyPI file.
+
+    Files with a published sha256 live once in the content-addressed blob store and
+    are shared by every bundle that needs them; anything else is downloaded into dest_dir.
+    """
+    filename = chosen["filename"]
+    expected = chosen.get("digests", {}).get("sha256")
+    if not expected:
+        log.warning("No SHA256 digest available for %s — skipping verification", filename)
+        tmp = dest_dir / filename
+        _download(chosen["url"], tmp)
+        return tmp
+
+    blob = _blob_path(expected)
+    if blob.exists() and _blob_is_valid(blob, expected):
+        _catalog_touch(f"blob:{expected}")
+        log.info("Blob hit: %s (%s)", filename, expected[:12])
+        return blob
+
+    # Another worker process may be downloading the same file; wait for it and reuse its blob.
+    with _file_lock(f"blob-{expected}"):
+        if blob.exists() and _blob_is_valid(blob, expected):
+            log.info("Blob hit: %s (%s)", filename, expected[:12])
+            return blob
+        return _download_blob(chosen, blob)
+
+
+def _open_distribution(chosen: dict, dest_dir: Path) -> BinaryIO:
+    """
+    fetch_distribution, returning an open handle instead of a path. Blobs are opened
+    under their entry lock, so eviction cannot delete one before a build has opened it,
+    and the handle keeps the data readable until the build is done with it. A blob
+    evicted between being fetched and being opened is fetched once more.
+    """
+    expected = chosen.get("digests", {}).get("sha256")
+    for _ in range(2):
+        local = fetch_distribution(chosen, dest_dir)
+        if not expected:
+            return open(local, "rb")
+        opened = _open_blob(expected)
+        if opened:
+            return opened
+    raise RuntimeError(f"{chosen['filename']} was evicted from the blob store while being fetched")
+
+
+def _download_blob(chosen: dict, blob: Path) -> Path:
+    filename = chosen["filename"]
+    expected = chosen["digests"]["sha256"]
+    log.info("Downloading %s", filename)
+    blob.parent.mkdir(parents=True, exist_ok=True)
+    fd, part_name = tempfile.mkstemp(dir=blob.parent, prefix=f".{expected}.", suffix=".part")
+    os.close(fd)
+    part = Path(part_name)
+    try:
+        if chosen.get("local_path"):
+            # Ingested wheel whose blob was evicted: re-publish it from the wheelhouse.
+            shutil.copyfile(chosen["local_path"], part)
+            return _publish_blob(part, blob, filename, expected)
+        if PARENT_URL and _blob_from_parent(chosen, part):
+            try:
+                published = _publish_blob(part, blob, filename, expected)
+                _count("parent_hits")
+                return published
+            except ValueError as e:
+                log.warning("Discarding %s from parent node: %s", filename, e)
+                _count("parent_misses")
+        _download(chosen["url"], part)
+        return _publish_blob(part, blob, filename, expected)
+    finally:
+        part.unlink(missing_ok=True)
+
+
+def _dist_name_version(filename: str) -> dict:
+    """{name, version} parsed from a wheel or sdist filename."""
+    if filename.endswith(".whl"):
+        name, version = filename.split("-")[:2]
+    else:
+        stem = filename[: -len(".tar.gz")] if filename.endswith(".tar.gz") else filename.rsplit(".", 1)[0]
+        name, _, version = stem.rpartition("-")
+    return {"name": name, "version": version}
+
+
+def _blob_from_parent(chosen: dict, part: Path) -> bool:
+    """Fetch a distribution into part from the parent node's blob store; the caller verifies it."""
+    query = urllib.parse.urlencode(_dist_name_version(chosen["filename"]))
+    with open(part, "wb") as out:
+        if _parent_get(f"/blob/{chosen['digests']['sha256']}?{query}", out) is None:
+            return False
+    log.info("Fetched %s from parent node", chosen["filename"])
+    return True
+
+
+def _publish_blob(part: Path, blob: Path, filename: str, expected: str) -> Path:
+    """Verify a downloaded file against its PyPI digest and move it into the blob store."""
+    with _timed("verify"):
+        actual = _sha256_file(part)
+    if actual != expected:
+        raise ValueError(f"SHA256 mismatch for {filename}: expected {expected}, got {actual}")
+    os.replace(part, blob)
+    signature = _file_signature(blob)
+    with _verified_guard:
+        _verified_files[f"blob:{expected}"] = (signature, expected, time.time())
+    _catalog_record(f"blob:{expected}", "blob", signature[1])
+    return blob
+
+
+def _select_distribution(pkg_files: list[dict], client_tags: list[str]) -> dict:
+    """Pick the best-match wheel, falling back to an sdist."""
     best = _best_wheel(pkg_files, client_tags)
     chosen = best or _sdist(pkg_files)
     if not chosen:
         raise RuntimeError("No compatible distribution found")
 
     dist_type = "wheel" if best else "sdist"
-    log.info("Downloading %s (%s)", chosen["filename"], dist_type)
-    
-    tmp = dest_dir / chosen["filename"]
-    _download(chosen["url"], tmp)
+    log.info("Fetching %s (%s)", chosen["filename"], dist_type)
+    return chosen
 
-    # Verify integrity
-    expected = chosen.get("digests", {}).get("sha256")
-    if expected:
-        actual = _sha256_file(tmp)
-        if actual != expected:
-            tmp.unlink()
-            raise ValueError(f"SHA256 mismatch for {chosen['filename']}: expected {expected}, got {actual}")
-    else:
-        log.warning("No SHA256 digest available for %s — skipping verification", chosen["filename"])
 
-    # Extract
-    if chosen["filename"].endswith(".whl") or chosen["filename"].endswith(".zip"):
-        with zipfile.ZipFile(tmp, "r") as z:
+def _extract_distribution(filename: str, local: Union[Path, BinaryIO], dest_dir: Path) -> int:
+    if filename.endswith(".whl") or filename.endswith(".zip"):
+        with zipfile.ZipFile(local, "r") as z:
             extracted_files = _safe_extract_zip(z, dest_dir)
-            log.debug("Extracted %d files from %s", extracted_files, chosen["filename"])
+            log.debug("Extracted %d files from %s", extracted_files, filename)
     else:
         import tarfile
-        with tarfile.open(tmp, "r:gz") as t:
+        with tarfile.open(local, "r:gz") if isinstance(local, Path) else tarfile.open(fileobj=local, mode="r:gz") as t:
             extracted_files = _safe_extract_tar(t, dest_dir)
-            log.debug("Extracted %d files from tarfile %s", extracted_files, chosen["filename"])
+            log.debug("Extracted %d files from tarfile %s", extracted_files, filename)
+    return extracted_files
+
+
+def download_package_to_dir(pkg_files: list[dict], client_tags: list[str], dest_dir: Path) -> str:
+    """Download best-match wheel (or sdist) into dest_dir. Returns chosen filename."""
+    chosen = _select_distribution(pkg_files, client_tags)
+    local = fetch_distribution(chosen, dest_dir)
+    try:
+        _extract_distribution(chosen["filename"], local, dest_dir)
+    finally:
+        if local.parent == dest_dir:
+            local.unlink(missing_ok=True)
 
-    tmp.unlink()
     return chosen["filename"]
 
 
 # ---------------------------------------------------------------------------
-# Cache layer
+# Bundling
 # ---------------------------------------------------------------------------
 
-def _cache_key(package: str, version: str, tags_str: str, with_deps: bool) -> str:
-    tag_hash = hashlib.sha256(tags_str.encode()).hexdigest()[:12]
-    dep_suffix = "-deps" if with_deps else ""
-    return f"{_normalize_name(package)}-{version}-{tag_hash}{dep_suffix}"
+class _BundleWriter(zipfile.ZipFile):
+    """
+    ZipFile that can also copy members from another archive without inflating
+    and re-deflating them: the compressed bytes are moved as-is and only the
+    local header is rewritten.
+    """
 
+    def write_raw(self, source: zipfile.ZipFile, info: zipfile.ZipInfo) -> None:
+        if info.flag_bits & 0x1:
+            raise ValueError(f"Refusing to copy encrypted zip member: {info.filename}")
+
+        src = source.fp
+        src.seek(info.header_offset)
+        header = src.read(zipfile.sizeFileHeader)
+        if len(header) != zipfile.sizeFileHeader or header[:4] != zipfile.stringFileHeader:
+            raise zipfile.BadZipFile(f"Bad local file header for {info.filename}")
+        name_len, extra_len = struct.unpack("<HH", header[26:30])
+        src.seek(name_len + extra_len, os.SEEK_CUR)
+
+        zinfo = zipfile.ZipInfo(info.filename, info.date_time)
+        zinfo.compress_type = info.compress_type
+        zinfo.CRC = info.CRC
+        zinfo.compress_size = info.compress_size
+        zinfo.file_size = info.file_size
+        zinfo.external_attr = info.external_attr
+        zinfo.create_system = info.create_system
+        # Sizes and CRC are known up front, so the copy never needs a trailing data descriptor.
+        zinfo.flag_bits = info.flag_bits & ~0x08
+
+        self._writecheck(zinfo)
+        self._didModify = True
+        zinfo.header_offset = self.fp.tell()
+        zip64 = zinfo.file_size > zipfile.ZIP64_LIMIT or zinfo.compress_size > zipfile.ZIP64_LIMIT
+        self.fp.write(zinfo.FileHeader(zip64))
 
-def cache_get(key: str) -> Optional[Path]:
-    meta_path = CACHE_DIR / f"{key}.json"
-    zip_path = CACHE_DIR / f"{key}.zip"
-    if not meta_path.exists() or not zip_path.exists():
-        return None
-    meta = json.loads(meta_path.read_text())
-    if _sha256_file(zip_path) != meta["sha256"]:
-        log.warning("Cache integrity fail for %s — evicting", key)
-        meta_path.unlink(missing_ok=True)
-        zip_path.unlink(missing_ok=True)
-        return None
-    return zip_path
+        try:
+            remaining = info.compress_size
+            while remaining > 0:
+                chunk = src.read(min(remaining, 1024 * 1024))
+                if not chunk:
+                    raise zipfile.BadZipFile(f"Truncated member data for {info.filename}")
+                self.fp.write(chunk)
+                remaining -= len(chunk)
+        except BaseException:
+            # Drop the half-written member so the central directory lands right after the last good one.
+            self.fp.seek(zinfo.header_offset)
+            self.fp.truncate()
+            raise
+
+        self.filelist.append(zinfo)
+        self.NameToInfo[zinfo.filename] = zinfo
+        self.start_dir = self.fp.tell()
+
+    def discard_from(self, index: int) -> None:
+        """Drop members index and later, e.g. what was written of a package that failed midway."""
+        if index >= len(self.filelist):
+            return
+        offset = self.filelist[index].header_offset
+        for zinfo in self.filelist[index:]:
+            self.NameToInfo.pop(zinfo.filename, None)
+        del self.filelist[index:]
+        self.fp.seek(offset)
+        self.fp.truncate()
+        self.start_dir = offset
+
+    def write_stored(self, source: zipfile.ZipFile, info: zipfile.ZipInfo) -> None:
+        """Copy a member from another archive, inflating it and storing it uncompressed."""
+        zinfo = zipfile.ZipInfo(info.filename, info.date_time)
+        zinfo.compress_type = zipfile.ZIP_STORED
+        zinfo.file_size = info.file_size
+        zinfo.external_attr = info.external_attr
+        zinfo.create_system = info.create_system
+
+        offset = self.fp.tell()
+        try:
+            with source.open(info) as src, self.open(zinfo, "w", force_zip64=info.file_size > zipfile.ZIP64_LIMIT) as dst:
+                shutil.copyfileobj(src, dst, 1024 * 1024)
+        except BaseException:
+            # As in write_raw: drop the partial member (the writer may already have registered it).
+            if self.filelist and self.filelist[-1].header_offset == offset:
+                self.NameToInfo.pop(self.filelist.pop().filename, None)
+            self.fp.seek(offset)
+            self.fp.truncate()
+            self.start_dir = offset
+            raise
+
+
+# Members that barely shrink under deflate: native code, archives, media.
+_STORED_SUFFIXES = frozenset({
+    ".so", ".pyd", ".dll", ".dylib", ".a", ".lib", ".whl", ".zip", ".egg", ".jar",
+    ".gz", ".tgz", ".bz2", ".xz", ".lzma", ".zst", ".7z", ".npz",
+    ".png", ".jpg", ".jpeg", ".gif", ".webp", ".ico", ".mp3", ".mp4", ".ogg", ".woff", ".woff2",
+})
+# Source and text members: small, highly compressible, worth the best ratio.
+_TEXT_SUFFIXES = frozenset({
+    ".py", ".pyi", ".pyx", ".pxd", ".c", ".h", ".cpp", ".hpp", ".txt", ".md", ".rst", ".json",
+    ".toml", ".cfg", ".ini", ".yaml", ".yml", ".xml", ".html", ".css", ".js", ".csv", ".typed",
+})
+
+
+def _compression_for(arcname: str, compression: str) -> tuple[int, Optional[int]]:
+    """(compress_type, compresslevel) for one bundle member under a compression policy."""
+    if compression == "stored":
+        return zipfile.ZIP_STORED, None
+    name = arcname.rsplit("/", 1)[-1].lower()
+    suffix = name[name.rfind("."):] if "." in name else ""
+    if suffix in _STORED_SUFFIXES or ".so." in name:
+        return zipfile.ZIP_STORED, None
+    if suffix in _TEXT_SUFFIXES or not suffix:  # METADATA, RECORD, LICENSE, ...
+        return zipfile.ZIP_DEFLATED, 9
+    return zipfile.ZIP_DEFLATED, 6
+
+
+def _add_source_to_bundle(
+    zf: _BundleWriter, source: Union[Path, BinaryIO], names: set[str], compression: str = "auto"
+) -> int:
+    """
+    Add one package to the bundle: wheels (a path or an open file) are copied entry-by-entry with the same
+    path checks as _safe_extract_zip; extracted sdist trees are compressed file by
+    file according to the compression policy. Wheel members keep the wheel's own
+    compression (copied without recompressing) unless the bundle is "stored".
+    Later duplicates of an archive name are skipped.
+    """
+    added = 0
+    if isinstance(source, Path) and source.is_dir():
+        for item in source.rglob("*"):
+            if not item.is_file():
+                continue
+            arcname = item.relative_to(source).as_posix()
+            if arcname in names:
+                log.debug("Skipping duplicate bundle entry %s", arcname)
+                continue
+            compress_type, compresslevel = _compression_for(arcname, compression)
+            try:
+                zf.write(item, arcname, compress_type=compress_type, compresslevel=compresslevel)
+            except Exception as e:
+                log.warning("Failed to add file %s to zip: %s", item, e)
+                continue
+            names.add(arcname)
+            added += 1
+        return added
 
+    with zipfile.ZipFile(source, "r") as wheel:
+        for info in wheel.infolist():
+            if not _check_zip_member(info):
+                continue
+            if info.filename in names:
+                log.debug("Skipping duplicate bundle entry %s", info.filename)
+                continue
+            if compression == "stored" and info.compress_type != zipfile.ZIP_STORED:
+                zf.write_stored(wheel, info)
+            else:
+                zf.write_raw(wheel, info)
+            names.add(info.filename)
+            added += 1
+    return added
+
+
+# ---------------------------------------------------------------------------
+# Cache layer
+# ---------------------------------------------------------------------------
+
+def _variant_suffix(with_deps: bool, compression: str) -> str:
+    return ("-deps" if with_deps else "") + ("" if compression == "auto" else f"-{compression}")
+
+
+def _cache_key(package: str, version: str, tags_str: str, with_deps: bool, compression: str = "auto") -> str:
+    tag_hash = hashlib.sha256(tags_str.encode()).hexdigest()[:12]
+    return f"{_normalize_name(package)}-{version}-{tag_hash}{_variant_suffix(with_deps, compression)}"
+
+
+def _batch_cache_key(roots: list[tuple[str, str]], tags_str: str, with_deps: bool, compression: str = "auto") -> str:
+    """One cache key for a whole batch: order-independent over its (name, resolved version) roots."""
+    ident = ",".join(sorted(f"{_normalize_name(name)}=={version}" for name, version in roots))
+    root_hash = hashlib.sha256(ident.encode()).hexdigest()[:16]
+    tag_hash = hashlib.sha256(tags_str.encode()).hexdigest()[:12]
+    return f"batch-{root_hash}-{tag_hash}{_variant_suffix(with_deps, compression)}"
+
+
+def _file_signature(path: Path) -> tuple[int, int, int]:
+    st = path.stat()
+    return st.st_ino, st.st_size, st.st_mtime_ns
+
+
+_CATALOG_SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    key TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    created REAL NOT NULL,
+    last_access REAL NOT NULL,
+    hits INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS entries_lru ON entries (last_access);
+CREATE INDEX IF NOT EXISTS entries_lfu ON entries (hits, last_access);
+
+CREATE TABLE IF NOT EXISTS totals (
+    kind TEXT PRIMARY KEY,
+    entries INTEGER NOT NULL,
+    bytes INTEGER NOT NULL
+);
+CREATE TRIGGER IF NOT EXISTS entries_insert AFTER INSERT ON entries BEGIN
+    INSERT INTO totals (kind, entries, bytes) VALUES (NEW.kind, 1, NEW.size)
+    ON CONFLICT (kind) DO UPDATE SET entries = entries + 1, bytes = bytes + NEW.size;
+END;
+CREATE TRIGGER IF NOT EXISTS entries_resize AFTER UPDATE OF size ON entries BEGIN
+    UPDATE totals SET bytes = bytes - OLD.size + NEW.size WHERE kind = NEW.kind;
+END;
+CREATE TRIGGER IF NOT EXISTS entries_delete AFTER DELETE ON entries BEGIN
+    UPDATE totals SET entries = entries - 1, bytes = bytes - OLD.size WHERE kind = OLD.kind;
+END;
+
+CREATE TABLE IF NOT EXISTS pins (
+    ident TEXT PRIMARY KEY,
+    key TEXT NOT NULL,
+    version TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS pins_key ON pins (key);
+
+CREATE TABLE IF NOT EXISTS prefetch_items (
+    job TEXT NOT NULL,
+    idx INTEGER NOT NULL,
+    created REAL NOT NULL,
+    name TEXT NOT NULL,
+    version TEXT,
+    tags TEXT NOT NULL,
+    deps INTEGER NOT NULL,
+    status TEXT NOT NULL,
+    resolved_version TEXT,
+    error TEXT,
+    PRIMARY KEY (job, idx)
+);
+CREATE INDEX IF NOT EXISTS prefetch_items_created ON prefetch_items (created);
+
+CREATE TABLE IF NOT EXISTS local_wheels (
+    filename TEXT PRIMARY KEY,
+    name TEXT NOT NULL,
+    version TEXT NOT NULL,
+    tags TEXT NOT NULL,
+    sha256 TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    path TEXT NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    requires_python TEXT,
+    requires_dist TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS local_wheels_name ON local_wheels (name);
+"""
+
+
+def _catalog() -> sqlite3.Connection:
+    """Per-thread (and per-process, for forked workers) autocommit connection to the catalog."""
+    conn = getattr(_catalog_local, "conn", None)
+    if conn is None or _catalog_local.pid != os.getpid():
+        conn = sqlite3.connect(CATALOG_PATH, timeout=30, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        _catalog_local.conn = conn
+        _catalog_local.pid = os.getpid()
+    return conn
+
+
+@contextmanager
+def _catalog_transaction():
+    db = _catalog()
+    db.execute("BEGIN IMMEDIATE")
+    try:
+        yield db
+    except BaseException:
+        db.execute("ROLLBACK")
+        raise
+    db.execute("COMMIT")
+
+
+def _catalog_record(key: str, kind: str, size: int) -> None:
+    now = time.time()
+    _catalog().execute(
+        "INSERT INTO entries (key, kind, size, created, last_access) VALUES (?, ?, ?, ?, ?) "
+        "ON CONFLICT (key) DO UPDATE SET size = excluded.size, last_access = excluded.last_access",
+        (key, kind, size, now, now),
+    )
 
-def _load_cached_bundle(key: str) -> Optional[tuple[BytesIO, list[dict]]]:
-    """Load a cached bundle and re-check its SHA256 before serving it."""
-    cached = cache_get(key)
-    if not cached:
-        return None
 
+def _catalog_touch(key: str) -> None:
+    _catalog().execute(
+        "UPDATE entries SET last_access = ?, hits = hits + 1 WHERE key = ?",
+        (time.time(), key),
+    )
+
+
+def _catalog_remove(key: str) -> None:
+    with _catalog_transaction() as db:
+        db.execute("DELETE FROM entries WHERE key = ?", (key,))
+        db.execute("DELETE FROM pins WHERE key = ?", (key,))
+
+
+def _catalog_rebuild() -> None:
+    """Reconcile the catalog with the bundles and blobs actually on disk."""
+    on_disk: dict[str, tuple[str, int, float]] = {}
+    for zip_path in CACHE_DIR.glob("*.zip"):
+        if zip_path.name.startswith(".") or not (CACHE_DIR / f"{zip_path.stem}.json").exists():
+            continue
+        st = zip_path.stat()
+        on_disk[zip_path.stem] = ("bundle", st.st_size, st.st_mtime)
+    for blob in BLOB_DIR.glob("*/*"):
+        if blob.name.startswith("."):
+            continue
+        st = blob.stat()
+        on_disk[f"blob:{blob.name}"] = ("blob", st.st_size, st.st_mtime)
+
+    with _catalog_transaction() as db:
+        known = dict(db.execute("SELECT key, size FROM entries").fetchall())
+        for key in known.keys() - on_disk.keys():
+            db.execute("DELETE FROM entries WHERE key = ?", (key,))
+            db.execute("DELETE FROM pins WHERE key = ?", (key,))
+        for key, (kind, size, mtime) in on_disk.items():
+            if key not in known:
+                db.execute(
+                    "INSERT INTO entries (key, kind, size, created, last_access) VALUES (?, ?, ?, ?, ?)",
+                    (key, kind, size, mtime, mtime),
+                )
+            elif known[key] != size:
+                db.execute("UPDATE entries SET size = ? WHERE key = ?", (size, key))
+    log.info("Cache catalog ready: %d entries on disk", len(on_disk))
+
+
+def _evict_bundle_files(key: str) -> None:
+    with _verified_guard:
+        _verified_files.pop(key, None)
+    for suffix in (".json", ".zip", ".manifest.json", ".members.json"):
+        (CACHE_DIR / f"{key}{suffix}").unlink(missing_ok=True)
+    _catalog_remove(key)
+
+
+def _evict_blob(sha256: str) -> None:
+    with _verified_guard:
+        _verified_files.pop(f"blob:{sha256}", None)
+    _blob_path(sha256).unlink(missing_ok=True)
+    _catalog_remove(f"blob:{sha256}")
+
+
+def cache_get(key: str, touch: bool = True) -> Optional[Path]:
+    """
+    Return the cached bundle path if it passes its SHA256 check.
+
+    The full re-hash only runs when the file's (inode, size, mtime) changed since the
+    last successful check, or when that check is older than SCRUB_INTERVAL seconds.
+    touch=False leaves the entry's access time and hit count alone.
+    """
     meta_path = CACHE_DIR / f"{key}.json"
-    manifest_path = CACHE_DIR / f"{key}.manifest.json"
-    meta = json.loads(meta_path.read_text())
+    zip_path = CACHE_DIR / f"{key}.zip"
+    try:
+        meta = json.loads(meta_path.read_text())
+        signature = _file_signature(zip_path)
+    except (OSError, ValueError):
+        return None
 
-    # Re-hash the cached archive at serve time so a tampered file is caught even after the first download.
-    data = cached.read_bytes()
-    actual = hashlib.sha256(data).hexdigest()
+    now = time.time()
+    with _verified_guard:
+        verified = _verified_files.get(key)
+    if (
+        verified
+        and verified[0] == signature
+        and verified[1] == meta["sha256"]
+        and now - verified[2] < SCRUB_INTERVAL
+    ):
+        if touch:
+            _catalog_touch(key)
+        return zip_path
+
+    with _timed("verify"):
+        actual = _sha256_file(zip_path)
     if actual != meta["sha256"]:
-        log.warning("Cache integrity fail for %s on serve — evicting", key)
-        meta_path.unlink(missing_ok=True)
-        cached.unlink(missing_ok=True)
-        manifest_path.unlink(missing_ok=True)
+        log.warning("Cache integrity fail for %s — evicting", key)
+        _evict_bundle_files(key)
         return None
+    with _verified_guard:
+        _verified_files[key] = (signature, meta["sha256"], now)
+    if touch:
+        _catalog_touch(key)
+    return zip_path
+
 
+def _load_cached_bundle(key: str) -> Optional[tuple[Path, list[dict]]]:
+    """Return a verified cached bundle path and its manifest, ready to be streamed from disk."""
+    cached = cache_get(key)
+    if not cached:
+        return None
+
+    manifest_path = CACHE_DIR / f"{key}.manifest.json"
     manifest = json.loads(manifest_path.read_text()) if manifest_path.exists() else []
-    return BytesIO(data), manifest
+    return cached, manifest
 
 
-def cache_put(key: str, zip_path: Path) -> Path:
+def _open_bundle(bundle_path: Path) -> Optional[tuple[BinaryIO, str]]:
+    """
+    Verify a cached bundle and open it for serving: (file, sha256), or None when it is
+    gone or fails its check. Both steps run under a shared lock on the entry, which
+    _evict_if_needed will not delete from under, so a verified hit cannot vanish before
+    it is opened; once open, a later eviction no longer affects the response.
+    """
+    key = bundle_path.stem
+    with _file_lock(f"entry-{key}", shared=True):
+        if cache_get(key, touch=False) is None:
+            return None
+        return open(bundle_path, "rb"), _bundle_sha256(bundle_path)
+
+
+def _open_blob(sha256: str) -> Optional[BinaryIO]:
+    """Counterpart of _open_bundle for the blob store."""
+    blob = _blob_path(sha256)
+    with _file_lock(f"entry-blob:{sha256}", shared=True):
+        if not _blob_is_valid(blob, sha256):
+            return None
+        return open(blob, "rb")
+
+
+def cache_put(
+    key: str,
+    zip_path: Path,
+    manifest: Optional[list[dict]] = None,
+    members: Optional[dict[str, list[str]]] = None,
+) -> Path:
+    """
+    Publish a bundle atomically: the archive, manifest and member index (package name ->
+    archive entries) are renamed into place first and the .json metadata last, so readers
+    never see a half-written entry.
+    """
     dest = CACHE_DIR / f"{key}.zip"
-    shutil.copy2(zip_path, dest)
-    sha = _sha256_file(dest)
+    fd, part_name = tempfile.mkstemp(dir=CACHE_DIR, prefix=f".{key}.", suffix=".part")
+    os.close(fd)
+    try:
+        shutil.copy2(zip_path, part_name)
+        sha = _sha256_file(Path(part_name))
+        os.replace(part_name, dest)
+    finally:
+        Path(part_name).unlink(missing_ok=True)
+
+    if manifest is not None:
+        _atomic_write_text(CACHE_DIR / f"{key}.manifest.json", json.dumps(manifest))
+    if members is not None:
+        _atomic_write_text(CACHE_DIR / f"{key}.members.json", json.dumps(members))
     meta = {"sha256": sha, "created": time.time()}
-    (CACHE_DIR / f"{key}.json").write_text(json.dumps(meta))
+    _atomic_write_text(CACHE_DIR / f"{key}.json", json.dumps(meta))
+    signature = _file_signature(dest)
+    with _verified_guard:
+        _verified_files[key] = (signature, sha, time.time())
+    _catalog_record(key, "bundle", signature[1])
     _evict_if_needed()
     return dest
 
 
+def _pin_ident(package: str, version: str, tags_str: str, with_deps: bool, compression: str = "auto") -> str:
+    parts = [_normalize_name(package), version, tags_str, "deps" if with_deps else "nodeps"]
+    if compression != "auto":
+        parts.append(compression)
+    ident = "\0".join(parts)
+    return hashlib.sha256(ident.encode()).hexdigest()[:32]
+
+
+def _pin_index_put(
+    package: str, version: str, tags_str: str, with_deps: bool, compression: str, key: str, resolved_version: str
+) -> None:
+    try:
+        _catalog().execute(
+            "INSERT INTO pins (ident, key, version) VALUES (?, ?, ?) "
+            "ON CONFLICT (ident) DO UPDATE SET key = excluded.key, version = excluded.version",
+            (_pin_ident(package, version, tags_str, with_deps, compression), key, resolved_version),
+        )
+    except sqlite3.Error as e:
+        log.warning("Could not record pinned index entry for %s==%s: %s", package, version, e)
+
+
+def _pinned_cache_lookup(
+    package: str, version: str, tags_str: str, with_deps: bool, compression: str = "auto"
+) -> Optional[tuple[Path, str, list[dict]]]:
+    """Serve a pinned request straight from disk, without asking PyPI what the version resolves to."""
+    ident = _pin_ident(package, version, tags_str, with_deps, compression)
+    row = _catalog().execute("SELECT key, version FROM pins WHERE ident = ?", (ident,)).fetchone()
+    if row is None:
+        return None
+
+    key, resolved_version = row
+    cached_bundle = _load_cached_bundle(key)
+    if not cached_bundle:
+        _catalog().execute("DELETE FROM pins WHERE ident = ?", (ident,))
+        return None
+    log.info("Pinned cache hit: %s", key)
+    return cached_bundle[0], resolved_version, cached_bundle[1]
+
+
 def _evict_if_needed():
-    """Simple LRU-ish eviction: remove oldest .zip files if over budget."""
-    zips = sorted(CACHE_DIR.glob("*.zip"), key=lambda p: p.stat().st_mtime)
-    total = sum(p.stat().st_size for p in zips)
-    while total > MAX_CACHE_BYTES and zips:
-        victim = zips.pop(0)
-        size = victim.stat().st_size
-        victim.unlink(missing_ok=True)
-        (CACHE_DIR / f"{victim.stem}.json").unlink(missing_ok=True)
-        total -= size
-        log.info("Evicted cache entry %s (%d MB)", victim.stem, size // 1024 // 1024)
+    """
+    Evict the least recently (or, with WHISPY_EVICTION_POLICY=lfu, least frequently)
+    used bundles and blobs until the cache fits MAX_CACHE_BYTES. Each step is an
+    indexed catalog lookup rather than a directory scan. Entries that a request is
+    verifying and opening right now (see _open_bundle) are skipped this round.
+    """
+    order = "hits, last_access" if EVICTION_POLICY == "lfu" else "last_access"
+    db = _catalog()
+    busy = 0
+    while True:
+        total = db.execute("SELECT COALESCE(SUM(bytes), 0) FROM totals").fetchone()[0]
+        if total <= MAX_CACHE_BYTES:
+            return
+        victim = db.execute(
+            f"SELECT key, kind, size FROM entries ORDER BY {order} LIMIT 1 OFFSET ?", (busy,)
+        ).fetchone()
+        if victim is None:
+            return
+
+        key, kind, size = victim
+        with _file_lock(f"entry-{key}", wait=False) as locked:
+            if not locked:
+                busy += 1
+                continue
+            if kind == "blob":
+                _evict_blob(key.split(":", 1)[1])
+            else:
+                _evict_bundle_files(key)
+        log.info("Evicted cache entry %s (%d MB)", key, size // 1024 // 1024)
+
+
+def _catalog_init() -> None:
+    """Create the catalog schema and reconcile it with the cache directory (runs at startup)."""
+    with _file_lock("catalog-init"):
+        db = _catalog()
+        db.executescript(_CATALOG_SCHEMA)
+        # Catalogs created before prefetch items recorded their owning process.
+        if "worker" not in {row[1] for row in db.execute("PRAGMA table_info(prefetch_items)")}:
+            db.execute("ALTER TABLE prefetch_items ADD COLUMN worker TEXT")
+        _catalog_rebuild()
+
+
+def init_cache() -> None:
+    """
+    Create the cache directories and catalog and reconcile them with what is on disk.
+    Runs once per process: before its first request, or from the CLI and ASGI
+    startup. Importing app.py does not touch the filesystem.
+    """
+    global _cache_ready
+    with _init_guard:
+        if _cache_ready:
+            return
+        for directory in (CACHE_DIR, METADATA_DIR, GRAPH_DIR, LOCK_DIR, BLOB_DIR):
+            directory.mkdir(parents=True, exist_ok=True)
+        _catalog_init()
+        _prune_graph_cache()
+        _fail_orphaned_prefetch_items()
+        _prune_lock_files()
+        _cache_ready = True
 
 
 # ---------------------------------------------------------------------------
 # Core fetch logic
 # ---------------------------------------------------------------------------
 
+class _BundleStream:
+    """
+    Hand-off between a background bundle build and the response streaming it.
+
+    The builder only advances `available` past complete archive members, so every
+    byte the reader sends is final even though ZipFile seeks back to patch headers.
+    """
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.resolved_version: Optional[str] = None
+        self.started = False
+        self.finished = False
+        self.available = 0
+        self.result: Optional[tuple[Path, str, list[dict]]] = None
+        self.error: Optional[BaseException] = None
+        self._cond = threading.Condition()
+
+    def start(self, resolved_version: str) -> None:
+        with self._cond:
+            self.resolved_version = resolved_version
+            self.started = True
+            self._cond.notify_all()
+
+    def advance(self, offset: int) -> None:
+        with self._cond:
+            self.available = offset
+            self._cond.notify_all()
+
+    def finish(self, result=None, error: Optional[BaseException] = None) -> None:
+        with self._cond:
+            self.finished = True
+            self.result = result
+            self.error = error
+            self._cond.notify_all()
+
+    def wait_started(self) -> None:
+        with self._cond:
+            self._cond.wait_for(lambda: self.started or self.finished)
+
+    def chunks(self, fh, chunk_size: int = 1024 * 1024):
+        sent = 0
+        try:
+            while True:
+                with self._cond:
+                    self._cond.wait_for(lambda: self.available > sent or self.finished)
+                    available, finished, error = self.available, self.finished, self.error
+                if available > sent:
+                    data = fh.read(min(available - sent, chunk_size))
+                    sent += len(data)
+                    _count("bytes_served", len(data))
+                    yield data
+                    continue
+                if error is not None:
+                    raise RuntimeError(f"Streamed build failed: {error}")
+                if finished:
+                    return
+        finally:
+            fh.close()
+
+
+def _fetch_package_source(
+    pkg: dict, client_tags: list[str], tmp: Path
+) -> Optional[tuple[dict, Union[Path, BinaryIO]]]:
+    """
+    Fetch one resolved package for bundling. Returns its manifest entry and source:
+    the verified wheel file, open (the caller closes it once it has been copied into
+    the bundle), or a directory holding an extracted sdist. Failures are logged and
+    isolated to this package.
+    """
+    pkg_dir = tmp / pkg["name"]
+    pkg_dir.mkdir()
+    opened = None
+    try:
+        chosen = _select_distribution(pkg["files"], client_tags)
+        chosen_filename = chosen["filename"]
+        sha = chosen.get("digests", {}).get("sha256")
+        opened = _open_distribution(chosen, pkg_dir)
+
+        if chosen_filename.endswith(".whl"):
+            # Wheels are copied into the bundle entry-by-entry later; just validate them here.
+            with _timed("extract"), zipfile.ZipFile(opened, "r") as wheel:
+                files_count = sum(1 for info in wheel.infolist() if _check_zip_member(info))
+            source = opened
+        else:
+            try:
+                with _timed("extract"):
+                    files_count = _extract_distribution(chosen_filename, opened, pkg_dir)
+            finally:
+                opened.close()
+                local = Path(opened.name)
+                if local.parent == pkg_dir:
+                    local.unlink(missing_ok=True)
+            source = pkg_dir
+
+        # Validate that the distribution actually contains files.
+        if files_count == 0:
+            raise RuntimeError(f"No files found in {chosen_filename}")
+
+        log.info("Prepared %d files from %s for %s", files_count, chosen_filename, pkg["name"])
+        entry = {
+            "name": pkg["name"],
+            "version": pkg["version"],
+            "filename": chosen_filename,
+            "sha256": sha,
+            "items_extracted": files_count,
+        }
+        return entry, source
+    except Exception as e:
+        log.error("Could not fetch %s: %s", pkg["name"], e, exc_info=True)
+        if opened is not None:
+            opened.close()
+        shutil.rmtree(pkg_dir, ignore_errors=True)
+        return None
+
+
 def fetch_package_zip(
     package: str,
     version: Optional[str],
     client_tags: list[str],
     with_deps: bool,
-) -> tuple[BytesIO, str, list[dict]]:
+    stream: Optional["_BundleStream"] = None,
+    compression: str = "auto",
+) -> tuple[Path, str, list[dict]]:
     """
-    Returns (zip_buffer, resolved_version, manifest).
+    Returns (bundle_path, resolved_version, manifest).
     manifest is a list of {name, version, sha256} dicts.
+    compression is one of BUNDLE_COMPRESSIONS; each variant is cached separately.
+
+    Cache reads never wait on a build. Concurrent misses for the same cache key
+    share a single build; misses for different keys build in parallel.
+
+    With a stream, a cold build is written to stream.path and its progress is
+    published as it goes so the response can start before the build finishes.
+    A request that joins a build already in flight waits for its result instead.
     """
     if _normalize_name(package) in BLOCKLIST:
         raise ValueError(f"Package '{package}' is blocklisted")
 
-    package_lock = _get_package_lock(package)
-    with package_lock:
-        # Resolve metadata inside the lock so only one request for the same package can build the same cache entry.
-        meta = fetch_pypi_metadata(package, version)
-        resolved_version = meta["info"]["version"]
-        tags_str = ",".join(client_tags)
-        key = _cache_key(package, resolved_version, tags_str, with_deps)
+    tags_str = ",".join(client_tags)
+
+    # Pinned warm hits are answered from the local index without touching the network.
+    if version:
+        pinned = _pinned_cache_lookup(package, version, tags_str, with_deps, compression)
+        if pinned:
+            _count("cache_hits")
+            return pinned
+
+    meta = fetch_pypi_metadata(package, version)
+    resolved_version = meta["info"]["version"]
+    key = _cache_key(package, resolved_version, tags_str, with_deps, compression)
+
+    cached_bundle = _load_cached_bundle(key)
+    if cached_bundle:
+        log.info("Cache hit: %s", key)
+        _count("cache_hits")
+        result = cached_bundle[0], resolved_version, cached_bundle[1]
+    else:
+        _count("cache_misses")
+        roots = [(package, resolved_version, meta)]
+        bundle_path, manifest = _single_flight(
+            f"bundle:{key}",
+            lambda: _build_bundle(key, roots, client_tags, with_deps, stream, compression),
+        )
+        result = bundle_path, resolved_version, manifest
 
+    if version:
+        _pin_index_put(package, version, tags_str, with_deps, compression, key, resolved_version)
+    return result
+
+
+def _build_bundle(
+    key: str,
+    roots: list[tuple[str, str, dict]],
+    client_tags: list[str],
+    with_deps: bool,
+    stream: Optional["_BundleStream"] = None,
+    compression: str = "auto",
+) -> tuple[Path, list[dict]]:
+    """
+    Build, cache and return (bundle_path, manifest) for key from the given
+    (package, resolved_version, metadata) roots. Threads serialize per key via
+    _single_flight; worker processes via a per-key file lock.
+    """
+    with _file_lock(f"bundle-{key}"):
+        # Another thread or worker may have published this key while we waited.
         cached_bundle = _load_cached_bundle(key)
         if cached_bundle:
             log.info("Cache hit: %s", key)
-            return cached_bundle[0], resolved_version, cached_bundle[1]
+            return cached_bundle
+        return _build_bundle_locked(key, roots, client_tags, with_deps, stream, compression)
+
+
+def _bundle_packages(roots: list[tuple[str, str, dict]], with_deps: bool) -> list[dict]:
+    """The {name, version, files} package set for a bundle built from the given roots."""
+    if with_deps:
+        return resolve_graph([(name, version) for name, version, _ in roots])
+    return [
+        {
+            "name": _normalize_name(name),
+            "version": version,
+            "files": meta.get("releases", {}).get(version, []) or meta.get("urls", []),
+        }
+        for name, version, meta in roots
+    ]
 
-        # Build package set
-        if with_deps:
-            pkg_list = resolve_dependencies(package, resolved_version)
-        else:
-            pkg_list = [{
-                "name": _normalize_name(package),
-                "version": resolved_version,
-                "files": meta.get("releases", {}).get(resolved_version, []) or meta.get("urls", []),
-            }]
-
-        manifest = []
-        with tempfile.TemporaryDirectory() as tmpdir:
-            tmp = Path(tmpdir)
-
-            for pkg in pkg_list:
-                pkg_dir = tmp / pkg["name"]
-                pkg_dir.mkdir()
-                try:
-                    chosen_filename = download_package_to_dir(pkg["files"], client_tags, pkg_dir)
-                    sha = None
-                    for f in pkg["files"]:
-                        if f["filename"] == chosen_filename:
-                            sha = f.get("digests", {}).get("sha256")
-                            break
-
-                    # Validate that files were actually extracted.
-                    extracted_items = list(pkg_dir.rglob("*"))
-                    files_count = len([f for f in extracted_items if f.is_file()])
-                    if files_count == 0:
-                        raise RuntimeError(f"No files extracted from {chosen_filename} (extracted {len(extracted_items)} total items)")
-
-                    manifest.append({
-                        "name": pkg["name"],
-                        "version": pkg["version"],
-                        "filename": chosen_filename,
-                        "sha256": sha,
-                        "items_extracted": files_count,
-                    })
-                    log.info("Successfully extracted %d files from %s for %s", files_count, chosen_filename, pkg["name"])
-                except Exception as e:
-                    log.error("Could not fetch %s: %s", pkg["name"], e, exc_info=True)
-
-            # Check if any packages were successfully extracted.
-            if not manifest:
-                raise RuntimeError(f"No packages were successfully downloaded for {package}. Check server logs for details.")
-
-            # Zip everything up.
-            zip_tmp = tmp / "bundle.zip"
-            with zipfile.ZipFile(zip_tmp, "w", zipfile.ZIP_DEFLATED) as zf:
-                file_count = 0
-                for item in tmp.rglob("*"):
-                    if item == zip_tmp or not item.is_file():
+
+def _build_bundle_locked(
+    key: str,
+    roots: list[tuple[str, str, dict]],
+    client_tags: list[str],
+    with_deps: bool,
+    stream: Optional["_BundleStream"] = None,
+    compression: str = "auto",
+) -> tuple[Path, list[dict]]:
+    package = ", ".join(name for name, _, _ in roots)
+    resolved_version = ", ".join(version for _, version, _ in roots)
+    pkg_list = _bundle_packages(roots, with_deps)
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        tmp = Path(tmpdir)
+        zip_tmp = stream.path if stream else tmp / "bundle.zip"
+        if stream:
+            stream.start(resolved_version)
+
+        # Downloads are I/O bound; fetch them concurrently. All modules land at the bundle root.
+        workers = max(1, min(DOWNLOAD_WORKERS, len(pkg_list)))
+        names: set[str] = set()
+        members: dict[str, list[str]] = {}
+        file_count = 0
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="whispy-dl") as pool:
+            futures = [pool.submit(_fetch_package_source, pkg, client_tags, tmp) for pkg in pkg_list]
+            with _BundleWriter(zip_tmp, "w", zipfile.ZIP_DEFLATED) as zf:
+                # A streamed build appends each package as soon as it is ready; otherwise keep resolution order.
+                for future in as_completed(futures) if stream else futures:
+                    result = future.result()
+                    if result is None:
                         continue
-                    # Strip the per-package subdir so all modules land at root.
+                    entry, source = result
+                    first_member = len(zf.filelist)
                     try:
-                        pkg_name = item.relative_to(tmp).parts[0]
-                        arcname = item.relative_to(tmp / pkg_name)
-                        zf.write(item, arcname)
-                        file_count += 1
-                    except Exception as e:
-                        log.warning("Failed to add file %s to zip: %s", item, e)
+                        with _timed("zip"):
+                            file_count += _add_source_to_bundle(zf, source, names, compression)
+                    except (OSError, ValueError, zipfile.BadZipFile) as e:
+                        # Leave the package out entirely: a manifest entry for a partial copy would
+                        # let clients record its digest as held and drop it from every later delta.
+                        log.warning("Failed to add %s to zip, leaving it out: %s", entry["filename"], e)
+                        names.difference_update(info.filename for info in zf.filelist[first_member:])
+                        zf.discard_from(first_member)
                         continue
+                    finally:
+                        if not isinstance(source, Path):
+                            source.close()
+                    members[entry["name"]] = [info.filename for info in zf.filelist[first_member:]]
+                    if stream:
+                        zf.fp.flush()
+                        stream.advance(zf.fp.tell())
+
+        # The manifest keeps resolution order regardless of completion order, and lists only
+        # the packages that made it into the archive.
+        manifest = [
+            future.result()[0] for future in futures
+            if future.result() is not None and future.result()[0]["name"] in members
+        ]
+        if stream:
+            stream.advance(zip_tmp.stat().st_size)
+
+        # Check if any packages were successfully fetched.
+        if not manifest:
+            raise RuntimeError(f"No packages were successfully downloaded for {package}. Check server logs for details.")
+
+        log.info("Zipped %d files for package %s v%s", file_count, package, resolved_version)
+
+        if file_count == 0:
+            raise RuntimeError(f"No files were added to the package bundle for {package}. Extracted {sum(m['items_extracted'] for m in manifest)} files but zip is empty.")
+
+        # The manifest is saved alongside the archive so later requests can serve it without re-fetching;
+        # the member index lets delta bundles be cut from this archive without rebuilding.
+        with _timed("cache_write"):
+            cache_put(key, zip_tmp, manifest, members)
+
+    cached_bundle = _load_cached_bundle(key)
+    if not cached_bundle:
+        raise RuntimeError(f"Cache verification failed immediately after writing {key}")
+    return cached_bundle
+
+
+def fetch_batch_zip(
+    specs: list[tuple[str, Optional[str]]],
+    client_tags: list[str],
+    with_deps: bool,
+    compression: str = "auto",
+) -> tuple[Path, dict[str, str], list[dict]]:
+    """
+    Returns (bundle_path, {name: resolved_version}, manifest) for several packages
+    bundled together. The roots are resolved as one graph so shared dependencies
+    ship once, and the bundle is cached under a single key for the whole set.
+    """
+    names = [_normalize_name(name) for name, _ in specs]
+    for name in names:
+        if name in BLOCKLIST:
+            raise ValueError(f"Package '{name}' is blocklisted")
+    if len(set(names)) != len(names):
+        raise ValueError("Each package may appear only once in a batch")
+
+    with ThreadPoolExecutor(max_workers=max(1, min(RESOLVE_WORKERS, len(specs)))) as pool:
+        metas = list(pool.map(lambda spec: fetch_pypi_metadata(*spec), specs))
+    roots = [(name, meta["info"]["version"], meta) for (name, _), meta in zip(specs, metas)]
+    resolved_versions = {_normalize_name(name): version for name, version, _ in roots}
+    key = _batch_cache_key(
+        [(name, version) for name, version, _ in roots], ",".join(client_tags), with_deps, compression
+    )
 
-            log.info("Zipped %d files for package %s v%s", file_count, package, resolved_version)
+    cached_bundle = _load_cached_bundle(key)
+    if cached_bundle:
+        log.info("Cache hit: %s", key)
+        _count("cache_hits")
+        bundle_path, manifest = cached_bundle
+    else:
+        _count("cache_misses")
+        bundle_path, manifest = _single_flight(
+            f"bundle:{key}",
+            lambda: _build_bundle(key, roots, client_tags, with_deps, compression=compression),
+        )
+    return bundle_path, resolved_versions, manifest
+
+
+def resolve_plan(package: str, version: Optional[str], client_tags: list[str], with_deps: bool) -> dict:
+    """
+    Resolve a package exactly as /get_package would, without downloading or bundling
+    anything. Each item names the chosen distribution and where the client fetches it:
+    wheels come one by one from /blob/<sha256>, and a package that only ships an sdist
+    falls back to its own single-package bundle from /get_package.
+    """
+    if _normalize_name(package) in BLOCKLIST:
+        raise ValueError(f"Package '{package}' is blocklisted")
 
-            if file_count == 0:
-                raise RuntimeError(f"No files were added to the package bundle for {package}. Extracted {sum(m['items_extracted'] for m in manifest)} files but zip is empty.")
+    meta = fetch_pypi_metadata(package, version)
+    resolved_version = meta["info"]["version"]
+    tags_str = ",".join(client_tags)
+    items = []
+    for pkg in _bundle_packages([(package, resolved_version, meta)], with_deps):
+        chosen = _best_wheel(pkg["files"], client_tags) or _sdist(pkg["files"])
+        if not chosen:
+            log.warning("No compatible distribution for %s==%s, leaving it out of the plan", pkg["name"], pkg["version"])
+            continue
+        sha = chosen.get("digests", {}).get("sha256")
+        item = {
+            "name": pkg["name"],
+            "version": pkg["version"],
+            "filename": chosen["filename"],
+            "sha256": sha,
+            "size": chosen.get("size"),
+        }
+        query = {"name": pkg["name"], "version": pkg["version"]}
+        if sha and chosen["filename"].endswith(".whl"):
+            item["format"] = "wheel"
+            item["url"] = f"/blob/{sha}?{urllib.parse.urlencode(query)}"
+        else:
+            item["format"] = "bundle"
+            item["url"] = f"/get_package?{urllib.parse.urlencode({**query, 'tags': tags_str, 'deps': '0'})}"
+        items.append(item)
+    return {"package": _normalize_name(package), "version": resolved_version, "items": items}
 
-            cache_put(key, zip_tmp)
 
-            # Save manifest alongside the cached archive so later requests can serve it without re-fetching.
-            manifest_path = CACHE_DIR / f"{key}.manifest.json"
-            manifest_path.write_text(json.dumps(manifest))
+def fetch_blob(sha256: str, package: Optional[str], version: Optional[str]) -> Path:
+    """
+    Return the blob-store path of a distribution by digest. A blob that is not stored
+    yet is downloaded on demand, looked up in the given package release's file list.
+    """
+    blob = _blob_path(sha256)
+    if blob.exists() and _blob_is_valid(blob, sha256):
+        _catalog_touch(f"blob:{sha256}")
+        return blob
+    if not package or not version:
+        raise FileNotFoundError(sha256)
+    if _normalize_name(package) in BLOCKLIST:
+        raise ValueError(f"Package '{package}' is blocklisted")
 
-        cached_bundle = _load_cached_bundle(key)
-        if not cached_bundle:
-            raise RuntimeError(f"Cache verification failed immediately after writing {key}")
-        return cached_bundle[0], resolved_version, cached_bundle[1]
+    meta = fetch_pypi_metadata(package, version)
+    files = meta.get("releases", {}).get(meta["info"]["version"], []) or meta.get("urls", [])
+    chosen = next((f for f in files if f.get("digests", {}).get("sha256") == sha256), None)
+    if chosen is None:
+        raise FileNotFoundError(sha256)
+    with tempfile.TemporaryDirectory() as tmpdir:
+        return fetch_distribution(chosen, Path(tmpdir))
+
+
+def _parse_have(raw: str) -> set[str]:
+    """
+    Held wheel digests from ?have=: comma-separated sha256 hex, full or a prefix of at
+    least 16 chars. Raises ValueError for more than DELTA_MAX_HAVE entries.
+    """
+    digests = {d.strip().lower() for d in raw.split(",") if d.strip()}
+    if len(digests) > DELTA_MAX_HAVE:
+        raise ValueError(f"'have' may list at most {DELTA_MAX_HAVE} digests")
+    return {d for d in digests if len(d) >= DELTA_MIN_DIGEST and re.fullmatch(r"[0-9a-f]+", d)}
+
+
+def _delta_variants(key: str) -> int:
+    """How many delta variants of the bundle key are cached."""
+    prefix = f"{key}-delta-"
+    # A primary-key range scan; "~" sorts after every character a delta key can contain.
+    return _catalog().execute(
+        "SELECT COUNT(*) FROM entries WHERE key > ? AND key < ?", (prefix, prefix + "~")
+    ).fetchone()[0]
+
+
+def delta_bundle(
+    bundle_path: Path, manifest: list[dict], have: set[str], roots: frozenset[str] = frozenset()
+) -> Optional[tuple[Path, list[str]]]:
+    """
+    Cut a bundle down to the packages whose distribution digest is not in `have`.
+    The requested root packages (normalized names in `roots`) are always kept: a
+    delta only ever leaves out dependencies the client already holds.
+    Returns (delta_path, omitted package names), or None when nothing can be
+    omitted or the bundle predates the member index (serve it whole).
+    Members are copied raw from the cached bundle, and each distinct delta is
+    cached under its own key so a fleet upgrading the same package shares it, up
+    to DELTA_MAX_VARIANTS per bundle.
+    """
+    held = sorted(
+        entry["name"] for entry in manifest
+        if entry.get("sha256") and _normalize_name(entry["name"]) not in roots
+        and any(entry["sha256"].startswith(digest) for digest in have)
+    )
+    if not held:
+        return None
+
+    key = bundle_path.stem
+    try:
+        members = json.loads((CACHE_DIR / f"{key}.members.json").read_text())
+    except (OSError, ValueError):
+        return None
+    delta_key = f"{key}-delta-{hashlib.sha256(','.join(held).encode()).hexdigest()[:12]}"
+
+    cached = _load_cached_bundle(delta_key)
+    if cached:
+        return cached[0], held
+
+    def _build_delta() -> Optional[Path]:
+        with _file_lock(f"bundle-{delta_key}"):
+            cached = _load_cached_bundle(delta_key)
+            if cached:
+                return cached[0]
+            if _delta_variants(key) >= DELTA_MAX_VARIANTS:
+                log.info("Bundle %s already has %d cached deltas, serving it whole", key, DELTA_MAX_VARIANTS)
+                return None
+            opened = _open_bundle(bundle_path)
+            if opened is None:
+                return None
+            with tempfile.TemporaryDirectory() as tmpdir:
+                delta_tmp = Path(tmpdir) / "delta.zip"
+                with opened[0] as base, zipfile.ZipFile(base) as full, _BundleWriter(delta_tmp, "w") as zf:
+                    for entry in manifest:
+                        if entry["name"] in held:
+                            continue
+                        for name in members.get(entry["name"], []):
+                            zf.write_raw(full, full.getinfo(name))
+                return cache_put(delta_key, delta_tmp, manifest)
+
+    delta_path = _single_flight(f"bundle:{delta_key}", _build_delta)
+    return (delta_path, held) if delta_path else None
+
+
+# ---------------------------------------------------------------------------
+# Local wheelhouse
+# ---------------------------------------------------------------------------
+
+def _local_metadata(name: str, version: Optional[str]) -> Optional[dict]:
+    """
+    A PyPI-shaped JSON document built from the ingested wheels of one project, or None.
+    Without a version the highest ingested release is used, as PyPI's latest would be.
+    """
+    rows = _catalog().execute(
+        "SELECT filename, version, sha256, size, path, requires_python, requires_dist "
+        "FROM local_wheels WHERE name = ?",
+        (name,),
+    ).fetchall()
+    releases: dict[str, list[dict]] = {}
+    requirements: dict[str, tuple[Optional[str], list[str]]] = {}
+    for filename, release, sha, size, path, requires_python, requires_dist in rows:
+        releases.setdefault(release, []).append({
+            "filename": filename,
+            "url": Path(path).as_uri(),
+            "local_path": path,
+            "digests": {"sha256": sha},
+            "size": size,
+            "requires_python": requires_python,
+            "yanked": False,
+        })
+        requirements[release] = (requires_python, json.loads(requires_dist))
+    if not releases or (version and version not in releases):
+        return None
+
+    chosen = version or _latest_version(releases)
+    if chosen is None:
+        return None
+    requires_python, requires_dist = requirements[chosen]
+    return {
+        "info": {
+            "name": name,
+            "version": chosen,
+            "summary": "",
+            "requires_python": requires_python,
+            "requires_dist": requires_dist or None,
+            "license": None,
+            "home_page": None,
+            "project_urls": None,
+        },
+        "urls": releases[chosen],
+        "releases": releases,
+    }
+
+
+def _ingest_wheel(path: Path) -> tuple:
+    """
+    Verify one wheel (readable archive, METADATA naming the same project as the
+    filename), store it in the blob store and return its local_wheels row.
+    """
+    parts = path.name[:-len(".whl")].split("-")
+    if len(parts) not in (5, 6):
+        raise ValueError("not a valid wheel filename")
+    name, version, tags = _normalize_name(parts[0]), parts[1], "-".join(parts[-3:])
+
+    with zipfile.ZipFile(path) as wheel:
+        for info in wheel.infolist():
+            _check_zip_member(info)
+        metadata_names = [n for n in wheel.namelist() if n.count("/") == 1 and n.endswith(".dist-info/METADATA")]
+        if not metadata_names:
+            raise ValueError("no .dist-info/METADATA")
+        metadata = email.parser.Parser().parsestr(wheel.read(metadata_names[0]).decode("utf-8", "replace"))
+    if _normalize_name(metadata.get("Name", "")) != name:
+        raise ValueError(f"METADATA names {metadata.get('Name')!r}, not {name!r}")
+
+    st = path.stat()
+    sha = _sha256_file(path)
+    blob = _blob_path(sha)
+    if not blob.exists():
+        blob.parent.mkdir(parents=True, exist_ok=True)
+        part = blob.parent / f".{sha}.{uuid.uuid4().hex}.part"
+        try:
+            try:
+                os.link(path, part)
+            except OSError:
+                shutil.copyfile(path, part)
+            os.replace(part, blob)
+        finally:
+            part.unlink(missing_ok=True)
+        signature = _file_signature(blob)
+        with _verified_guard:
+            _verified_files[f"blob:{sha}"] = (signature, sha, time.time())
+        _catalog_record(f"blob:{sha}", "blob", signature[1])
+
+    return (
+        path.name, name, version, tags, sha, st.st_size, str(path), st.st_mtime_ns,
+        metadata.get("Requires-Python"), json.dumps(metadata.get_all("Requires-Dist") or []),
+    )
+
+
+def ingest_wheelhouse(directory: Path, recursive: bool = False) -> dict[str, int]:
+    """
+    Index every .whl under directory into the catalog and blob store. The index is
+    keyed by filename: a wheel whose filename is already indexed from the same path
+    with the same size and mtime is skipped, so re-running over a growing wheelhouse
+    only hashes the new files. Further copies of an indexed filename elsewhere in the
+    tree are hashed and skipped when their sha256 matches, or reported as conflicts.
+    Returns counts by outcome.
+    """
+    paths = sorted(p.resolve() for p in (directory.rglob("*.whl") if recursive else directory.glob("*.whl")))
+    known = {
+        filename: (path, size, mtime_ns, sha)
+        for filename, path, size, mtime_ns, sha in _catalog().execute(
+            "SELECT filename, path, size, mtime_ns, sha256 FROM local_wheels"
+        )
+    }
+    by_filename: dict[str, list[Path]] = {}
+    for path in paths:
+        by_filename.setdefault(path.name, []).append(path)
+
+    todo, copies = [], []
+    for filename, group in by_filename.items():
+        indexed = known.get(filename)
+        # Keep serving the copy that is already indexed while it is still there.
+        primary = next((p for p in group if indexed and str(p) == indexed[0]), group[0])
+        st = primary.stat()
+        if indexed is None or indexed[:3] != (str(primary), st.st_size, st.st_mtime_ns):
+            todo.append(primary)
+        copies.extend((filename, p) for p in group if p != primary)
+    counts = {"ingested": 0, "skipped": len(by_filename) - len(todo), "duplicates": 0, "failed": 0}
+
+    def _try_ingest(path: Path):
+        try:
+            return _ingest_wheel(path)
+        except (OSError, ValueError, zipfile.BadZipFile) as e:
+            log.warning("Skipping %s: %s", path, e)
+            return None
+
+    def _try_hash(path: Path) -> Optional[str]:
+        try:
+            return _sha256_file(path)
+        except OSError as e:
+            log.warning("Skipping %s: %s", path, e)
+            return None
+
+    # Hashing and zip parsing release the GIL, so wheels are verified in parallel.
+    with ThreadPoolExecutor(max_workers=max(1, INGEST_WORKERS), thread_name_prefix="whispy-ingest") as pool:
+        rows = [row for row in pool.map(_try_ingest, todo) if row]
+        copy_digests = list(pool.map(_try_hash, [path for _, path in copies]))
+    counts["ingested"] = len(rows)
+    counts["failed"] = len(todo) - len(rows)
+
+    indexed_sha = {filename: entry[3] for filename, entry in known.items()}
+    indexed_sha.update({row[0]: row[4] for row in rows})
+    ignored: dict[str, int] = {}
+    for (filename, path), sha in zip(copies, copy_digests):
+        if sha is not None and sha == indexed_sha.get(filename):
+            counts["duplicates"] += 1
+            ignored[filename] = ignored.get(filename, 0) + 1
+        else:
+            counts["failed"] += 1
+            if sha is not None:
+                log.warning("Skipping %s: a different wheel with the same filename is already indexed", path)
+    for filename, count in ignored.items():
+        log.info("Ignored %d identical extra %s of %s", count, "copy" if count == 1 else "copies", filename)
+
+    with _catalog_transaction() as db:
+        db.executemany(
+            "INSERT INTO local_wheels (filename, name, version, tags, sha256, size, path, mtime_ns, "
+            "requires_python, requires_dist) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?) "
+            "ON CONFLICT (filename) DO UPDATE SET name = excluded.name, version = excluded.version, "
+            "tags = excluded.tags, sha256 = excluded.sha256, size = excluded.size, path = excluded.path, "
+            "mtime_ns = excluded.mtime_ns, requires_python = excluded.requires_python, "
+            "requires_dist = excluded.requires_dist",
+            rows,
+        )
+    _evict_if_needed()
+    return counts
+
+
+# ---------------------------------------------------------------------------
+# Background prefetch
+# ---------------------------------------------------------------------------
+
+def _parse_tag_set(tags) -> list[str]:
+    if isinstance(tags, str):
+        tags = tags.split(",")
+    if not isinstance(tags, list) or not all(isinstance(t, str) for t in tags):
+        raise ValueError("Tags must be a comma-separated string or a list of strings")
+    return [t.strip() for t in tags if t.strip()]
+
+
+def _parse_prefetch_request(body) -> list[dict]:
+    """
+    Expand a POST /prefetch body into build items, one per package and tag set:
+
+        {"packages": ["requests", "numpy==1.26.4", {"name": "rich", "deps": true}],
+         "tag_sets": [["cp311-cp311-manylinux_2_17_x86_64", "py3-none-any"]], "deps": false}
+
+    "tags" may be given instead of "tag_sets" for a single set; package objects
+    may override "version", "tags" and "deps".
+    """
+    if not isinstance(body, dict) or not isinstance(body.get("packages"), list) or not body["packages"]:
+        raise ValueError("Body must be a JSON object with a non-empty 'packages' list")
+
+    if "tag_sets" in body:
+        if not isinstance(body["tag_sets"], list):
+            raise ValueError("'tag_sets' must be a list")
+        default_tag_sets = [_parse_tag_set(tags) for tags in body["tag_sets"]]
+    elif "tags" in body:
+        default_tag_sets = [_parse_tag_set(body["tags"])]
+    else:
+        default_tag_sets = []
+    default_deps = _parse_deps(body.get("deps", False))
+
+    items = []
+    for spec in body["packages"]:
+        if isinstance(spec, str):
+            spec = {"name": spec}
+        if not isinstance(spec, dict) or not isinstance(spec.get("name"), str):
+            raise ValueError(f"Invalid package spec: {spec!r}")
+        name, _, pinned = spec["name"].strip().partition("==")
+        if not isinstance(spec.get("version") or "", str):
+            raise ValueError(f"'version' must be a string for {name}")
+        version = spec.get("version") or pinned.strip() or None
+        _validate_package_request(name, version)
+        deps = _parse_deps(spec["deps"]) if "deps" in spec else default_deps
+
+        tag_sets = [_parse_tag_set(spec["tags"])] if "tags" in spec else default_tag_sets
+        if not tag_sets or not all(tag_sets):
+            raise ValueError(f"No tags given for {name}")
+        for tags in tag_sets:
+            items.append({
+                "name": name,
+                "version": version,
+                "tags": tags,
+                "deps": deps,
+            })
+    return items
+
+
+def _parse_deps(value) -> bool:
+    """A prefetch "deps" flag: JSON true or false only, so "false" is not taken as true."""
+    if not isinstance(value, bool):
+        raise ValueError(f"'deps' must be true or false, not {value!r}")
+    return value
+
+
+def _prefetch_worker() -> None:
+    while True:
+        job, idx, item = _prefetch_queue.get()
+        db = _catalog()
+        try:
+            db.execute("UPDATE prefetch_items SET status = 'running' WHERE job = ? AND idx = ?", (job, idx))
+            _, resolved_version, _ = fetch_package_zip(
+                item["name"], item["version"], item["tags"], item["deps"], compression=BUNDLE_COMPRESSION
+            )
+        except Exception as e:
+            log.warning("Prefetch of %s failed: %s", item["name"], e)
+            db.execute(
+                "UPDATE prefetch_items SET status = 'error', error = ? WHERE job = ? AND idx = ?",
+                (str(e), job, idx),
+            )
+        else:
+            db.execute(
+                "UPDATE prefetch_items SET status = 'done', resolved_version = ? WHERE job = ? AND idx = ?",
+                (resolved_version, job, idx),
+            )
+        finally:
+            _prefetch_queue.task_done()
+
+
+def prefetch_enqueue(items: list[dict]) -> str:
+    """Record a prefetch job and queue its items for the background build threads. Returns the job id."""
+    job = uuid.uuid4().hex
+    now = time.time()
+    with _prefetch_guard:
+        if _prefetch_queue.qsize() + len(items) > PREFETCH_QUEUE_SIZE:
+            raise RuntimeError("Prefetch queue is full")
+        worker = _prefetch_worker_id()
+        with _catalog_transaction() as db:
+            db.execute("DELETE FROM prefetch_items WHERE created < ?", (now - PREFETCH_JOB_RETENTION,))
+            db.executemany(
+                "INSERT INTO prefetch_items (job, idx, created, name, version, tags, deps, status, worker) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, 'queued', ?)",
+                [
+                    (job, idx, now, item["name"], item["version"], ",".join(item["tags"]), int(item["deps"]), worker)
+                    for idx, item in enumerate(items)
+                ],
+            )
+        for idx, item in enumerate(items):
+            _prefetch_queue.put_nowait((job, idx, item))
+
+        # Started on first use so forked workers each get their own build threads.
+        _prefetch_threads[:] = [t for t in _prefetch_threads if t.is_alive()]
+        while len(_prefetch_threads) < PREFETCH_WORKERS:
+            thread = threading.Thread(target=_prefetch_worker, name="whispy-prefetch", daemon=True)
+            thread.start()
+            _prefetch_threads.append(thread)
+    log.info("Queued prefetch job %s (%d items)", job, len(items))
+    return job
+
+
+def _prefetch_worker_id() -> str:
+    """
+    Id of this process's prefetch queue, recorded on its items. The process holds
+    LOCK_DIR/worker-<id>.lock for as long as it lives, so another process can tell
+    whether the queue holding an item still exists.
+    """
+    global _prefetch_owner
+    if _prefetch_owner is None or _prefetch_owner[0] != os.getpid():
+        token = uuid.uuid4().hex
+        if fcntl is not None:
+            fd = os.open(LOCK_DIR / f"worker-{token}.lock", os.O_RDWR | os.O_CREAT, 0o644)
+            fcntl.flock(fd, fcntl.LOCK_EX)  # never released: the kernel drops it when the process exits
+        _prefetch_owner = (os.getpid(), token)
+    return _prefetch_owner[1]
+
+
+def _fail_orphaned_prefetch_items() -> None:
+    """
+    Queued items only live in their process's memory. Mark the ones whose process
+    is gone (a restart or a crashed worker) as failed instead of reporting them queued.
+    """
+    db = _catalog()
+    workers = db.execute(
+        "SELECT DISTINCT worker FROM prefetch_items WHERE status IN ('queued', 'running')"
+    ).fetchall()
+    for (worker,) in workers:
+        if worker is not None and fcntl is not None:
+            with _file_lock(f"worker-{worker}", wait=False) as free:
+                if not free:
+                    continue  # a live process still holds its queue
+        count = db.execute(
+            "UPDATE prefetch_items SET status = 'error', error = ? "
+            "WHERE status IN ('queued', 'running') AND worker IS ?",
+            ("Server restarted before this item was built", worker),
+        ).rowcount
+        log.warning("Marked %d prefetch items from a stopped worker as failed", count)
+
+
+def prefetch_status(job: str) -> Optional[dict]:
+    rows = _catalog().execute(
+        "SELECT name, version, tags, deps, status, resolved_version, error "
+        "FROM prefetch_items WHERE job = ? ORDER BY idx",
+        (job,),
+    ).fetchall()
+    if not rows:
+        return None
+
+    items = [
+        {
+            "name": name,
+            "version": version,
+            "tags": tags.split(","),
+            "deps": bool(deps),
+            "status": status,
+            "resolved_version": resolved_version,
+            "error": error,
+        }
+        for name, version, tags, deps, status, resolved_version, error in rows
+    ]
+    counts = {status: 0 for status in ("queued", "running", "done", "error")}
+    for item in items:
+        counts[item["status"]] += 1
+    if counts["queued"] == len(items):
+        state = "queued"
+    elif counts["queued"] or counts["running"]:
+        state = "running"
+    else:
+        state = "done"
+    return {"job": job, "status": state, "counts": counts, "items": items}
 
 
 # ---------------------------------------------------------------------------
 # Routes
 # ---------------------------------------------------------------------------
+def _is_node_request() -> bool:
+    """Whether the request in flight comes from a child node (it presents WHISPY_NODE_SECRET)."""
+    return bool(NODE_SECRET) and request.headers.get("X-Whispy-Secret") == NODE_SECRET
+
+
 @app.before_request
 def verify_secret():
     secret = os.environ.get("WHISPY_SECRET")
-    if secret and request.headers.get("X-Whispy-Secret") != secret:
+    if secret and request.headers.get("X-Whispy-Secret") != secret and not _is_node_request():
         return jsonify({"error": "Forbidden"}), 403
 
 @app.before_request
@@ -626,10 +2903,21 @@ def _start_timer():
     g.start = time.monotonic()
 
 
+@app.before_request
+def _ensure_cache():
+    if not _cache_ready:
+        init_cache()
+
+
 @app.after_request
 def _log_request(resp):
     duration = (time.monotonic() - g.start) * 1000
     log.info("%s %s %d %.1fms", request.method, request.path, resp.status_code, duration)
+    endpoint = request.url_rule.rule if request.url_rule else "unmatched"
+    with _metrics_guard:
+        _request_histograms.setdefault(endpoint, _Histogram()).observe(duration / 1000)
+    if resp.mimetype == "application/zip" and resp.content_length:
+        _count("bytes_served", resp.content_length)
     resp.headers["X-Whispy-Version"] = "1.1.0"
     return resp
 
@@ -637,11 +2925,12 @@ def _log_request(resp):
 @app.route("/health")
 @limiter.exempt
 def health():
-    cache_files = list(CACHE_DIR.glob("*.zip"))
-    cache_mb = sum(p.stat().st_size for p in cache_files) / 1024 / 1024
+    totals = _cache_totals()
+    cache_mb = sum(size for _, size in totals.values()) / 1024 / 1024
     return jsonify({
         "status": "ok",
-        "cache_entries": len(cache_files),
+        "cache_entries": totals["bundle"][0],
+        "cache_blobs": totals["blob"][0],
         "cache_mb": round(cache_mb, 2),
         "max_cache_mb": MAX_CACHE_BYTES // 1024 // 1024,
     })
@@ -668,34 +2957,350 @@ def get_package():
     except ValueError as e:
         return jsonify({"error": str(e)}), 400
 
+    compression = request.args.get("compression", BUNDLE_COMPRESSION).lower()
+    if compression not in BUNDLE_COMPRESSIONS:
+        return jsonify({"error": f"'compression' must be one of: {', '.join(BUNDLE_COMPRESSIONS)}"}), 400
+
     client_tags = [t.strip() for t in tags_raw.split(",") if t.strip()]
+    stream = request.args.get("stream", "1" if STREAM_BUILDS else "0") in ("1", "true", "yes")
+
+    try:
+        have = _parse_have(request.args.get("have", ""))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    if not with_deps:
+        have = set()  # the bundle holds only the requested packages, and a delta never omits those
+
+    if stream:
+        return _stream_package_response(package, version, client_tags, with_deps, compression)
+
+    return _package_response(package, version, client_tags, with_deps, compression, have)
+
+
+def _package_response(
+    package: str,
+    version: Optional[str],
+    client_tags: list[str],
+    with_deps: bool,
+    compression: str,
+    have: set[str],
+    result: Optional[tuple[Path, str, list[dict]]] = None,
+):
+    try:
+        opened, resolved_version, manifest, omitted = _fetch_and_open(
+            lambda: fetch_package_zip(package, version, client_tags, with_deps, compression=compression),
+            have,
+            frozenset({_normalize_name(package)}),
+            result,
+        )
+    except Exception as e:
+        return _package_error_response(package, e)
+    resp = _bundle_response(package, opened, resolved_version, manifest)
+    return _delta_response(resp, omitted) if omitted is not None else resp
+
+
+@app.route("/get_batch")
+@limiter.limit("30 per minute")
+def get_batch():
+    """
+    GET /get_batch?packages=requests,rich==13.7.1&tags=cp311-cp311-linux_x86_64,...&deps=1
+
+    Returns one zip bundle for several packages, resolved together so shared
+    dependencies are included once. X-Whispy-Manifest lists every bundled
+    distribution; X-Whispy-Versions-Resolved maps each requested name to its version.
+    """
+    packages_raw = request.args.get("packages", "").strip()
+    tags_raw = request.args.get("tags", "").strip()
+    with_deps = request.args.get("deps", "0") in ("1", "true", "yes")
+
+    if not tags_raw:
+        return jsonify({"error": "Missing 'tags' parameter"}), 400
+    specs = []
+    for spec in packages_raw.split(","):
+        name, _, version = spec.strip().partition("==")
+        specs.append((name.strip(), version.strip() or None))
+    if not packages_raw or len(specs) > BATCH_MAX_PACKAGES:
+        return jsonify({"error": f"'packages' must list 1 to {BATCH_MAX_PACKAGES} packages"}), 400
+    try:
+        for name, version in specs:
+            _validate_package_request(name, version)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    compression = request.args.get("compression", BUNDLE_COMPRESSION).lower()
+    if compression not in BUNDLE_COMPRESSIONS:
+        return jsonify({"error": f"'compression' must be one of: {', '.join(BUNDLE_COMPRESSIONS)}"}), 400
+
+    try:
+        have = _parse_have(request.args.get("have", ""))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    if not with_deps:
+        have = set()  # the bundle holds only the requested packages, and a delta never omits those
+
+    client_tags = [t.strip() for t in tags_raw.split(",") if t.strip()]
+    label = ",".join(name for name, _ in specs)
+    try:
+        opened, resolved_versions, manifest, omitted = _fetch_and_open(
+            lambda: fetch_batch_zip(specs, client_tags, with_deps, compression),
+            have,
+            frozenset(_normalize_name(name) for name, _ in specs),
+        )
+    except Exception as e:
+        return _package_error_response(label, e)
+
+    batch_name = f"whispy-batch-{Path(opened[0].name).stem.split('-')[1]}"
+    if omitted is not None:
+        resp = _delta_response(_send_bundle(opened, f"{batch_name}-delta.zip", manifest), omitted)
+    else:
+        resp = _send_bundle(opened, f"{batch_name}.zip", manifest)
+    resp.headers["X-Whispy-Package"] = label
+    resp.headers["X-Whispy-Versions-Resolved"] = json.dumps(resolved_versions)
+    return resp
+
+
+@app.route("/plan")
+@limiter.limit("60 per minute")
+def plan():
+    """
+    GET /plan?name=requests&version=2.31.0&tags=cp311-cp311-linux_x86_64,...&deps=1
+
+    Returns the resolved download plan for a package as JSON instead of a bundle:
+    {package, version, items: [{name, version, filename, sha256, size, format, url}]}.
+    Clients fetch the items in parallel and cache each one by digest.
+    """
+    package = request.args.get("name", "").strip()
+    version = request.args.get("version", "").strip() or None
+    tags_raw = request.args.get("tags", "").strip()
+    with_deps = request.args.get("deps", "0") in ("1", "true", "yes")
 
+    if not tags_raw:
+        return jsonify({"error": "Missing 'tags' parameter"}), 400
     try:
-        buf, resolved_version, manifest = fetch_package_zip(package, version, client_tags, with_deps)
+        _validate_package_request(package, version)
     except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    client_tags = [t.strip() for t in tags_raw.split(",") if t.strip()]
+    try:
+        return jsonify(resolve_plan(package, version, client_tags, with_deps))
+    except Exception as e:
+        return _package_error_response(package, e)
+
+
+def _blob_request_is_hit() -> bool:
+    """Whether the /blob request in flight names a blob that is already stored."""
+    sha256 = (request.view_args or {}).get("sha256", "").lower()
+    return bool(re.fullmatch(r"[0-9a-f]{64}", sha256)) and _blob_path(sha256).exists()
+
+
+def _blob_mimetype(file: BinaryIO) -> str:
+    """Content type of a stored distribution from its magic bytes: wheels and .zip sdists, or .tar.gz."""
+    magic = file.read(2)
+    file.seek(0)
+    if magic == b"PK":
+        return "application/zip"
+    if magic == b"\x1f\x8b":
+        return "application/gzip"
+    return "application/octet-stream"
+
+
+@app.route("/blob/<sha256>")
+@limiter.limit("600 per minute", exempt_when=_is_node_request)
+@limiter.limit("60 per minute", exempt_when=lambda: _is_node_request() or _blob_request_is_hit())
+def blob(sha256: str):
+    """
+    GET /blob/<sha256>?name=requests&version=2.31.0
+
+    Returns one distribution file from the content-addressed store. name and version
+    (as listed in a /plan item URL) let the server fetch a blob it does not hold yet.
+    Stored blobs are cheap and allow the layered client's parallel downloads; requests
+    that have to fetch from upstream get the same limit as /get_package. Child nodes
+    presenting WHISPY_NODE_SECRET are not limited.
+    """
+    sha256 = sha256.lower()
+    if not re.fullmatch(r"[0-9a-f]{64}", sha256):
+        return jsonify({"error": "Invalid sha256"}), 400
+    package = request.args.get("name", "").strip() or None
+    version = request.args.get("version", "").strip() or None
+    if package:
+        try:
+            _validate_package_request(package, version)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+
+    opened = None
+    try:
+        # A blob evicted between fetch_blob verifying it and _open_blob is fetched once more.
+        for _ in range(2):
+            fetch_blob(sha256, package, version)
+            opened = _open_blob(sha256)
+            if opened:
+                break
+    except FileNotFoundError:
+        return jsonify({"error": f"Blob {sha256} not found"}), 404
+    except Exception as e:
+        return _package_error_response(package or sha256, e)
+    if opened is None:
+        return jsonify({"error": f"Blob {sha256} was evicted while being served, try again"}), 503
+
+    resp = _send_open_file(opened, mimetype=_blob_mimetype(opened), etag=sha256)
+    resp.headers["Cache-Control"] = "public, max-age=31536000, immutable"
+    return resp
+
+
+def _delta_response(resp, omitted: list[str]):
+    """Mark a delta bundle: X-Whispy-Manifest stays complete, X-Whispy-Delta lists what was left out."""
+    resp.headers["X-Whispy-Delta"] = json.dumps(omitted)
+    resp.headers["Cache-Control"] = "private, max-age=86400"
+    return resp
+
+
+def _package_error_response(package: str, e: Exception):
+    if isinstance(e, ValueError):
         message = str(e)
         if "not found on PyPI" in message:
             return jsonify({"error": message}), 404
         if "blocklisted" in message:
             return jsonify({"error": message}), 400
         return jsonify({"error": message}), 500
-    except Exception as e:
-        log.exception("Error fetching %s", package)
-        return jsonify({"error": str(e)}), 500
+    log.error("Error fetching %s", package, exc_info=e)
+    return jsonify({"error": str(e)}), 500
 
-    resp = send_file(
-        buf,
-        as_attachment=True,
-        download_name=f"{_normalize_name(package)}-{resolved_version}.zip",
-        mimetype="application/zip",
-    )
-    resp.headers["X-Whispy-Package"] = package
-    resp.headers["X-Whispy-Version-Resolved"] = resolved_version
+
+def _bundle_sha256(bundle_path: Path) -> str:
+    key = bundle_path.stem
+    with _verified_guard:
+        verified = _verified_files.get(key)
+    if verified:
+        return verified[1]
+    return json.loads((CACHE_DIR / f"{key}.json").read_text())["sha256"]
+
+
+def _fetch_and_open(fetch, have: set[str], roots: frozenset[str], result: Optional[tuple] = None) -> tuple:
+    """
+    Run fetch() -> (bundle_path, resolved version(s), manifest), cut it down to a delta
+    for have (never leaving out the requested roots), and open whichever bundle is served. A result the caller already has is
+    used instead of the first fetch. A bundle evicted between the fetch verifying it
+    and _open_bundle is fetched (so rebuilt) once more.
+    Returns (opened, resolved, manifest, omitted package names or None).
+    """
+    for _ in range(2):
+        bundle_path, resolved, manifest = result or fetch()
+        result = None
+        delta = delta_bundle(bundle_path, manifest, have, roots)
+        opened = _open_bundle(delta[0] if delta else bundle_path)
+        if opened:
+            return opened, resolved, manifest, delta[1] if delta else None
+        log.info("Cache entry %s was evicted before it was served, fetching it again", bundle_path.stem)
+    raise RuntimeError("Bundle was evicted while being served, try again")
+
+
+def _send_open_file(file: BinaryIO, **kwargs):
+    """
+    send_file for an already open cache file, with the Content-Length, Last-Modified
+    and Range / If-Range handling send_file only derives itself for paths.
+    """
+    st = os.fstat(file.fileno())
+    resp = send_file(file, last_modified=st.st_mtime, conditional=False, **kwargs)
+    resp.content_length = st.st_size
+    try:
+        return resp.make_conditional(request.environ, accept_ranges=True, complete_length=st.st_size)
+    except RequestedRangeNotSatisfiable:
+        file.close()
+        raise
+
+
+def _send_bundle(opened: tuple[BinaryIO, str], download_name: str, manifest: list[dict]):
+    # Serve straight from the cache file so the WSGI server can use sendfile and memory stays flat.
+    # The bundle SHA256 is a strong validator: 304 for If-None-Match, and 206 partial
+    # content for Range / If-Range so interrupted downloads can resume.
+    file, sha256 = opened
+    resp = _send_open_file(file, as_attachment=True, download_name=download_name, mimetype="application/zip", etag=sha256)
     resp.headers["X-Whispy-Manifest"] = json.dumps(manifest)
     resp.headers["Cache-Control"] = "public, max-age=86400, immutable"
     return resp
 
 
+def _bundle_response(package: str, opened: tuple[BinaryIO, str], resolved_version: str, manifest: list[dict]):
+    resp = _send_bundle(opened, f"{_normalize_name(package)}-{resolved_version}.zip", manifest)
+    resp.headers["X-Whispy-Package"] = package
+    resp.headers["X-Whispy-Version-Resolved"] = resolved_version
+    return resp
+
+
+def _stream_package_response(
+    package: str, version: Optional[str], client_tags: list[str], with_deps: bool, compression: str
+):
+    """
+    Run the build on a background thread and stream the archive while it is written.
+    Cache hits and failures before the build starts get the normal responses; a
+    streamed response has no X-Whispy-Manifest header because the manifest is
+    only known at the end (later requests are served from cache with it).
+    """
+    fd, part_name = tempfile.mkstemp(prefix="whispy-stream-", suffix=".zip")
+    os.close(fd)
+    stream = _BundleStream(Path(part_name))
+    # Open the reader before the build starts so the file outlives its unlink at the end of the build.
+    reader = open(part_name, "rb")
+
+    def _build():
+        try:
+            stream.finish(result=fetch_package_zip(
+                package, version, client_tags, with_deps, stream=stream, compression=compression
+            ))
+        except BaseException as e:
+            stream.finish(error=e)
+        finally:
+            stream.path.unlink(missing_ok=True)
+
+    threading.Thread(target=_build, name=f"whispy-stream-{package}", daemon=True).start()
+    stream.wait_started()
+
+    if not stream.started:
+        reader.close()
+        if stream.error is not None:
+            return _package_error_response(package, stream.error)
+        # Cache hit: serve the bundle the build thread already looked up and verified.
+        return _package_response(package, version, client_tags, with_deps, compression, set(), stream.result)
+
+    resolved_version = stream.resolved_version
+    resp = Response(stream.chunks(reader), mimetype="application/zip")
+    resp.headers["Content-Disposition"] = f"attachment; filename={_normalize_name(package)}-{resolved_version}.zip"
+    resp.headers["X-Whispy-Package"] = package
+    resp.headers["X-Whispy-Version-Resolved"] = resolved_version
+    resp.headers["X-Whispy-Streamed"] = "1"
+    resp.headers["Cache-Control"] = "no-store"
+    return resp
+
+
+@app.route("/prefetch", methods=["POST"])
+@limiter.limit("10 per minute")
+def prefetch():
+    """
+    POST /prefetch — queue background builds so the first real request is a cache hit.
+    Returns 202 with a job id; poll GET /prefetch/<job> for per-item status.
+    """
+    try:
+        items = _parse_prefetch_request(request.get_json(silent=True))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    try:
+        job = prefetch_enqueue(items)
+    except RuntimeError as e:
+        return jsonify({"error": str(e)}), 503
+    return jsonify({"job": job, "items": len(items), "status_url": f"/prefetch/{job}"}), 202
+
+
+@app.route("/prefetch/<job>")
+@limiter.limit("120 per minute")
+def prefetch_job(job: str):
+    status = prefetch_status(job)
+    if status is None:
+        return jsonify({"error": "Unknown prefetch job"}), 404
+    return jsonify(status)
+
+
 @app.route("/metadata/<package>")
 @limiter.limit("120 per minute")
 def metadata(package: str):
@@ -730,14 +3335,76 @@ def metadata(package: str):
 @limiter.exempt
 def stats():
     """Basic cache statistics."""
-    zips = list(CACHE_DIR.glob("*.zip"))
-    total_bytes = sum(p.stat().st_size for p in zips)
+    totals = _cache_totals()
+    total_bytes = sum(size for _, size in totals.values())
+    with _resolver_stats_guard:
+        resolver = dict(_resolver_stats)
+    with _metrics_guard:
+        counters = dict(_counters)
     return jsonify({
-        "cached_packages": len(zips),
+        "cached_packages": totals["bundle"][0],
+        "cached_blobs": totals["blob"][0],
         "cache_size_mb": round(total_bytes / 1024 / 1024, 2),
         "cache_limit_mb": MAX_CACHE_BYTES // 1024 // 1024,
+        "cache_hits": counters["cache_hits"],
+        "cache_misses": counters["cache_misses"],
+        "resolver": resolver,
+        "prefetch_queue": _prefetch_queue.qsize(),
+        "local_wheels": _catalog().execute("SELECT COUNT(*) FROM local_wheels").fetchone()[0],
     })
 
+
+@app.route("/metrics")
+@limiter.exempt
+def metrics():
+    """Prometheus text exposition: cache counters, bytes served and per-stage latency histograms."""
+    totals = _cache_totals()
+    with _metrics_guard:
+        counters = dict(_counters)
+        lines = [
+            "# HELP whispy_cache_hits_total Bundle requests served from cache.",
+            "# TYPE whispy_cache_hits_total counter",
+            f"whispy_cache_hits_total {counters['cache_hits']}",
+            "# HELP whispy_cache_misses_total Bundle requests that needed a build.",
+            "# TYPE whispy_cache_misses_total counter",
+            f"whispy_cache_misses_total {counters['cache_misses']}",
+            "# HELP whispy_bytes_served_total Bundle bytes sent to clients.",
+            "# TYPE whispy_bytes_served_total counter",
+            f"whispy_bytes_served_total {counters['bytes_served']}",
+            "# HELP whispy_upstream_requests_total Requests made to PyPI.",
+            "# TYPE whispy_upstream_requests_total counter",
+            f"whispy_upstream_requests_total {counters['upstream_requests']}",
+            "# HELP whispy_upstream_retries_total Upstream requests retried after an error or 429/5xx.",
+            "# TYPE whispy_upstream_retries_total counter",
+            f"whispy_upstream_retries_total {counters['upstream_retries']}",
+            "# HELP whispy_parent_hits_total Blobs fetched from the parent node and verified.",
+            "# TYPE whispy_parent_hits_total counter",
+            f"whispy_parent_hits_total {counters['parent_hits']}",
+            "# HELP whispy_parent_misses_total Parent node lookups that failed or did not verify.",
+            "# TYPE whispy_parent_misses_total counter",
+            f"whispy_parent_misses_total {counters['parent_misses']}",
+            "# HELP whispy_cache_entries Entries in the cache catalog.",
+            "# TYPE whispy_cache_entries gauge",
+            *(f'whispy_cache_entries{{kind="{kind}"}} {entries}' for kind, (entries, _) in totals.items()),
+            "# HELP whispy_cache_bytes Bytes in the cache catalog.",
+            "# TYPE whispy_cache_bytes gauge",
+            *(f'whispy_cache_bytes{{kind="{kind}"}} {size}' for kind, (_, size) in totals.items()),
+            "# HELP whispy_cache_limit_bytes Configured cache budget.",
+            "# TYPE whispy_cache_limit_bytes gauge",
+            f"whispy_cache_limit_bytes {MAX_CACHE_BYTES}",
+            "# HELP whispy_stage_duration_seconds Time spent in each bundle build stage.",
+            "# TYPE whispy_stage_duration_seconds histogram",
+        ]
+        for stage, hist in _stage_histograms.items():
+            _render_histogram(lines, "whispy_stage_duration_seconds", "stage", stage, hist)
+        lines += [
+            "# HELP whispy_request_duration_seconds Request latency by route.",
+            "# TYPE whispy_request_duration_seconds histogram",
+        ]
+        for endpoint, hist in _request_histograms.items():
+            _render_histogram(lines, "whispy_request_duration_seconds", "endpoint", endpoint, hist)
+    return Response("\n".join(lines) + "\n", mimetype="text/plain; version=0.0.4")
+
 @app.route("/")
 @limiter.exempt
 def index():
@@ -761,13 +3428,90 @@ def internal(e):
 # ---------------------------------------------------------------------------
 # Entry point
 # ---------------------------------------------------------------------------
+def _prefetch_cli(args) -> int:
+    """`python app.py prefetch ...`: queue a prefetch job on a running server, optionally waiting for it."""
+    specs = list(args.packages)
+    if args.file:
+        for line in Path(args.file).read_text().splitlines():
+            line = line.split("#", 1)[0].strip()
+            if line:
+                specs.append(line)
+    if not specs:
+        print("No packages given")
+        return 2
+
+    server = args.server.rstrip("/")
+    headers = {"Content-Type": "application/json"}
+    if os.environ.get("WHISPY_SECRET"):
+        headers["X-Whispy-Secret"] = os.environ["WHISPY_SECRET"]
+
+    def _call(path: str, body: Optional[dict] = None) -> dict:
+        data = json.dumps(body).encode() if body is not None else None
+        req = urllib.request.Request(server + path, data=data, headers=headers)
+        with urllib.request.urlopen(req, timeout=30) as resp:
+            return json.load(resp)
+
+    body = {"packages": specs, "tag_sets": args.tags, "deps": args.deps}
+    job = _call("/prefetch", body)["job"]
+    print(f"Queued prefetch job {job} ({len(specs)} packages x {len(args.tags)} tag sets)")
+    if not args.wait:
+        return 0
+
+    while True:
+        status = _call(f"/prefetch/{job}")
+        counts = status["counts"]
+        print(f"  {counts['done']} done, {counts['error']} failed, {counts['running'] + counts['queued']} pending")
+        if status["status"] == "done":
+            break
+        time.sleep(2)
+    for item in status["items"]:
+        if item["status"] == "error":
+            print(f"  FAILED {item['name']} ({','.join(item['tags'])}): {item['error']}")
+    return 1 if status["counts"]["error"] else 0
+
+
+def _ingest_cli(args) -> int:
+    """`python app.py ingest <dir>`: seed the cache from a local wheelhouse, without any upstream."""
+    directory = Path(args.directory)
+    if not directory.is_dir():
+        print(f"Not a directory: {directory}")
+        return 2
+    started = time.monotonic()
+    counts = ingest_wheelhouse(directory, args.recursive)
+    print(
+        f"Ingested {counts['ingested']} wheels, skipped {counts['skipped']} unchanged and "
+        f"{counts['duplicates']} duplicate copies, {counts['failed']} failed ({time.monotonic() - started:.1f}s)"
+    )
+    return 1 if counts["failed"] else 0
+
+
 if __name__ == "__main__":
     import argparse
     parser = argparse.ArgumentParser(description="Whispy CDN Server")
     parser.add_argument("--host", default="0.0.0.0")
     parser.add_argument("--port", type=int, default=5000)
     parser.add_argument("--debug", action="store_true")
+    commands = parser.add_subparsers(dest="command")
+    prefetch_cmd = commands.add_parser("prefetch", help="Queue background builds on a running server")
+    prefetch_cmd.add_argument("packages", nargs="*", help="Package specs: name or name==version")
+    prefetch_cmd.add_argument("-f", "--file", help="File with one package spec per line (# comments allowed)")
+    prefetch_cmd.add_argument(
+        "--tags", action="append", required=True,
+        help="Comma-separated platform tag set; repeat to build each package for several platforms",
+    )
+    prefetch_cmd.add_argument("--deps", action="store_true", help="Bundle dependencies too")
+    prefetch_cmd.add_argument("--server", default="http://127.0.0.1:5000", help="Whispy server URL")
+    prefetch_cmd.add_argument("--wait", action="store_true", help="Poll until the job finishes")
+    ingest_cmd = commands.add_parser("ingest", help="Seed the cache from a directory of wheels (e.g. pip download)")
+    ingest_cmd.add_argument("directory", help="Directory containing .whl files")
+    ingest_cmd.add_argument("-r", "--recursive", action="store_true", help="Also scan subdirectories")
     args = parser.parse_args()
 
+    if args.command == "prefetch":
+        raise SystemExit(_prefetch_cli(args))
+    init_cache()
+    if args.command == "ingest":
+        raise SystemExit(_ingest_cli(args))
+
     log.info("🌀 Whispy CDN starting on %s:%d", args.host, args.port)
     app.run(host=args.host, port=args.port, debug=args.debug)
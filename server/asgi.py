@@ -0,0 +1,369 @@
+"""
+Whispy CDN Server — asyncio (ASGI) serving mode.
+
+    cd server && uvicorn asgi:app --host 0.0.0.0 --port 5000
+
+Serves the same routes as app.py over the same cache directory. Before a
+/get_package or /get_batch request reaches the Flask handler, its upstream work
+(PyPI metadata for the whole dependency graph and every missing wheel/sdist,
+from WHISPY_PARENT_URL first when it is set) is done here on the event loop, so
+a request waiting on PyPI holds no thread. /plan gets the same treatment for
+its metadata. The Flask handler then runs on a small thread pool and only finds
+warm caches: hashing, extraction and zipping are the work left for its threads.
+
+Not covered: /blob misses, /metadata, /prefetch jobs and revalidation of stale
+metadata still wait on upstream in a Flask thread or a background worker.
+"""
+
+import asyncio
+import os
+import tempfile
+import time
+from functools import partial
+from pathlib import Path
+from typing import Awaitable, Callable, Optional
+from urllib.parse import parse_qs, urlencode
+
+import httpx
+from a2wsgi import WSGIMiddleware
+
+import app as whispy
+
+# ---------------------------------------------------------------------------
+# Config
+# ---------------------------------------------------------------------------
+# Threads running Flask handlers (hashing, zipping, cache reads). Upstream waits happen on the loop.
+ASGI_THREADS = int(os.environ.get("WHISPY_ASGI_THREADS", "32"))
+# Open connections to PyPI shared by every in-flight request in this process.
+ASGI_UPSTREAM_CONNECTIONS = int(os.environ.get("WHISPY_ASGI_UPSTREAM_CONNECTIONS", "64"))
+
+log = whispy.log
+
+_client: Optional[httpx.AsyncClient] = None
+_inflight: dict[str, asyncio.Task] = {}
+
+
+def _upstream() -> httpx.AsyncClient:
+    global _client
+    if _client is None:
+        _client = httpx.AsyncClient(
+            follow_redirects=True,
+            timeout=httpx.Timeout(whispy.UPSTREAM_READ_TIMEOUT, connect=whispy.UPSTREAM_CONNECT_TIMEOUT),
+            transport=httpx.AsyncHTTPTransport(
+                retries=whispy.UPSTREAM_RETRIES,
+                limits=httpx.Limits(max_connections=ASGI_UPSTREAM_CONNECTIONS),
+            ),
+        )
+    return _client
+
+
+async def _single_flight(key: str, factory):
+    """Async counterpart of app._single_flight: one task per key, shared by every waiter."""
+    task = _inflight.get(key)
+    if task is None:
+        task = asyncio.ensure_future(factory())
+        _inflight[key] = task
+        task.add_done_callback(lambda _: _inflight.pop(key, None))
+    return await asyncio.shield(task)
+
+
+# ---------------------------------------------------------------------------
+# Upstream prefetch
+# ---------------------------------------------------------------------------
+
+async def fetch_pypi_metadata(package: str, version: Optional[str] = None) -> Optional[dict]:
+    """
+    Make sure the metadata cache holds a usable entry for package, fetching it
+    without blocking the loop. Returns the document, or None when it could not be
+    fetched (the Flask handler then reports the error as usual).
+    """
+    name = whispy._normalize_name(package)
+    entry = await asyncio.to_thread(whispy._metadata_cache_load, name, version)
+    ttl = whispy.METADATA_PINNED_TTL if version else whispy.METADATA_TTL
+    # Stale entries are refreshed in the background by app.fetch_pypi_metadata itself.
+    if entry is not None and time.time() - entry.get("fetched", 0) < ttl + whispy.METADATA_STALE_TTL:
+        return entry["data"]
+
+    async def _fetch():
+        if version is None and whispy.METADATA_BACKEND == "simple":
+            fresh = await _fetch_latest(package, name, entry)
+        else:
+            fresh = await _fetch_json(whispy._metadata_url(name, version), entry)
+        if fresh is None:
+            return None
+        await asyncio.to_thread(whispy._metadata_cache_store, name, version, fresh)
+        return fresh["data"]
+
+    return await _single_flight(f"metadata:{name}=={version or ''}", _fetch)
+
+
+async def _fetch_json(url: str, entry: Optional[dict]) -> Optional[dict]:
+    """Fetch (or revalidate) one PyPI JSON document; returns the new cache entry or None."""
+    whispy._count("upstream_requests")
+    try:
+        with whispy._timed("metadata"):
+            resp = await _upstream().get(url, headers=whispy._metadata_request_headers(entry))
+    except httpx.HTTPError as e:
+        log.warning("Async metadata fetch failed for %s: %s", url, e)
+        return None
+    if resp.status_code == 304 and entry:
+        return {**entry, "fetched": time.time()}
+    if resp.status_code == 200:
+        # Documents for large projects run to megabytes; parse them off the loop.
+        return whispy._metadata_entry(resp.headers, await asyncio.to_thread(resp.json))
+    return None
+
+
+async def _fetch_latest(package: str, name: str, entry: Optional[dict]) -> Optional[dict]:
+    """Async counterpart of app._request_latest_metadata: simple index first, then one release's JSON."""
+    validators = entry if entry and entry.get("simple") else None
+    headers = {**whispy._metadata_request_headers(validators), "Accept": whispy.SIMPLE_JSON_ACCEPT}
+    whispy._count("upstream_requests")
+    try:
+        with whispy._timed("metadata"):
+            resp = await _upstream().get(whispy._simple_index_url(name), headers=headers)
+    except httpx.HTTPError as e:
+        log.warning("Async simple index fetch failed for %s: %s", name, e)
+        return None
+    if resp.status_code == 304 and validators:
+        return {**entry, "fetched": time.time()}
+    if resp.status_code != 200:
+        return None
+
+    latest = await asyncio.to_thread(
+        whispy._simple_index_latest, resp.headers.get("Content-Type", ""), resp.content
+    )
+    if latest is None:
+        return await _fetch_json(whispy._metadata_url(name, None), None)
+    data = await fetch_pypi_metadata(package, latest)
+    if data is None:
+        return None
+    return {**whispy._metadata_entry(resp.headers, data), "simple": True}
+
+
+async def resolve_graph(roots: list[tuple[str, Optional[str]]]) -> list[dict]:
+    """Warm the metadata cache for the same BFS that app.resolve_graph walks from roots."""
+    docs = []
+    seen = {whispy._normalize_name(name) for name, _ in roots}
+    level = list(roots)
+    while level:
+        metas = await asyncio.gather(*(fetch_pypi_metadata(name, ver) for name, ver in level))
+        level = []
+        for meta in metas:
+            if meta is None:
+                continue
+            docs.append(meta)
+            for dep_name in whispy._dependency_names(meta["info"]):
+                dep_norm = whispy._normalize_name(dep_name)
+                if dep_norm not in seen:
+                    seen.add(dep_norm)
+                    level.append((dep_name, None))
+    return docs
+
+
+async def fetch_distribution(chosen: dict) -> None:
+    """Download one file into the blob store unless it is already there."""
+    expected = chosen.get("digests", {}).get("sha256")
+    if not expected:
+        return
+    blob = whispy._blob_path(expected)
+    if blob.exists():
+        return
+
+    async def _fetch():
+        if whispy.PARENT_URL:
+            if await _fetch_blob_from(_parent_blob_request(chosen), chosen, blob):
+                whispy._count("parent_hits")
+                return
+            whispy._count("parent_misses")
+        whispy._count("upstream_requests")
+        await _fetch_blob_from((whispy._file_url(chosen["url"]), {"User-Agent": "Whispy/1.0"}), chosen, blob)
+
+    await _single_flight(f"blob:{expected}", _fetch)
+
+
+def _parent_blob_request(chosen: dict) -> tuple[str, dict]:
+    """The (url, headers) that app._blob_from_parent would use for chosen."""
+    query = urlencode(whispy._dist_name_version(chosen["filename"]))
+    headers = {"User-Agent": "Whispy/1.0"}
+    if whispy.PARENT_SECRET:
+        headers["X-Whispy-Secret"] = whispy.PARENT_SECRET
+    return f"{whispy.PARENT_URL}/blob/{chosen['digests']['sha256']}?{query}", headers
+
+
+async def _fetch_blob_from(request: tuple[str, dict], chosen: dict, blob: Path) -> bool:
+    """Stream one file into the blob store, verified against its PyPI digest. Returns success."""
+    url, headers = request
+    expected = chosen["digests"]["sha256"]
+    blob.parent.mkdir(parents=True, exist_ok=True)
+    fd, part_name = tempfile.mkstemp(dir=blob.parent, prefix=f".{expected}.", suffix=".part")
+    part = Path(part_name)
+    try:
+        with whispy._timed("download"), os.fdopen(fd, "wb") as out:
+            async with _upstream().stream("GET", url, headers=headers) as resp:
+                resp.raise_for_status()
+                async for chunk in resp.aiter_bytes(1024 * 1024):
+                    out.write(chunk)
+        # A concurrent download by another worker process is harmless: the rename is atomic
+        # and both copies have the same content.
+        await asyncio.to_thread(whispy._publish_blob, part, blob, chosen["filename"], expected)
+        return True
+    except (httpx.HTTPError, OSError, ValueError) as e:
+        log.warning("Async download failed for %s from %s: %s", chosen["filename"], url, e)
+        return False
+    finally:
+        part.unlink(missing_ok=True)
+
+
+async def _fetch_distributions(docs: list[dict], client_tags: list[str]) -> None:
+    """Download the file a build would pick for each release document, in parallel."""
+    downloads = []
+    for doc in docs:
+        info = doc["info"]
+        files = doc.get("releases", {}).get(info["version"], []) or doc.get("urls", [])
+        chosen = whispy._best_wheel(files, client_tags) or whispy._sdist(files)
+        if chosen:
+            downloads.append(fetch_distribution(chosen))
+    await asyncio.gather(*downloads)
+
+
+async def prefetch_package(
+    package: str, version: Optional[str], client_tags: list[str], with_deps: bool, compression: str
+) -> None:
+    """Fetch everything a /get_package build needs from upstream, unless the bundle is cached already."""
+    tags_str = ",".join(client_tags)
+    if version and await asyncio.to_thread(
+        whispy._pinned_cache_lookup, package, version, tags_str, with_deps, compression
+    ):
+        return
+    meta = await fetch_pypi_metadata(package, version)
+    if meta is None:
+        return
+    resolved_version = meta["info"]["version"]
+    key = whispy._cache_key(package, resolved_version, tags_str, with_deps, compression)
+    if (whispy.CACHE_DIR / f"{key}.json").exists():
+        return
+
+    # The build resolves from the pinned release, so warm that document rather than the request's.
+    docs = await resolve_graph([(package, resolved_version)]) if with_deps else [meta]
+    await _fetch_distributions(docs, client_tags)
+
+
+async def prefetch_batch(
+    specs: list[tuple[str, Optional[str]]], client_tags: list[str], with_deps: bool, compression: str
+) -> None:
+    """Fetch everything a /get_batch build needs from upstream, unless the bundle is cached already."""
+    metas = await asyncio.gather(*(fetch_pypi_metadata(name, version) for name, version in specs))
+    if any(meta is None for meta in metas):
+        return
+    roots = [(name, meta["info"]["version"]) for (name, _), meta in zip(specs, metas)]
+    key = whispy._batch_cache_key(roots, ",".join(client_tags), with_deps, compression)
+    if (whispy.CACHE_DIR / f"{key}.json").exists():
+        return
+    docs = await resolve_graph(roots) if with_deps else metas
+    await _fetch_distributions(docs, client_tags)
+
+
+async def prefetch_plan(package: str, version: Optional[str], with_deps: bool) -> None:
+    """Warm the metadata a /plan response is built from; a plan downloads no files."""
+    meta = await fetch_pypi_metadata(package, version)
+    if meta is not None and with_deps:
+        await resolve_graph([(package, meta["info"]["version"])])
+
+
+# ---------------------------------------------------------------------------
+# ASGI app
+# ---------------------------------------------------------------------------
+_flask = WSGIMiddleware(whispy.app, workers=ASGI_THREADS)
+
+
+def _prefetch_for(scope) -> Optional[tuple[str, Callable[[], Awaitable[None]]]]:
+    """
+    (label, prefetch) for a /get_package, /get_batch or /plan request, or None to leave
+    the request to Flask untouched. Requests Flask would reject are not prefetched for.
+    """
+    if scope["method"] != "GET" or scope["path"] not in ("/get_package", "/get_batch", "/plan"):
+        return None
+    if whispy.OFFLINE:
+        return None
+    secret = os.environ.get("WHISPY_SECRET")
+    if secret and dict(scope["headers"]).get(b"x-whispy-secret", b"").decode() != secret:
+        return None
+
+    args = {k: v[-1] for k, v in parse_qs(scope["query_string"].decode()).items()}
+    client_tags = [t.strip() for t in args.get("tags", "").split(",") if t.strip()]
+    with_deps = args.get("deps", "0") in ("1", "true", "yes")
+    compression = args.get("compression", whispy.BUNDLE_COMPRESSION).lower()
+    if not client_tags or compression not in whispy.BUNDLE_COMPRESSIONS:
+        return None
+
+    if scope["path"] == "/get_batch":
+        specs = []
+        for spec in args.get("packages", "").split(","):
+            name, _, version = spec.strip().partition("==")
+            specs.append((name.strip(), version.strip() or None))
+        if not 1 <= len(specs) <= whispy.BATCH_MAX_PACKAGES:
+            return None
+        names = [whispy._normalize_name(name) for name, _ in specs]
+        if len(set(names)) != len(names) or any(name in whispy.BLOCKLIST for name in names):
+            return None
+        try:
+            for name, version in specs:
+                whispy._validate_package_request(name, version)
+        except ValueError:
+            return None
+        return ",".join(name for name, _ in specs), partial(prefetch_batch, specs, client_tags, with_deps, compression)
+
+    package = args.get("name", "").strip()
+    version = args.get("version", "").strip() or None
+    try:
+        whispy._validate_package_request(package, version)
+    except ValueError:
+        return None
+    if whispy._normalize_name(package) in whispy.BLOCKLIST:
+        return None
+    if scope["path"] == "/plan":
+        return package, partial(prefetch_plan, package, version, with_deps)
+    return package, partial(prefetch_package, package, version, client_tags, with_deps, compression)
+
+
+def _rate_limited(scope) -> bool:
+    """Whether Flask is going to answer this request with 429; asked before any upstream work."""
+    headers = {k.decode("latin-1"): v.decode("latin-1") for k, v in scope["headers"]}
+    client = scope.get("client") or ("", 0)
+    with whispy.app.test_request_context(
+        scope["path"],
+        method=scope["method"],
+        query_string=scope["query_string"].decode("latin-1"),
+        headers=headers,
+        environ_base={"REMOTE_ADDR": client[0]},
+    ):
+        return whispy._over_rate_limit()
+
+
+async def app(scope, receive, send):
+    if scope["type"] == "lifespan":
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                await asyncio.to_thread(whispy.init_cache)
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                if _client is not None:
+                    await _client.aclose()
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    if scope["type"] == "http":
+        if not whispy._cache_ready:  # servers that skip the lifespan protocol
+            await asyncio.to_thread(whispy.init_cache)
+        prefetch = _prefetch_for(scope)
+        # Over-limit requests get their 429 from Flask without costing any upstream traffic.
+        if prefetch and not await asyncio.to_thread(_rate_limited, scope):
+            label, work = prefetch
+            try:
+                await work()
+            except Exception as e:
+                # Best effort: the Flask handler repeats anything missing and reports errors.
+                log.warning("Prefetch failed for %s: %s", label, e)
+    await _flask(scope, receive, send)
@@ -0,0 +1,131 @@
+"""
+Micro-benchmark: wheel selection with the compiled TagMatcher vs. the original
+per-call string matching, on a numpy-sized release and an abi3-only release
+with a ~150-tag client list.
+
+    cd server && python benchmarks/bench_tag_matcher.py
+"""
+
+import os
+import sys
+import tempfile
+import timeit
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.environ.setdefault("WHISPY_CACHE_DIR", tempfile.mkdtemp(prefix="whispy-bench-"))
+
+import app
+
+
+def client_tags() -> list[str]:
+    """A CPython 3.12 manylinux x86_64 tag list in pip order (~150 tags)."""
+    plats = [f"manylinux_2_{minor}_x86_64" for minor in range(39, 4, -1)]
+    plats += ["manylinux2014_x86_64", "manylinux2010_x86_64", "manylinux1_x86_64", "linux_x86_64"]
+    tags = [f"cp312-{abi}-{plat}" for abi in ("cp312", "abi3", "none") for plat in plats]
+    tags += [f"cp3{minor}-abi3-{plat}" for minor in range(11, 1, -1) for plat in plats[:2]]
+    tags += [f"py3-none-{plat}" for plat in plats[:10]]
+    tags += ["cp312-none-any", "py312-none-any", "py3-none-any"]
+    return tags
+
+
+def release_files() -> list[dict]:
+    """Roughly the wheel matrix of a numpy release: several interpreters x many platforms."""
+    plats = [
+        "manylinux_2_17_x86_64.manylinux2014_x86_64", "manylinux_2_17_aarch64.manylinux2014_aarch64",
+        "musllinux_1_1_x86_64", "musllinux_1_2_aarch64", "macosx_10_9_x86_64", "macosx_11_0_arm64",
+        "macosx_14_0_arm64", "win32", "win_amd64", "win_arm64", "manylinux_2_28_ppc64le", "manylinux_2_28_s390x",
+    ]
+    files = []
+    for build in range(12):
+        for interp in ("cp39", "cp310", "cp311", "cp312", "cp313", "pp39", "pp310"):
+            abi = interp if interp.startswith("cp") else f"pypy{interp[2:]}_pp73"
+            for plat in plats:
+                files.append({"filename": f"numpy-2.0.{build}-{interp}-{abi}-{plat}.whl"})
+        files.append({"filename": f"numpy-2.0.{build}-cp39-abi3-manylinux_2_17_x86_64.whl"})
+    files.append({"filename": "numpy-2.0.0.tar.gz"})
+    return files
+
+
+def abi3_release_files() -> list[dict]:
+    """A cryptography-style release: abi3 wheels only, most of them for other platforms."""
+    plats = [
+        "manylinux_2_28_aarch64", "manylinux_2_34_aarch64", "musllinux_1_2_x86_64", "musllinux_1_2_aarch64",
+        "macosx_10_9_universal2", "win32", "win_amd64", "manylinux_2_17_x86_64.manylinux2014_x86_64",
+    ]
+    return [
+        {"filename": f"cryptography-43.0.{build}-{interp}-abi3-{plat}.whl"}
+        for build in range(30) for interp in ("cp37", "cp39") for plat in plats
+    ]
+
+
+def legacy_best_wheel(files: list[dict], tags: list[str]):
+    """The selection loop as it was before TagMatcher, kept here as the baseline."""
+
+    def parse(filename):
+        parts = filename[:-4].split("-")
+        return {f"{i}-{a}-{p}" for i in parts[2].split(".") for a in parts[3].split(".") for p in parts[4].split(".")}
+
+    def abi3_score(wheel_tags, with_index):
+        for wheel_tag in wheel_tags:
+            parts = wheel_tag.split("-")
+            if len(parts) == 3 and parts[1] == "abi3":
+                for j, client_tag in enumerate(tags):
+                    client_parts = client_tag.split("-")
+                    if len(client_parts) == 3 and client_parts[2] == parts[2]:
+                        try:
+                            wheel_version = int(parts[0][2:]) if parts[0].startswith("cp") else 0
+                            client_version = int(client_parts[0][2:]) if client_parts[0].startswith("cp") else 0
+                        except ValueError:
+                            continue
+                        if client_version >= wheel_version:
+                            return 10000 + wheel_version * 100 + j if with_index else True
+        return None
+
+    def compatible(wheel_tags):
+        return bool(wheel_tags & set(tags)) or abi3_score(wheel_tags, False) is not None
+
+    def rank(filename):
+        wheel_tags = parse(filename)
+        for i, tag in enumerate(tags):
+            if tag in wheel_tags:
+                return i
+        score = abi3_score(wheel_tags, True)
+        return 999999 if score is None else score
+
+    wheels = [f for f in files if f["filename"].endswith(".whl") and compatible(parse(f["filename"]))]
+    wheels.sort(key=lambda w: rank(w["filename"]))
+    return wheels[0] if wheels else None
+
+
+def bench(label: str, files: list[dict], tags: list[str]) -> None:
+    legacy = legacy_best_wheel(files, tags)
+    compiled = app._best_wheel(files, tags)
+    assert legacy == compiled, (legacy, compiled)
+    print(f"{label}: {len(files)} files, {len(tags)} client tags -> {compiled['filename']}")
+
+    runs = 20
+    legacy_s = min(timeit.repeat(lambda: legacy_best_wheel(files, tags), number=runs, repeat=3)) / runs
+    # Warm path: matcher and parsed wheel tags are memoized after the first selection.
+    compiled_s = min(timeit.repeat(lambda: app._best_wheel(files, tags), number=runs, repeat=3)) / runs
+
+    def cold():
+        app._compiled_tag_matcher.cache_clear()
+        app.parse_wheel_tags.cache_clear()
+        app._best_wheel(files, tags)
+
+    cold_s = min(timeit.repeat(cold, number=runs, repeat=3)) / runs
+    print(f"  legacy           {legacy_s * 1000:8.2f} ms")
+    print(f"  compiled (cold)  {cold_s * 1000:8.2f} ms  ({legacy_s / cold_s:5.1f}x)")
+    print(f"  compiled (warm)  {compiled_s * 1000:8.2f} ms  ({legacy_s / compiled_s:5.1f}x)")
+
+
+def main() -> None:
+    app.log.setLevel("WARNING")
+    tags = client_tags()
+    bench("numpy-like", release_files(), tags)
+    bench("abi3-only", abi3_release_files(), tags)
+
+
+if __name__ == "__main__":
+    main()
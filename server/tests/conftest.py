@@ -0,0 +1,49 @@
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+import pytest
+
+from fake_pypi import FakePyPI
+
+SERVER_DIR = Path(__file__).resolve().parent.parent
+
+# app.py reads its configuration at import time: point it at a throwaway cache and an
+# upstream that refuses connections, so no test touches pypi.org or the working tree.
+os.environ.setdefault("WHISPY_CACHE_DIR", tempfile.mkdtemp(prefix="whispy-tests-"))
+os.environ.setdefault("WHISPY_PYPI_BASE", "http://127.0.0.1:9/pypi")
+os.environ.setdefault("WHISPY_PYPI_SIMPLE", "http://127.0.0.1:9/simple")
+os.environ.setdefault("WHISPY_UPSTREAM_RETRIES", "0")
+sys.path.insert(0, str(SERVER_DIR))
+
+import app as whispy_app  # noqa: E402
+
+whispy_app.init_cache()
+
+
+@pytest.fixture
+def whispy():
+    return whispy_app
+
+
+@pytest.fixture
+def client():
+    return whispy_app.app.test_client()
+
+
+@pytest.fixture
+def limiter(whispy):
+    whispy.limiter.reset()
+    yield whispy.limiter
+    whispy.limiter.reset()
+
+
+@pytest.fixture
+def pypi(whispy, monkeypatch):
+    """A fake PyPI that app.py resolves and downloads from for the duration of a test."""
+    fake = FakePyPI()
+    monkeypatch.setattr(whispy, "PYPI_BASE", f"{fake.url}/pypi")
+    monkeypatch.setattr(whispy, "PYPI_SIMPLE", f"{fake.url}/simple")
+    yield fake
+    fake.close()
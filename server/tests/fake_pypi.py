@@ -0,0 +1,158 @@
+"""A small in-process stand-in for PyPI (JSON API, PEP 691 simple index and files)."""
+
+import hashlib
+import io
+import itertools
+import json
+import threading
+import zipfile
+from collections import Counter, defaultdict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+def make_wheel(name: str, version: str, requires=(), tag: str = "py3-none-any") -> bytes:
+    buf = io.BytesIO()
+    with zipfile.ZipFile(buf, "w", zipfile.ZIP_DEFLATED) as zf:
+        zf.writestr(f"{name}/__init__.py", f"NAME = {name!r}\nVERSION = {version!r}\n")
+        metadata = f"Metadata-Version: 2.1\nName: {name}\nVersion: {version}\n"
+        metadata += "".join(f"Requires-Dist: {req}\n" for req in requires)
+        zf.writestr(f"{name}-{version}.dist-info/METADATA", metadata)
+        zf.writestr(f"{name}-{version}.dist-info/WHEEL", f"Wheel-Version: 1.0\nTag: {tag}\n")
+    return buf.getvalue()
+
+
+class FakePyPI:
+    """
+    Serves the releases added with add(). hits counts requests per path, fail makes
+    a path answer 503 that many times, redirects maps a path to a Location, a path in
+    hang_up closes its keep-alive connection after answering without saying so, and
+    connections records which connection (numbered in order of
+    arrival) served each request.
+    """
+
+    def __init__(self):
+        self.releases: dict[str, dict[str, list[str]]] = {}
+        self.files: dict[str, bytes] = {}
+        self.hits: Counter = Counter()
+        self.fail: Counter = Counter()
+        self.redirects: dict[str, str] = {}
+        self.hang_up: set[str] = set()
+        self.connections: list[int] = []
+        self._connection_ids = itertools.count()
+        self.headers: dict[str, list] = defaultdict(list)
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), self._handler())
+        self._server.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self._server.server_address[1]}"
+        threading.Thread(target=self._server.serve_forever, args=(0.05,), daemon=True).start()
+
+    def close(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    def add(self, name: str, version: str, requires=(), body: bytes = None) -> dict:
+        """Publish one py3-none-any wheel; returns its file entry as the JSON API lists it."""
+        filename = f"{name}-{version}-py3-none-any.whl"
+        self.files[filename] = body if body is not None else make_wheel(name, version, requires)
+        self.releases.setdefault(name, {})[version] = list(requires)
+        return self._file_entry(filename)
+
+    def _file_entry(self, filename: str) -> dict:
+        data = self.files[filename]
+        return {
+            "filename": filename,
+            "url": f"{self.url}/files/{filename}",
+            "digests": {"sha256": hashlib.sha256(data).hexdigest()},
+            "size": len(data),
+            "yanked": False,
+        }
+
+    def _release_files(self, name: str, version: str) -> list[dict]:
+        return [
+            self._file_entry(filename) for filename in self.files
+            if filename.startswith(f"{name}-{version}-") or filename.startswith(f"{name}-{version}.")
+        ]
+
+    def document(self, name: str, version: str = None) -> dict:
+        """The JSON API document: the project's (with every release) or one release's."""
+        versions = self.releases[name]
+        latest = version or max(versions, key=lambda v: [int(p) for p in v.split(".")])
+        info = {"name": name, "version": latest, "requires_dist": versions[latest] or None, "requires_python": None}
+        doc = {"info": info, "urls": self._release_files(name, latest)}
+        if version is None:
+            doc["releases"] = {v: self._release_files(name, v) for v in versions}
+        return doc
+
+    def _respond(self, path: str, headers) -> tuple[int, dict, bytes]:
+        parts = [p for p in path.split("?")[0].split("/") if p]
+        if path in self.redirects:
+            return 302, {"Location": self.redirects[path]}, b""
+        if parts[:1] == ["files"] and len(parts) == 2 and parts[1] in self.files:
+            return 200, {"Content-Type": "application/octet-stream"}, self.files[parts[1]]
+        if parts[:1] == ["pypi"] and parts[-1] == "json" and len(parts) in (3, 4) and parts[1] in self.releases:
+            version = parts[2] if len(parts) == 4 else None
+            if version and version not in self.releases[parts[1]]:
+                return 404, {}, b"{}"
+            body = json.dumps(self.document(parts[1], version)).encode()
+            return self._conditional(headers, body, "application/json")
+        if parts[:1] == ["simple"] and len(parts) == 2 and parts[1] in self.releases:
+            name = parts[1]
+            files = [
+                {"filename": f["filename"], "url": f["url"], "hashes": {"sha256": f["digests"]["sha256"]}}
+                for version in self.releases[name] for f in self._release_files(name, version)
+            ]
+            body = json.dumps({
+                "meta": {"api-version": "1.1"}, "name": name, "versions": sorted(self.releases[name]), "files": files,
+            }).encode()
+            return self._conditional(headers, body, "application/vnd.pypi.simple.v1+json")
+        return 404, {}, b"{}"
+
+    @staticmethod
+    def _conditional(headers, body: bytes, content_type: str) -> tuple[int, dict, bytes]:
+        etag = f'"{hashlib.sha256(body).hexdigest()[:16]}"'
+        if headers.get("If-None-Match") == etag:
+            return 304, {"ETag": etag}, b""
+        return 200, {"ETag": etag, "Content-Type": content_type}, body
+
+    def _handler(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def setup(self):
+                super().setup()
+                self.connection_id = next(fake._connection_ids)
+
+            def do_GET(self):
+                path = self.path
+                if "://" in path:  # proxied request: absolute URL
+                    path = "/" + path.split("://", 1)[1].split("/", 1)[1]
+                fake.hits[path] += 1
+                fake.connections.append(self.connection_id)
+                fake.headers[path].append(dict(self.headers))
+                if fake.fail[path] > 0:
+                    fake.fail[path] -= 1
+                    status, headers, body = 503, {}, b"{}"
+                else:
+                    status, headers, body = fake._respond(path, self.headers)
+                self.send_response(status)
+                for key, value in headers.items():
+                    self.send_header(key, value)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+                if path in fake.hang_up:
+                    self.close_connection = True
+
+            def do_CONNECT(self):
+                fake.hits[f"CONNECT {self.path}"] += 1
+                fake.headers[f"CONNECT {self.path}"].append(dict(self.headers))
+                self.send_response(403)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                self.close_connection = True
+
+        return Handler
@@ -0,0 +1,43 @@
+import asyncio
+import uuid
+
+import httpx
+import pytest
+
+import asgi
+
+TAGS = "py3-none-any"
+
+
+def _get(path, params):
+    async def run():
+        transport = httpx.ASGITransport(app=asgi.app)
+        try:
+            async with httpx.AsyncClient(transport=transport, base_url="http://whispy") as http:
+                return await http.get(path, params=params)
+        finally:
+            # The upstream client belongs to this event loop.
+            if asgi._client is not None:
+                await asgi._client.aclose()
+                asgi._client = None
+
+    return asyncio.run(run())
+
+
+def test_prefetch_warms_the_build(pypi, limiter):
+    name = f"demo{uuid.uuid4().hex[:8]}"
+    pypi.add(name, "1.0")
+    resp = _get("/get_package", {"name": name, "tags": TAGS})
+    assert resp.status_code == 200
+    assert pypi.hits[f"/files/{name}-1.0-py3-none-any.whl"] == 1
+
+
+@pytest.mark.parametrize("path, limit", [("/get_package", 60), ("/get_batch", 30), ("/plan", 60)])
+def test_over_limit_requests_cost_no_upstream_traffic(client, pypi, limiter, path, limit):
+    name = f"demo{uuid.uuid4().hex[:8]}"
+    pypi.add(name, "1.0")
+    for _ in range(limit):
+        client.get(path)  # rejected for missing parameters, but counted
+    resp = _get(path, {"name": name, "packages": name, "tags": TAGS})
+    assert resp.status_code == 429
+    assert sum(pypi.hits.values()) == 0
@@ -0,0 +1,38 @@
+import gzip
+import hashlib
+import io
+import uuid
+import zipfile
+
+
+def _store(whispy, body):
+    sha = hashlib.sha256(body).hexdigest()
+    path = whispy._blob_path(sha)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(body)
+    whispy._catalog_record(f"blob:{sha}", "blob", len(body))
+    return sha
+
+
+def test_blob_content_types(whispy, client):
+    wheel = io.BytesIO()
+    with zipfile.ZipFile(wheel, "w") as zf:
+        zf.writestr("demo/__init__.py", uuid.uuid4().hex)
+    sdist = gzip.compress(uuid.uuid4().bytes)
+
+    resp = client.get(f"/blob/{_store(whispy, wheel.getvalue())}")
+    assert resp.status_code == 200
+    assert resp.mimetype == "application/zip"
+    resp = client.get(f"/blob/{_store(whispy, sdist)}")
+    assert resp.status_code == 200
+    assert resp.mimetype == "application/gzip"
+    assert resp.data == sdist
+
+
+def test_misses_get_the_normal_limit(whispy, client, limiter):
+    sha = _store(whispy, uuid.uuid4().bytes)
+    statuses = [client.get(f"/blob/{uuid.uuid4().hex}{uuid.uuid4().hex}").status_code for _ in range(61)]
+    assert statuses[:60] == [404] * 60
+    assert statuses[60] == 429
+    # Hits are only held to the higher limit.
+    assert all(client.get(f"/blob/{sha}").status_code == 200 for _ in range(100))
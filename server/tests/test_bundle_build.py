@@ -0,0 +1,72 @@
+import json
+import uuid
+import zipfile
+
+from fake_pypi import make_wheel
+
+TAGS = ["py3-none-any"]
+
+
+def _corrupt_second_member(wheel: bytes) -> bytes:
+    """A wheel whose central directory reads fine but whose second member's local header is broken."""
+    second = wheel.index(b"PK\x03\x04", 4)
+    return wheel[:second] + b"XXXX" + wheel[second + 4:]
+
+
+def test_package_that_fails_to_copy_is_left_out(whispy, client, pypi):
+    root, good, bad = (f"{prefix}{uuid.uuid4().hex[:8]}" for prefix in ("root", "good", "bad"))
+    pypi.add(good, "1.0")
+    pypi.add(bad, "1.0", body=_corrupt_second_member(make_wheel(bad, "1.0")))
+    pypi.add(root, "1.0", requires=[good, bad])
+
+    resp = client.get("/get_package", query_string={"name": root, "tags": ",".join(TAGS), "deps": "1", "stream": "0"})
+    assert resp.status_code == 200
+    manifest = json.loads(resp.headers["X-Whispy-Manifest"])
+    assert sorted(entry["name"] for entry in manifest) == sorted([root, good])
+
+    bundle = whispy.CACHE_DIR / f"{whispy._cache_key(root, '1.0', ','.join(TAGS), True)}.zip"
+    with zipfile.ZipFile(bundle) as zf:
+        assert zf.testzip() is None
+        assert not [name for name in zf.namelist() if name.startswith(bad)]
+    assert bad not in json.loads(bundle.with_suffix(".members.json").read_text())
+
+
+def test_blob_evicted_during_build_is_still_bundled(whispy, client, pypi, monkeypatch):
+    root, dep = (f"{prefix}{uuid.uuid4().hex[:8]}" for prefix in ("root", "dep"))
+    shas = {pypi.add(dep, "1.0")["digests"]["sha256"], pypi.add(root, "1.0", requires=[dep])["digests"]["sha256"]}
+    add_source = whispy._add_source_to_bundle
+
+    def evict_then_add(zf, source, names, compression="auto"):
+        # Eviction running in another request, between fetching a blob and copying it.
+        for sha in shas:
+            with whispy._file_lock(f"entry-blob:{sha}", wait=False) as locked:
+                assert locked
+                whispy._evict_blob(sha)
+        return add_source(zf, source, names, compression)
+
+    monkeypatch.setattr(whispy, "_add_source_to_bundle", evict_then_add)
+    resp = client.get("/get_package", query_string={"name": root, "tags": ",".join(TAGS), "deps": "1", "stream": "0"})
+    assert resp.status_code == 200
+    assert sorted(entry["name"] for entry in json.loads(resp.headers["X-Whispy-Manifest"])) == sorted([root, dep])
+    assert not any(whispy._blob_path(sha).exists() for sha in shas)
+    with zipfile.ZipFile(whispy.CACHE_DIR / f"{whispy._cache_key(root, '1.0', ','.join(TAGS), True)}.zip") as zf:
+        assert zf.testzip() is None
+        assert {f"{root}/__init__.py", f"{dep}/__init__.py"} <= set(zf.namelist())
+
+
+def test_streamed_cache_hit_is_looked_up_once(whispy, client, pypi, monkeypatch):
+    name = f"demo{uuid.uuid4().hex[:8]}"
+    pypi.add(name, "1.0")
+    query = {"name": name, "tags": ",".join(TAGS)}
+    assert client.get("/get_package", query_string=dict(query, stream="0")).status_code == 200
+
+    calls = []
+    fetch = whispy.fetch_package_zip
+    monkeypatch.setattr(whispy, "fetch_package_zip", lambda *a, **kw: calls.append(a) or fetch(*a, **kw))
+    hits = whispy._counters["cache_hits"]
+    resp = client.get("/get_package", query_string=dict(query, stream="1"))
+    assert resp.status_code == 200
+    assert "X-Whispy-Streamed" not in resp.headers
+    assert json.loads(resp.headers["X-Whispy-Manifest"])[0]["name"] == name
+    assert len(calls) == 1
+    assert whispy._counters["cache_hits"] == hits + 1
@@ -0,0 +1,126 @@
+import io
+import types
+import zipfile
+
+import pytest
+
+unpacking = pytest.importorskip("pip._internal.utils.unpacking")
+
+TEXT = b"def hello():\n    return 'hello'\n" * 200
+NATIVE = bytes(range(256)) * 64
+
+
+class _Unseekable(io.RawIOBase):
+    """Write-only stream without seek/tell, so zipfile falls back to data descriptors."""
+
+    def __init__(self):
+        self.buf = io.BytesIO()
+
+    def writable(self):
+        return True
+
+    def write(self, b):
+        return self.buf.write(b)
+
+
+def _make_wheel(path, streamed=False):
+    members = {
+        "demo/__init__.py": (TEXT, zipfile.ZIP_DEFLATED),
+        "demo/_native.so": (NATIVE, zipfile.ZIP_STORED),
+        "demo-1.0.dist-info/METADATA": (b"Metadata-Version: 2.1\nName: demo\nVersion: 1.0\n", zipfile.ZIP_DEFLATED),
+    }
+    target = _Unseekable() if streamed else path
+    with zipfile.ZipFile(target, "w") as zf:
+        for name, (data, compress_type) in members.items():
+            info = zipfile.ZipInfo(name, (2024, 1, 2, 3, 4, 6))
+            info.compress_type = compress_type
+            info.external_attr = 0o644 << 16
+            with zf.open(info, "w") as out:
+                out.write(data)
+    if streamed:
+        path.write_bytes(target.buf.getvalue())
+    return {name: data for name, (data, _) in members.items()}
+
+
+def _bundle(whispy, tmp_path, wheels, compression):
+    out = tmp_path / f"bundle-{compression}.zip"
+    names = set()
+    with whispy._BundleWriter(out, "w", zipfile.ZIP_DEFLATED) as zf:
+        for wheel in wheels:
+            whispy._add_source_to_bundle(zf, wheel, names, compression)
+    return out
+
+
+def _check(bundle, expected, tmp_path):
+    with zipfile.ZipFile(bundle) as zf:
+        assert zf.testzip() is None
+        assert {name: zf.read(name) for name in zf.namelist()} == expected
+    target = tmp_path / "extracted"
+    unpacking.unzip_file(str(bundle), str(target), flatten=False)
+    for name, data in expected.items():
+        assert (target / name).read_bytes() == data
+
+
+@pytest.mark.parametrize("streamed", [False, True], ids=["sized", "data-descriptor"])
+@pytest.mark.parametrize("compression", ["auto", "stored"])
+def test_bundle_from_wheel(whispy, tmp_path, compression, streamed):
+    wheel = tmp_path / "demo-1.0-py3-none-any.whl"
+    expected = _make_wheel(wheel, streamed)
+    bundle = _bundle(whispy, tmp_path, [wheel], compression)
+    _check(bundle, expected, tmp_path)
+
+    with zipfile.ZipFile(wheel) as src, zipfile.ZipFile(bundle) as out:
+        for info in src.infolist():
+            copied = out.getinfo(info.filename)
+            assert copied.flag_bits & 0x08 == 0
+            if compression == "stored":
+                assert copied.compress_type == zipfile.ZIP_STORED
+            else:
+                # Raw copies keep the wheel's own compression and bytes.
+                assert copied.compress_type == info.compress_type
+                assert copied.compress_size == info.compress_size
+
+
+def test_duplicate_members_are_skipped(whispy, tmp_path):
+    first = tmp_path / "demo-1.0-py3-none-any.whl"
+    second = tmp_path / "demo-1.0-py2.py3-none-any.whl"
+    expected = _make_wheel(first)
+    _make_wheel(second)
+    bundle = _bundle(whispy, tmp_path, [first, second], "auto")
+    _check(bundle, expected, tmp_path)
+
+
+@pytest.mark.parametrize("compression", ["auto", "stored"])
+def test_zip64_central_directory(whispy, tmp_path, compression):
+    # More entries than a classic end-of-central-directory record can count.
+    count = 0x10000 + 10
+    wheel = tmp_path / "many-1.0-py3-none-any.whl"
+    expected = {}
+    with zipfile.ZipFile(wheel, "w", zipfile.ZIP_DEFLATED) as zf:
+        for i in range(count):
+            name = f"many/m{i:05d}.txt"
+            expected[name] = f"{i}\n".encode()
+            zf.writestr(name, expected[name], compress_type=zipfile.ZIP_STORED if i % 2 else zipfile.ZIP_DEFLATED)
+    bundle = _bundle(whispy, tmp_path, [wheel], compression)
+    with zipfile.ZipFile(bundle) as zf:
+        assert len(zf.infolist()) == count
+    _check(bundle, expected, tmp_path)
+
+
+def test_truncated_member_is_rolled_back(whispy, tmp_path):
+    wheel = tmp_path / "demo-1.0-py3-none-any.whl"
+    expected = _make_wheel(wheel)
+    with zipfile.ZipFile(wheel) as src:
+        info = src.getinfo("demo/_native.so")
+    # The stored member's data stops 100 bytes in; write_raw only reads through source.fp.
+    cut = info.header_offset + zipfile.sizeFileHeader + len(info.filename) + 100
+    truncated = types.SimpleNamespace(fp=io.BytesIO(wheel.read_bytes()[:cut]))
+
+    out = tmp_path / "bundle.zip"
+    with whispy._BundleWriter(out, "w") as zf, zipfile.ZipFile(wheel) as good:
+        zf.write_raw(good, good.getinfo("demo/__init__.py"))
+        with pytest.raises(zipfile.BadZipFile):
+            zf.write_raw(truncated, info)
+        zf.write_raw(good, good.getinfo("demo-1.0.dist-info/METADATA"))
+    del expected["demo/_native.so"]
+    _check(out, expected, tmp_path)
@@ -0,0 +1,39 @@
+import os
+import subprocess
+import sys
+
+from conftest import SERVER_DIR
+
+# Publishes one blob under a relative WHISPY_CACHE_DIR and fetches it back through Flask.
+SCRIPT = """
+import hashlib, sys
+sys.path.insert(0, sys.argv[1])
+import app
+body = b"not really a wheel"
+sha = hashlib.sha256(body).hexdigest()
+blob = app._blob_path(sha)
+blob.parent.mkdir(parents=True, exist_ok=True)
+blob.write_bytes(body)
+resp = app.app.test_client().get(f"/blob/{sha}")
+print(app.CACHE_DIR)
+print(resp.status_code)
+print(hashlib.sha256(resp.data).hexdigest() == sha)
+"""
+
+
+def test_relative_cache_dir_serves_hits(tmp_path):
+    # The server directory is Flask's root_path; run from elsewhere so a relative path would miss.
+    env = dict(os.environ, WHISPY_CACHE_DIR="relative-cache")
+    result = subprocess.run(
+        [sys.executable, "-c", SCRIPT, str(SERVER_DIR)],
+        cwd=tmp_path, env=env, capture_output=True, text=True, timeout=60,
+    )
+    assert result.returncode == 0, result.stderr
+    cache_dir, status, same = result.stdout.split()
+    assert cache_dir == str(tmp_path.resolve() / "relative-cache")
+    assert status == "200"
+    assert same == "True"
+
+
+def test_cache_dir_is_absolute(whispy):
+    assert whispy.CACHE_DIR.is_absolute()
@@ -0,0 +1,142 @@
+import hashlib
+import uuid
+import zipfile
+
+import pytest
+
+
+def _recount(whispy):
+    rows = whispy._catalog().execute("SELECT kind, COUNT(*), SUM(size) FROM entries GROUP BY kind").fetchall()
+    counted = {"bundle": (0, 0), "blob": (0, 0)}
+    counted.update({kind: (entries, size) for kind, entries, size in rows})
+    return counted
+
+
+def _assert_totals(whispy, client):
+    totals = whispy._cache_totals()
+    assert totals == _recount(whispy)
+    stats = client.get("/stats").get_json()
+    assert stats["cached_packages"] == totals["bundle"][0]
+    assert stats["cached_blobs"] == totals["blob"][0]
+    assert stats["cache_size_mb"] == round(sum(size for _, size in totals.values()) / 1024 / 1024, 2)
+
+
+def _bundle(tmp_path, members=1):
+    path = tmp_path / f"{uuid.uuid4().hex}.zip"
+    with zipfile.ZipFile(path, "w") as zf:
+        for i in range(members):
+            zf.writestr(f"pkg/m{i}.py", f"x = {i}\n" * 50)
+    return path
+
+
+def _blob(whispy, body=None):
+    body = body or uuid.uuid4().bytes * 64
+    sha = hashlib.sha256(body).hexdigest()
+    path = whispy._blob_path(sha)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(body)
+    whispy._catalog_record(f"blob:{sha}", "blob", len(body))
+    return sha
+
+
+def test_totals_follow_insert_resize_and_evict(whispy, client, tmp_path):
+    key = f"test-{uuid.uuid4().hex}"
+    before = whispy._cache_totals()
+
+    whispy.cache_put(key, _bundle(tmp_path))
+    assert whispy._cache_totals()["bundle"][0] == before["bundle"][0] + 1
+    _assert_totals(whispy, client)
+
+    # Re-publishing the same key only changes its size.
+    dest = whispy.cache_put(key, _bundle(tmp_path, members=20))
+    assert whispy._cache_totals()["bundle"][0] == before["bundle"][0] + 1
+    assert whispy._cache_totals()["bundle"][1] == before["bundle"][1] + dest.stat().st_size
+    _assert_totals(whispy, client)
+
+    sha = _blob(whispy)
+    assert whispy._cache_totals()["blob"][0] == before["blob"][0] + 1
+    _assert_totals(whispy, client)
+
+    whispy._evict_bundle_files(key)
+    whispy._evict_blob(sha)
+    assert whispy._cache_totals() == before
+    _assert_totals(whispy, client)
+
+
+def test_rebuild_reconciles_with_disk(whispy, client, tmp_path):
+    gone, kept = f"test-{uuid.uuid4().hex}", f"test-{uuid.uuid4().hex}"
+    whispy.cache_put(gone, _bundle(tmp_path))
+    whispy.cache_put(kept, _bundle(tmp_path))
+    for suffix in (".json", ".zip"):
+        (whispy.CACHE_DIR / f"{gone}{suffix}").unlink()
+    orphan = _blob(whispy)
+    whispy._catalog_remove(f"blob:{orphan}")
+
+    whispy._catalog_rebuild()
+    keys = {key for (key,) in whispy._catalog().execute("SELECT key FROM entries")}
+    assert gone not in keys
+    assert {kept, f"blob:{orphan}"} <= keys
+    _assert_totals(whispy, client)
+
+
+def test_eviction_skips_entries_being_opened(whispy, client, tmp_path, monkeypatch):
+    if whispy.fcntl is None:
+        pytest.skip("entry locks are a no-op without fcntl")
+    busy, idle = f"test-{uuid.uuid4().hex}", f"test-{uuid.uuid4().hex}"
+    whispy.cache_put(busy, _bundle(tmp_path))
+    whispy.cache_put(idle, _bundle(tmp_path))
+
+    monkeypatch.setattr(whispy, "MAX_CACHE_BYTES", 0)
+    with whispy._file_lock(f"entry-{busy}", shared=True):
+        whispy._evict_if_needed()
+        assert whispy.cache_get(busy, touch=False) is not None
+        assert whispy.cache_get(idle, touch=False) is None
+    whispy._evict_if_needed()
+    assert whispy.cache_get(busy, touch=False) is None
+    assert whispy._cache_totals() == {"bundle": (0, 0), "blob": (0, 0)}
+    _assert_totals(whispy, client)
+
+
+def test_open_bundle_outlives_eviction(whispy, tmp_path):
+    key = f"test-{uuid.uuid4().hex}"
+    source = _bundle(tmp_path)
+    dest = whispy.cache_put(key, source)
+    file, sha = whispy._open_bundle(dest)
+    whispy._evict_bundle_files(key)
+    with file:
+        assert hashlib.sha256(file.read()).hexdigest() == sha == hashlib.sha256(source.read_bytes()).hexdigest()
+    assert whispy._open_bundle(dest) is None
+
+
+def test_blob_evicted_before_open_is_fetched_again(whispy, client, monkeypatch):
+    body = uuid.uuid4().bytes * 64
+    sha = _blob(whispy, body)
+    fetch_blob = whispy.fetch_blob
+    calls = []
+
+    def racing_fetch_blob(sha256, package, version):
+        calls.append(sha256)
+        if len(calls) == 2:
+            # The retry fetches it again (here: publishes the same bytes).
+            _blob(whispy, body)
+        path = fetch_blob(sha256, package, version)
+        if len(calls) == 1:
+            # Eviction lands between the verified fetch and the open.
+            whispy._evict_blob(sha256)
+        return path
+
+    monkeypatch.setattr(whispy, "fetch_blob", racing_fetch_blob)
+    resp = client.get(f"/blob/{sha}")
+    assert resp.status_code == 200
+    assert resp.data == body
+    assert len(calls) == 2
+
+
+def test_blob_range_request(whispy, client):
+    body = bytes(range(256)) * 16
+    sha = _blob(whispy, body)
+    resp = client.get(f"/blob/{sha}", headers={"Range": "bytes=100-199"})
+    assert resp.status_code == 206
+    assert resp.data == body[100:200]
+    assert resp.headers["Content-Range"] == f"bytes 100-199/{len(body)}"
+    assert client.get(f"/blob/{sha}", headers={"If-None-Match": f'"{sha}"'}).status_code == 304
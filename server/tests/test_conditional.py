@@ -0,0 +1,65 @@
+import uuid
+
+import pytest
+
+
+@pytest.fixture
+def bundle(client, pypi):
+    """(query, full response body, ETag) of a cached /get_package bundle."""
+    name = f"demo{uuid.uuid4().hex[:8]}"
+    pypi.add(name, "1.0")
+    query = {"name": name, "tags": "py3-none-any", "stream": "0"}
+    resp = client.get("/get_package", query_string=query)
+    assert resp.status_code == 200
+    return query, resp.data, resp.headers["ETag"]
+
+
+def test_cached_bundle_has_validators(client, bundle):
+    query, body, etag = bundle
+    resp = client.get("/get_package", query_string=query)
+    assert resp.headers["ETag"] == etag
+    assert resp.headers["Accept-Ranges"] == "bytes"
+    assert int(resp.headers["Content-Length"]) == len(body)
+    assert resp.headers["Last-Modified"]
+
+
+def test_if_none_match(client, bundle):
+    query, _, etag = bundle
+    resp = client.get("/get_package", query_string=query, headers={"If-None-Match": etag})
+    assert resp.status_code == 304
+    assert resp.data == b""
+    assert resp.headers["ETag"] == etag
+
+    resp = client.get("/get_package", query_string=query, headers={"If-None-Match": '"other"'})
+    assert resp.status_code == 200
+
+
+def test_range(client, bundle):
+    query, body, _ = bundle
+    resp = client.get("/get_package", query_string=query, headers={"Range": "bytes=10-29"})
+    assert resp.status_code == 206
+    assert resp.data == body[10:30]
+    assert resp.headers["Content-Range"] == f"bytes 10-29/{len(body)}"
+
+    resp = client.get("/get_package", query_string=query, headers={"Range": "bytes=-5"})
+    assert resp.status_code == 206
+    assert resp.data == body[-5:]
+
+
+def test_unsatisfiable_range(client, bundle):
+    query, body, _ = bundle
+    resp = client.get("/get_package", query_string=query, headers={"Range": f"bytes={len(body)}-"})
+    assert resp.status_code == 416
+    assert resp.headers["Content-Range"] == f"bytes */{len(body)}"
+
+
+def test_if_range(client, bundle):
+    query, body, etag = bundle
+    resp = client.get("/get_package", query_string=query, headers={"Range": "bytes=0-9", "If-Range": etag})
+    assert resp.status_code == 206
+    assert resp.data == body[:10]
+
+    # A resumed download of something else gets the whole current bundle.
+    resp = client.get("/get_package", query_string=query, headers={"Range": "bytes=0-9", "If-Range": '"other"'})
+    assert resp.status_code == 200
+    assert resp.data == body
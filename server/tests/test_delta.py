@@ -0,0 +1,96 @@
+import hashlib
+import io
+import json
+import uuid
+import zipfile
+
+import pytest
+
+PACKAGES = ["alpha", "beta", "gamma", "delta"]
+
+
+def _base_bundle(whispy, tmp_path):
+    """A cached full bundle with one member per package, plus its manifest and member index."""
+    key = f"test-{uuid.uuid4().hex}"
+    path = tmp_path / "full.zip"
+    manifest, members = [], {}
+    with zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED) as zf:
+        for name in PACKAGES:
+            arcname = f"{name}/__init__.py"
+            zf.writestr(arcname, f"NAME = {name!r}\n")
+            manifest.append({"name": name, "version": "1.0", "sha256": hashlib.sha256(name.encode()).hexdigest()})
+            members[name] = [arcname]
+    return whispy.cache_put(key, path, manifest, members), manifest
+
+
+def _have(manifest, *names):
+    return {entry["sha256"][:16] for entry in manifest if entry["name"] in names}
+
+
+def test_delta_omits_held_packages(whispy, tmp_path):
+    bundle, manifest = _base_bundle(whispy, tmp_path)
+    delta_path, omitted = whispy.delta_bundle(bundle, manifest, _have(manifest, "beta"))
+    assert omitted == ["beta"]
+    with zipfile.ZipFile(delta_path) as zf:
+        assert zf.testzip() is None
+        assert sorted(zf.namelist()) == sorted(f"{n}/__init__.py" for n in PACKAGES if n != "beta")
+
+
+def test_delta_variants_are_capped(whispy, tmp_path, monkeypatch):
+    monkeypatch.setattr(whispy, "DELTA_MAX_VARIANTS", 2)
+    bundle, manifest = _base_bundle(whispy, tmp_path)
+    first = whispy.delta_bundle(bundle, manifest, _have(manifest, "alpha"))
+    second = whispy.delta_bundle(bundle, manifest, _have(manifest, "beta"))
+    assert first and second
+    assert whispy._delta_variants(bundle.stem) == 2
+
+    # A third distinct delta is not built; the caller serves the full bundle.
+    assert whispy.delta_bundle(bundle, manifest, _have(manifest, "gamma")) is None
+    assert whispy._delta_variants(bundle.stem) == 2
+    # Cached variants are still served.
+    assert whispy.delta_bundle(bundle, manifest, _have(manifest, "alpha"))[0] == first[0]
+
+    whispy._evict_bundle_files(first[0].stem)
+    assert whispy.delta_bundle(bundle, manifest, _have(manifest, "gamma")) is not None
+
+
+def test_have_is_capped(whispy, client, monkeypatch):
+    monkeypatch.setattr(whispy, "DELTA_MAX_HAVE", 3)
+    digests = [uuid.uuid4().hex for _ in range(4)]
+    assert len(whispy._parse_have(",".join(digests[:3]))) == 3
+    with pytest.raises(ValueError):
+        whispy._parse_have(",".join(digests))
+
+    query = {"name": "alpha", "tags": "py3-none-any", "have": ",".join(digests)}
+    for route in ("/get_package", "/get_batch"):
+        params = dict(query, packages="alpha") if route == "/get_batch" else query
+        resp = client.get(route, query_string=params)
+        assert resp.status_code == 400
+        assert "have" in json.loads(resp.data)["error"]
+
+
+def test_roots_are_never_omitted(whispy, tmp_path):
+    bundle, manifest = _base_bundle(whispy, tmp_path)
+    delta_path, omitted = whispy.delta_bundle(bundle, manifest, _have(manifest, "alpha", "beta"), frozenset({"alpha"}))
+    assert omitted == ["beta"]
+    assert whispy.delta_bundle(bundle, manifest, _have(manifest, "alpha"), frozenset({"alpha"})) is None
+
+
+def test_have_applies_to_dependencies_only(whispy, client, pypi):
+    root, dep = (f"{prefix}{uuid.uuid4().hex[:8]}" for prefix in ("root", "dep"))
+    root_sha = pypi.add(root, "1.0", requires=[dep])["digests"]["sha256"]
+    dep_sha = pypi.add(dep, "1.0")["digests"]["sha256"]
+    query = {"name": root, "tags": "py3-none-any", "stream": "0", "have": f"{root_sha},{dep_sha}"}
+
+    resp = client.get("/get_package", query_string=query)
+    assert resp.status_code == 200
+    assert "X-Whispy-Delta" not in resp.headers
+    with zipfile.ZipFile(io.BytesIO(resp.data)) as zf:
+        assert f"{root}/__init__.py" in zf.namelist()
+
+    resp = client.get("/get_package", query_string=dict(query, deps="1"))
+    assert resp.status_code == 200
+    assert json.loads(resp.headers["X-Whispy-Delta"]) == [dep]
+    with zipfile.ZipFile(io.BytesIO(resp.data)) as zf:
+        assert f"{root}/__init__.py" in zf.namelist()
+        assert all(name.startswith(root) for name in zf.namelist())
@@ -0,0 +1,60 @@
+import threading
+import time
+
+import pytest
+
+
+@pytest.fixture(autouse=True)
+def _needs_fcntl(whispy):
+    if whispy.fcntl is None:
+        pytest.skip("file locks are a no-op without fcntl")
+
+
+def test_lock_file_removed_on_release(whispy):
+    path = whispy.LOCK_DIR / "test-release.lock"
+    with whispy._file_lock("test-release"):
+        assert path.exists()
+    assert not path.exists()
+
+
+def test_contended_lock_excludes_and_cleans_up(whispy):
+    # Waiters that locked a file the holder has since deleted must retry, not run alongside it.
+    active = []
+    overlaps = []
+
+    def worker():
+        for _ in range(20):
+            with whispy._file_lock("test-contended", timeout=30):
+                active.append(1)
+                if len(active) > 1:
+                    overlaps.append(len(active))
+                time.sleep(0.001)
+                active.pop()
+
+    threads = [threading.Thread(target=worker) for _ in range(6)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert overlaps == []
+    assert not (whispy.LOCK_DIR / "test-contended.lock").exists()
+
+
+def test_timeout_leaves_holder_file(whispy):
+    path = whispy.LOCK_DIR / "test-timeout.lock"
+    with whispy._file_lock("test-timeout"):
+        with pytest.raises(TimeoutError):
+            with whispy._file_lock("test-timeout", timeout=0.2):
+                pass
+        assert path.exists()
+    assert not path.exists()
+
+
+def test_prune_keeps_held_locks(whispy):
+    stale = whispy.LOCK_DIR / "test-stale.lock"
+    stale.touch()
+    with whispy._file_lock("test-held"):
+        whispy._prune_lock_files()
+        assert (whispy.LOCK_DIR / "test-held.lock").exists()
+    assert not stale.exists()
+    assert not any(p.name.startswith("test-") for p in whispy.LOCK_DIR.iterdir())
@@ -0,0 +1,66 @@
+import logging
+import uuid
+import zipfile
+
+
+def _wheel(directory, project, marker="x"):
+    directory.mkdir(parents=True, exist_ok=True)
+    path = directory / f"{project}-1.0-py3-none-any.whl"
+    with zipfile.ZipFile(path, "w") as zf:
+        zf.writestr(f"{project}/__init__.py", f"MARKER = {marker!r}\n")
+        zf.writestr(f"{project}-1.0.dist-info/METADATA", f"Metadata-Version: 2.1\nName: {project}\nVersion: 1.0\n")
+    return path
+
+
+def _indexed_path(whispy, filename):
+    row = whispy._catalog().execute("SELECT path FROM local_wheels WHERE filename = ?", (filename,)).fetchone()
+    return row and row[0]
+
+
+def test_rerun_skips_unchanged(whispy, tmp_path):
+    project = f"demo{uuid.uuid4().hex[:8]}"
+    _wheel(tmp_path, project)
+    assert whispy.ingest_wheelhouse(tmp_path)["ingested"] == 1
+    assert whispy.ingest_wheelhouse(tmp_path) == {"ingested": 0, "skipped": 1, "duplicates": 0, "failed": 0}
+
+
+def test_identical_copies_are_not_reingested(whispy, tmp_path, caplog):
+    project = f"demo{uuid.uuid4().hex[:8]}"
+    first = _wheel(tmp_path / "a", project)
+    _wheel(tmp_path / "b", project)
+    _wheel(tmp_path / "c", project)
+
+    counts = whispy.ingest_wheelhouse(tmp_path, recursive=True)
+    assert counts == {"ingested": 1, "skipped": 0, "duplicates": 2, "failed": 0}
+    assert _indexed_path(whispy, first.name) == str(first.resolve())
+
+    caplog.clear()
+    with caplog.at_level(logging.INFO, logger="whispy"):
+        counts = whispy.ingest_wheelhouse(tmp_path, recursive=True)
+    assert counts == {"ingested": 0, "skipped": 1, "duplicates": 2, "failed": 0}
+    assert _indexed_path(whispy, first.name) == str(first.resolve())
+    assert [r.getMessage() for r in caplog.records if first.name in r.getMessage()] == [
+        f"Ignored 2 identical extra copies of {first.name}"
+    ]
+
+
+def test_conflicting_copy_keeps_the_indexed_wheel(whispy, tmp_path):
+    project = f"demo{uuid.uuid4().hex[:8]}"
+    first = _wheel(tmp_path / "a", project, marker="one")
+    _wheel(tmp_path / "b", project, marker="two")
+
+    counts = whispy.ingest_wheelhouse(tmp_path, recursive=True)
+    assert counts == {"ingested": 1, "skipped": 0, "duplicates": 0, "failed": 1}
+    sha = whispy._catalog().execute("SELECT sha256 FROM local_wheels WHERE filename = ?", (first.name,)).fetchone()[0]
+    assert sha == whispy._sha256_file(first)
+
+
+def test_moved_wheel_is_reindexed(whispy, tmp_path):
+    project = f"demo{uuid.uuid4().hex[:8]}"
+    old = _wheel(tmp_path / "a", project)
+    whispy.ingest_wheelhouse(tmp_path, recursive=True)
+    new = tmp_path / "b" / old.name
+    new.parent.mkdir()
+    old.rename(new)
+    assert whispy.ingest_wheelhouse(tmp_path, recursive=True)["ingested"] == 1
+    assert _indexed_path(whispy, old.name) == str(new.resolve())
@@ -0,0 +1,68 @@
+import hashlib
+import os
+import sys
+import threading
+import uuid
+
+import pytest
+from werkzeug.serving import make_server
+
+from conftest import SERVER_DIR
+
+sys.path.insert(0, str(SERVER_DIR.parent / "client"))
+
+from whispy_client import core  # noqa: E402
+
+
+@pytest.fixture
+def server(whispy, pypi, limiter):
+    """app.py served over HTTP in this process, so the client talks to it like to a real node."""
+    srv = make_server("127.0.0.1", 0, whispy.app, threaded=True)
+    thread = threading.Thread(target=srv.serve_forever, kwargs={"poll_interval": 0.05}, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{srv.server_port}"
+    srv.shutdown()
+    thread.join()
+
+
+@pytest.fixture
+def layered_client(tmp_path, monkeypatch):
+    """The client, with its own wheel cache, recording every URL it fetches."""
+    monkeypatch.setitem(core._config, "cache_dir", str(tmp_path / "client-cache"))
+    fetched = []
+    fetch_bytes = core._fetch_bytes
+    monkeypatch.setattr(core, "_fetch_bytes", lambda url, verbose=False: fetched.append(url) or fetch_bytes(url, verbose))
+    before = set(sys.modules)
+    yield fetched
+    core.whispy_cleanup()
+    for name in set(sys.modules) - before:
+        del sys.modules[name]
+
+
+def test_plan_blobs_are_assembled_with_a_partially_warm_cache(whispy, pypi, server, layered_client):
+    root, warm, cold = (f"{prefix}{uuid.uuid4().hex[:8]}" for prefix in ("root", "warm", "cold"))
+    sha = {name: pypi.add(name, "1.0")["digests"]["sha256"] for name in (warm, cold)}
+    sha[root] = pypi.add(root, "1.0", requires=[warm, cold])["digests"]["sha256"]
+
+    # One dependency is already in the client's wheel cache from an earlier process.
+    cached = os.path.join(core._config["cache_dir"], "blobs", sha[warm][:2], f"{sha[warm]}.whl")
+    os.makedirs(os.path.dirname(cached))
+    with open(cached, "wb") as f:
+        f.write(pypi.files[f"{warm}-1.0-py3-none-any.whl"])
+
+    module = core.remote(root, version="1.0", deps=True, host=server, layered=True)
+    assert module.NAME == root
+    assert __import__(warm).NAME == warm
+    assert __import__(cold).NAME == cold
+
+    plan = [url for url in layered_client if "/plan?" in url]
+    blobs = sorted(url.split("/blob/", 1)[1].split("?", 1)[0] for url in layered_client if "/blob/" in url)
+    assert len(plan) == 1
+    assert blobs == sorted([sha[root], sha[cold]])
+    assert set(core._held_digests) == set(sha.values())
+
+    # The downloaded wheels were verified and cached for the next process.
+    for name in (root, cold):
+        path = os.path.join(core._config["cache_dir"], "blobs", sha[name][:2], f"{sha[name]}.whl")
+        with open(path, "rb") as f:
+            assert hashlib.sha256(f.read()).hexdigest() == sha[name]
@@ -0,0 +1,81 @@
+import time
+import uuid
+
+import pytest
+
+
+@pytest.fixture
+def project(pypi):
+    name = f"demo{uuid.uuid4().hex[:8]}"
+    pypi.add(name, "1.0")
+    return name
+
+
+def _expire(whispy, monkeypatch, stale: int):
+    """Make every cached entry older than its TTL, with `stale` seconds of stale window."""
+    monkeypatch.setattr(whispy, "METADATA_TTL", 0)
+    monkeypatch.setattr(whispy, "METADATA_PINNED_TTL", 0)
+    monkeypatch.setattr(whispy, "METADATA_STALE_TTL", stale)
+
+
+def test_fresh_entries_are_served_from_cache(whispy, pypi, project):
+    for _ in range(3):
+        assert whispy.fetch_pypi_metadata(project, "1.0")["info"]["version"] == "1.0"
+    assert pypi.hits[f"/pypi/{project}/1.0/json"] == 1
+
+
+def test_expired_entry_is_revalidated_with_its_etag(whispy, pypi, project, monkeypatch):
+    path = f"/pypi/{project}/1.0/json"
+    first = whispy.fetch_pypi_metadata(project, "1.0")
+    _expire(whispy, monkeypatch, stale=0)
+
+    assert whispy.fetch_pypi_metadata(project, "1.0") == first
+    assert pypi.hits[path] == 2
+    assert "If-None-Match" not in pypi.headers[path][0]
+    assert pypi.headers[path][1]["If-None-Match"].startswith('"')
+
+    # The 304 refreshed the entry, so it is fresh again.
+    monkeypatch.setattr(whispy, "METADATA_PINNED_TTL", 3600)
+    whispy.fetch_pypi_metadata(project, "1.0")
+    assert pypi.hits[path] == 2
+
+
+def test_simple_index_is_revalidated_without_refetching_the_release(whispy, pypi, project, monkeypatch):
+    monkeypatch.setattr(whispy, "METADATA_BACKEND", "simple")
+    first = whispy.fetch_pypi_metadata(project)
+    _expire(whispy, monkeypatch, stale=0)
+    monkeypatch.setattr(whispy, "METADATA_PINNED_TTL", 3600)
+
+    assert whispy.fetch_pypi_metadata(project) == first
+    assert pypi.hits[f"/simple/{project}/"] == 2
+    assert "If-None-Match" in pypi.headers[f"/simple/{project}/"][1]
+    assert pypi.hits[f"/pypi/{project}/1.0/json"] == 1
+
+
+def test_stale_entry_is_served_and_refreshed_in_background(whispy, pypi, project, monkeypatch):
+    path = f"/pypi/{project}/1.0/json"
+    whispy.fetch_pypi_metadata(project, "1.0")
+    pypi.releases[project]["1.0"] = ["newdep"]  # the document changes upstream
+    _expire(whispy, monkeypatch, stale=3600)
+
+    # The stale copy is returned right away...
+    assert whispy.fetch_pypi_metadata(project, "1.0")["info"]["requires_dist"] is None
+    # ...while one background refresh fetches the new document.
+    deadline = time.monotonic() + 10
+    while f"{project}==1.0" in whispy._metadata_refreshing or pypi.hits[path] < 2:
+        assert time.monotonic() < deadline, "background refresh did not run"
+        time.sleep(0.01)
+    assert pypi.hits[path] == 2
+
+    monkeypatch.setattr(whispy, "METADATA_PINNED_TTL", 3600)
+    assert whispy.fetch_pypi_metadata(project, "1.0")["info"]["requires_dist"] == ["newdep"]
+    assert pypi.hits[path] == 2
+
+
+def test_stale_entry_is_served_when_upstream_fails(whispy, pypi, project, monkeypatch):
+    path = f"/pypi/{project}/1.0/json"
+    first = whispy.fetch_pypi_metadata(project, "1.0")
+    _expire(whispy, monkeypatch, stale=0)
+    pypi.fail[path] = 1
+    assert whispy.fetch_pypi_metadata(project, "1.0") == first
+    assert pypi.hits[path] == 2
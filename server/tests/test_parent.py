@@ -0,0 +1,69 @@
+import os
+import socket
+import subprocess
+import sys
+import time
+import urllib.request
+import uuid
+
+import pytest
+
+from conftest import SERVER_DIR
+
+SECRET = "node-secret"
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+@pytest.fixture
+def parent(pypi, tmp_path):
+    """A separate Whispy process, with its own cache, that resolves from the fake PyPI."""
+    port = _free_port()
+    env = dict(
+        os.environ,
+        WHISPY_CACHE_DIR=str(tmp_path / "parent-cache"),
+        WHISPY_PYPI_BASE=f"{pypi.url}/pypi",
+        WHISPY_PYPI_SIMPLE=f"{pypi.url}/simple",
+        WHISPY_NODE_SECRET=SECRET,
+    )
+    proc = subprocess.Popen(
+        [sys.executable, "app.py", "--host", "127.0.0.1", "--port", str(port)],
+        cwd=SERVER_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    url = f"http://127.0.0.1:{port}"
+    try:
+        for _ in range(200):
+            try:
+                urllib.request.urlopen(f"{url}/health", timeout=1).close()
+                break
+            except OSError:
+                time.sleep(0.05)
+        else:
+            pytest.fail("parent node did not start")
+        yield url
+    finally:
+        proc.terminate()
+        proc.wait(timeout=10)
+
+
+def test_cold_child_build_comes_from_the_parent(whispy, client, pypi, parent, limiter, monkeypatch):
+    monkeypatch.setattr(whispy, "PARENT_URL", parent)
+    monkeypatch.setattr(whispy, "PARENT_SECRET", SECRET)
+    root = f"root{uuid.uuid4().hex[:8]}"
+    # More dependencies than the parent's per-client limit on /blob misses (60 per minute).
+    deps = [f"{root}dep{i}" for i in range(70)]
+    for dep in deps:
+        pypi.add(dep, "1.0")
+    pypi.add(root, "1.0", requires=deps)
+    hits, misses = whispy._counters["parent_hits"], whispy._counters["parent_misses"]
+
+    resp = client.get("/get_package", query_string={"name": root, "tags": "py3-none-any", "deps": "1", "stream": "0"})
+    assert resp.status_code == 200
+    assert whispy._counters["parent_hits"] - hits == len(deps) + 1
+    assert whispy._counters["parent_misses"] == misses
+    # Every file was downloaded from PyPI once, by the parent.
+    assert all(pypi.hits[f"/files/{name}-1.0-py3-none-any.whl"] == 1 for name in [root, *deps])
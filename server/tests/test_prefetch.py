@@ -0,0 +1,77 @@
+import os
+import subprocess
+import sys
+import time
+import uuid
+
+import pytest
+
+from conftest import SERVER_DIR
+
+TAGS = ["py3-none-any"]
+
+
+@pytest.mark.parametrize("spec", [
+    {"name": "requests", "version": 2},
+    {"name": "requests", "version": ["2.31.0"]},
+    {"name": "requests", "deps": "false"},
+    {"name": "requests", "deps": 1},
+])
+def test_invalid_package_specs_are_rejected(client, spec):
+    resp = client.post("/prefetch", json={"packages": [spec], "tags": TAGS})
+    assert resp.status_code == 400
+    assert "error" in resp.get_json()
+
+
+def test_top_level_deps_must_be_boolean(client):
+    resp = client.post("/prefetch", json={"packages": ["requests"], "tags": TAGS, "deps": "false"})
+    assert resp.status_code == 400
+
+
+def test_deps_flags(whispy):
+    items = whispy._parse_prefetch_request({
+        "packages": ["a", {"name": "b", "deps": False}, {"name": "c==1.0", "version": ""}],
+        "tags": TAGS,
+        "deps": True,
+    })
+    assert [(item["name"], item["version"], item["deps"]) for item in items] == [
+        ("a", None, True), ("b", None, False), ("c", "1.0", True),
+    ]
+
+
+def _insert_item(whispy, worker, status="queued"):
+    job = uuid.uuid4().hex
+    whispy._catalog().execute(
+        "INSERT INTO prefetch_items (job, idx, created, name, version, tags, deps, status, worker) "
+        "VALUES (?, 0, ?, 'demo', NULL, 'py3-none-any', 0, ?, ?)",
+        (job, time.time(), status, worker),
+    )
+    return job
+
+
+def test_items_of_stopped_workers_are_failed(whispy):
+    if whispy.fcntl is None:
+        pytest.skip("worker liveness needs fcntl")
+    gone = _insert_item(whispy, uuid.uuid4().hex)
+    running = _insert_item(whispy, uuid.uuid4().hex, status="running")
+    legacy = _insert_item(whispy, None)
+    live = _insert_item(whispy, whispy._prefetch_worker_id())
+
+    whispy._fail_orphaned_prefetch_items()
+    for job in (gone, running, legacy):
+        status = whispy.prefetch_status(job)
+        assert status["status"] == "done"
+        assert status["items"][0]["status"] == "error"
+        assert "restarted" in status["items"][0]["error"]
+    assert whispy.prefetch_status(live)["items"][0]["status"] == "queued"
+    whispy._catalog().execute("DELETE FROM prefetch_items WHERE job = ?", (live,))
+
+
+def test_import_has_no_filesystem_side_effects(tmp_path):
+    env = dict(os.environ, WHISPY_CACHE_DIR="cache")
+    result = subprocess.run(
+        [sys.executable, "-c", "import sys; sys.path.insert(0, sys.argv[1]); import app", str(SERVER_DIR)],
+        cwd=tmp_path, env=env, capture_output=True, text=True, timeout=60,
+    )
+    assert result.returncode == 0, result.stderr
+    assert list(tmp_path.iterdir()) == []
@@ -0,0 +1,54 @@
+import json
+
+import pytest
+
+
+def _page(versions, files):
+    body = {"name": "demo", "versions": versions, "files": [
+        {"filename": filename, "yanked": yanked} for filename, yanked in files
+    ]}
+    return json.dumps(body).encode()
+
+
+def _wheels(*versions, yanked=()):
+    return [(f"demo-{v}-py3-none-any.whl", v in yanked) for v in versions]
+
+
+@pytest.mark.parametrize("versions, expected", [
+    (["1.0", "1.10", "1.9"], "1.10"),
+    (["2.0rc1", "2.0", "2.0.post1"], "2.0.post1"),
+    (["1.0", "1.1a1", "1.1b2", "1.1rc1"], "1.0"),
+    (["1.1a1", "1.1a10", "1.1a2"], "1.1a10"),
+    (["1.1.dev1", "1.0"], "1.0"),
+    (["1!0.5", "2.0"], "1!0.5"),
+    (["2.0", "1.0"], "2.0"),
+])
+def test_latest_follows_pep440(whispy, versions, expected):
+    page = _page(versions, _wheels(*versions))
+    assert whispy._simple_index_latest("application/vnd.pypi.simple.v1+json", page) == expected
+
+
+def test_yanked_and_unparsable_versions_are_skipped(whispy):
+    versions = ["1.0", "2.0", "3.0", "not-a-version"]
+    files = _wheels("1.0", "2.0", "3.0", yanked={"3.0"}) + [("demo-not_a_version.tar.gz", False)]
+    # 2.0 has one yanked file and one that is not, so it is still available.
+    files.append(("demo-2.0.tar.gz", True))
+    page = _page(versions, files)
+    assert whispy._simple_index_latest("application/vnd.pypi.simple.v1+json", page) == "2.0"
+
+
+def test_version_spelled_differently_in_filenames(whispy):
+    page = _page(["1.0.0", "1.1"], [("demo-1.0.tar.gz", False), ("demo-1.1.tar.gz", True)])
+    assert whispy._simple_index_latest("application/vnd.pypi.simple.v1+json", page) == "1.0.0"
+
+
+def test_nothing_available(whispy):
+    page = _page(["1.0"], _wheels("1.0", yanked={"1.0"}))
+    assert whispy._simple_index_latest("application/vnd.pypi.simple.v1+json", page) is None
+    assert whispy._simple_index_latest("text/html", b"<html></html>") is None
+
+
+def test_latest_version_prefers_finals(whispy):
+    assert whispy._latest_version(["1.0", "2.0b1", "junk"]) == "1.0"
+    assert whispy._latest_version(["2.0b1", "2.0a3"]) == "2.0b1"
+    assert whispy._latest_version(["junk"]) is None